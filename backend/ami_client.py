@@ -5,6 +5,7 @@ Handles connection and communication with Asterisk
 import asyncio
 import logging
 import os
+import time
 from typing import Optional, Dict, Any
 from datetime import datetime
 from panoramisk import Manager
@@ -12,8 +13,33 @@ from panoramisk import Manager
 logger = logging.getLogger(__name__)
 
 # Database import for CDR
-from database import SessionLocal, CDR
+from database import AsyncSessionLocal, CDR
 from mqtt_client import mqtt_publisher
+import metrics
+from ami_pool import AMIActionPool, AMI_ACTION_CONNECTIONS
+import callerid_index
+
+# Set CALLERID(name) of inbound calls from the address book before the phones ring
+CALLERID_SET_NAME = os.getenv("CALLERID_SET_NAME", "true").strip().lower() in ("1", "true", "yes")
+INBOUND_CONTEXT = "from-trunk"
+
+
+def _is_unnamed(name: str, number: str) -> bool:
+    return not name or name == number or name.lower() in ("unknown", "<unknown>")
+
+
+class TimedManager(Manager):
+    """panoramisk Manager that records the round-trip time of every action,
+    on the event connection as well as on the action pool connections."""
+
+    def send_action(self, action, as_list=None, **kwargs):
+        name = action.get('Action', 'Unknown')
+        start = time.perf_counter()
+        future = super().send_action(action, as_list=as_list, **kwargs)
+        future.add_done_callback(
+            lambda _: metrics.AMI_ACTION_SECONDS.observe(time.perf_counter() - start, action=name)
+        )
+        return future
 
 
 class AsteriskAMIClient:
@@ -24,8 +50,11 @@ class AsteriskAMIClient:
         self.password = os.getenv("ASTERISK_PASSWORD", "admin_secret")
         
         self.manager: Optional[Manager] = None
+        self.action_pool: Optional[AMIActionPool] = None
         self.connected = False
         self.broadcast_callback = None
+        self.connect_callback = None
+        self.recorder = None
         
         # Track active calls - key is Linkedid (unique per call)
         self.active_calls: Dict[str, Dict[str, Any]] = {}
@@ -36,12 +65,20 @@ class AsteriskAMIClient:
         """Set callback function for broadcasting events"""
         self.broadcast_callback = callback
 
+    def set_connect_callback(self, callback):
+        """Set coroutine function to run after each successful (re-)connect"""
+        self.connect_callback = callback
+
+    def set_recorder(self, recorder):
+        """Record every incoming event (see ami_recorder)"""
+        self.recorder = recorder
+
     async def connect(self):
         """Connect to Asterisk AMI"""
         try:
             logger.info(f"Connecting to Asterisk AMI at {self.host}:{self.port}...")
             
-            self.manager = Manager(
+            self.manager = TimedManager(
                 host=self.host,
                 port=self.port,
                 username=self.username,
@@ -58,6 +95,14 @@ class AsteriskAMIClient:
             # Register event handlers
             self.manager.register_event('*', self.handle_event)
 
+            # Actions run on separate connections without events (see ami_pool)
+            if self.action_pool is None and AMI_ACTION_CONNECTIONS > 0:
+                self.action_pool = AMIActionPool(self._new_action_manager)
+                self.action_pool.start()
+
+            if self.connect_callback:
+                asyncio.create_task(self.connect_callback())
+
             # Keep connection alive
             while self.connected:
                 await asyncio.sleep(1)
@@ -70,8 +115,22 @@ class AsteriskAMIClient:
             await asyncio.sleep(5)
             await self.connect()
 
+    def _new_action_manager(self) -> Manager:
+        return TimedManager(
+            host=self.host,
+            port=self.port,
+            username=self.username,
+            secret=self.password,
+            events='off',
+            ping_delay=10,
+            ping_attempts=3
+        )
+
     async def disconnect(self):
         """Disconnect from Asterisk AMI"""
+        if self.action_pool:
+            self.action_pool.close()
+            self.action_pool = None
         if self.manager:
             self.manager.close() if self.manager else None
             self.connected = False
@@ -79,10 +138,15 @@ class AsteriskAMIClient:
 
     async def handle_event(self, manager, event):
         """Handle all Asterisk events"""
+        if self.recorder:
+            self.recorder.record(event)
         event_name = event.get('Event', 'Unknown')
+        metrics.AMI_EVENTS.inc(event=event_name)
         
         # Track call events
-        if event_name == 'DialBegin':
+        if event_name == 'Newchannel':
+            self.handle_new_channel(event)
+        elif event_name == 'DialBegin':
             await self.handle_dial_begin(event)
         elif event_name == 'DialEnd':
             await self.handle_dial_end(event)
@@ -114,6 +178,24 @@ class AsteriskAMIClient:
                     'active_calls': list(self.active_calls.values())
                 })
 
+    def handle_new_channel(self, event):
+        """Name inbound callers from the address book. Inbound calls are answered
+        and wait 0.5 s before Dial/Queue, so the Setvar lands before the phones ring."""
+        if not CALLERID_SET_NAME or event.get('Context') != INBOUND_CONTEXT:
+            return
+        number = event.get('CallerIDNum', '')
+        if not _is_unnamed(event.get('CallerIDName', ''), number):
+            return
+        contact = callerid_index.index.lookup(number)
+        if contact:
+            asyncio.create_task(self._set_caller_name(event.get('Channel', ''), contact['display_name']))
+
+    async def _set_caller_name(self, channel: str, name: str):
+        try:
+            await self.send_action('Setvar', Channel=channel, Variable='CALLERID(name)', Value=name)
+        except Exception as e:
+            logger.debug(f"Setting caller name on {channel} failed: {e}")
+
     async def handle_dial_begin(self, event):
         """Handle dial begin - this is when a call starts"""
         linkedid = event.get('Linkedid', '')
@@ -123,6 +205,10 @@ class AsteriskAMIClient:
         dest_name = event.get('DestCallerIDName', '')
         channel = event.get('Channel', '')
         dest_channel = event.get('DestChannel', '')
+        # The callee's own address book wins over the global one
+        contact = callerid_index.index.lookup(caller, extension=destination)
+        if contact and _is_unnamed(caller_name, caller):
+            caller_name = contact['display_name']
         
         if linkedid:
             self.active_calls[linkedid] = {
@@ -133,6 +219,7 @@ class AsteriskAMIClient:
                 'caller_name': caller_name,
                 'destination': destination,
                 'dest_name': dest_name,
+                'caller_contact': contact,
                 'state': 'ringing',
                 'start_time': datetime.utcnow(),
                 'answer_time': None
@@ -196,39 +283,41 @@ class AsteriskAMIClient:
 
     async def save_cdr(self, call: dict, duration: int, billsec: int, disposition: str, uniqueid: str):
         """Save call detail record to database"""
-        db = SessionLocal()
+        start = time.perf_counter()
         try:
-            cdr = CDR(
-                call_date=call.get('start_time', datetime.utcnow()),
-                clid=f'"{call.get("caller_name", "")}" <{call.get("caller", "")}>',
-                src=call.get('caller', ''),
-                dst=call.get('destination', ''),
-                dcontext='internal',
-                channel=call.get('channel', ''),
-                dstchannel=call.get('dest_channel', ''),
-                lastapp='Dial',
-                lastdata=call.get('destination', ''),
-                duration=duration,
-                billsec=billsec,
-                disposition=disposition,
-                amaflags=3,
-                uniqueid=uniqueid,
-                userfield=''
-            )
-            db.add(cdr)
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            raise e
+            async with AsyncSessionLocal() as db:
+                cdr = CDR(
+                    call_date=call.get('start_time', datetime.utcnow()),
+                    clid=f'"{call.get("caller_name", "")}" <{call.get("caller", "")}>',
+                    src=call.get('caller', ''),
+                    dst=call.get('destination', ''),
+                    dcontext='internal',
+                    channel=call.get('channel', ''),
+                    dstchannel=call.get('dest_channel', ''),
+                    lastapp='Dial',
+                    lastdata=call.get('destination', ''),
+                    duration=duration,
+                    billsec=billsec,
+                    disposition=disposition,
+                    amaflags=3,
+                    uniqueid=uniqueid,
+                    userfield=''
+                )
+                db.add(cdr)
+                await db.commit()
         finally:
-            db.close()
+            metrics.CDR_WRITE_SECONDS.observe(time.perf_counter() - start)
 
     async def send_action(self, action: str, **kwargs) -> Dict[str, Any]:
-        """Send an action to Asterisk and wait for response"""
+        """Send an action to Asterisk and wait for response.
+        Goes through the action pool; the event connection is only used while
+        no action connection is logged in."""
         if not self.connected or not self.manager:
             raise Exception("Not connected to Asterisk")
         
         try:
+            if self.action_pool:
+                return await self.action_pool.send_action({'Action': action, **kwargs}, fallback=self.manager)
             response = await self.manager.send_action({
                 'Action': action,
                 **kwargs
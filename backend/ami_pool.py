@@ -0,0 +1,172 @@
+"""
+AMI Action Connection Pool
+Request/response actions (PJSIPShow*, Command, DB*, Originate) run over dedicated
+AMI connections that log in with `Events: off`, so their responses never queue
+behind the event firehose of the main (event-only) connection.
+
+- AMI_ACTION_CONNECTIONS connections, the least busy one is picked per action
+- AMI_ACTION_CONCURRENCY limits actions in flight across the pool
+- per-action timeouts (ACTION_TIMEOUTS, default AMI_ACTION_TIMEOUT)
+- circuit breaker: after AMI_BREAKER_FAILURES consecutive timeouts/connection
+  errors, actions fail fast with CircuitOpenError for AMI_BREAKER_RESET seconds,
+  then a single trial action decides whether the circuit closes again
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+AMI_ACTION_CONNECTIONS = int(os.getenv("AMI_ACTION_CONNECTIONS", "2"))
+AMI_ACTION_CONCURRENCY = int(os.getenv("AMI_ACTION_CONCURRENCY", "16"))
+AMI_ACTION_TIMEOUT = float(os.getenv("AMI_ACTION_TIMEOUT", "5"))
+AMI_BREAKER_FAILURES = int(os.getenv("AMI_BREAKER_FAILURES", "5"))
+AMI_BREAKER_RESET = float(os.getenv("AMI_BREAKER_RESET", "30"))
+
+# Actions that legitimately take longer than the default timeout
+ACTION_TIMEOUTS = {
+    "Originate": 30.0,
+    "Command": 10.0,
+    "PJSIPShowEndpoints": 10.0,
+    "DBDelTree": 10.0,
+}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = AMI_BREAKER_FAILURES, reset_timeout: float = AMI_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._trial_running = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("AMI action circuit closed")
+        self.failures = 0
+        self.state = "closed"
+        self._trial_running = False
+        metrics.AMI_CIRCUIT_OPEN.set(0)
+
+    def release_trial(self):
+        """Give back the trial slot of a trial that ended without a verdict (cancelled, unrelated error)."""
+        if self.state == "half_open":
+            self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.error(f"AMI action circuit opened after {self.failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            metrics.AMI_CIRCUIT_OPEN.set(1)
+
+
+class AMIActionPool:
+    def __init__(self, manager_factory, size: int = AMI_ACTION_CONNECTIONS,
+                 max_concurrency: int = AMI_ACTION_CONCURRENCY):
+        """manager_factory() returns a new, unconnected panoramisk Manager with events off."""
+        self.manager_factory = manager_factory
+        self.size = size
+        self.breaker = CircuitBreaker()
+        self._managers: List = []
+        self._inflight: Dict[int, int] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._connect_tasks: List[asyncio.Task] = []
+        self._closed = False
+
+    def start(self):
+        """Open the action connections in the background (retrying until they succeed)."""
+        if self._connect_tasks:
+            return
+        self._connect_tasks = [asyncio.create_task(self._connect_one()) for _ in range(self.size)]
+
+    async def _connect_one(self):
+        while not self._closed:
+            manager = self.manager_factory()
+            try:
+                await manager.connect()
+                self._managers.append(manager)
+                self._inflight[id(manager)] = 0
+                logger.info(f"AMI action connection {len(self._managers)}/{self.size} established")
+                return
+            except Exception as e:
+                logger.warning(f"AMI action connection failed: {e}, retrying in 5s")
+                await asyncio.sleep(5)
+
+    def close(self):
+        self._closed = True
+        for task in self._connect_tasks:
+            task.cancel()
+        for manager in self._managers:
+            manager.close()
+        self._managers = []
+        self._connect_tasks = []
+
+    @property
+    def available(self) -> bool:
+        return any(m.authenticated for m in self._managers)
+
+    def _pick(self):
+        ready = [m for m in self._managers if m.authenticated]
+        if not ready:
+            return None
+        return min(ready, key=lambda m: self._inflight.get(id(m), 0))
+
+    async def send_action(self, action: dict, fallback=None, timeout: Optional[float] = None):
+        """Send an action over the least busy action connection.
+        fallback is used when no action connection is logged in (e.g. pool size 0)."""
+        name = action.get("Action", "")
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"AMI action circuit open, {name} rejected")
+        trial = self.breaker.state == "half_open"
+        timeout = timeout or ACTION_TIMEOUTS.get(name, AMI_ACTION_TIMEOUT)
+        try:
+            async with self._semaphore:
+                manager = self._pick() or fallback
+                if manager is None:
+                    self.breaker.record_failure()
+                    raise ConnectionError("No AMI connection available")
+                key = id(manager)
+                self._inflight[key] = self._inflight.get(key, 0) + 1
+                metrics.AMI_ACTIONS_INFLIGHT.inc()
+                try:
+                    response = await asyncio.wait_for(manager.send_action(action), timeout)
+                except asyncio.TimeoutError:
+                    metrics.AMI_ACTION_TIMEOUTS.inc(action=name)
+                    self.breaker.record_failure()
+                    raise TimeoutError(f"AMI action {name} timed out after {timeout:g}s")
+                except (ConnectionError, OSError, AttributeError):
+                    # AttributeError: panoramisk without a live protocol/transport
+                    self.breaker.record_failure()
+                    raise
+                finally:
+                    self._inflight[key] -= 1
+                    metrics.AMI_ACTIONS_INFLIGHT.dec()
+            self.breaker.record_success()
+            return response
+        finally:
+            # Cancelled or failed otherwise: without a verdict the next action gets to be the trial
+            if trial:
+                self.breaker.release_trial()
@@ -0,0 +1,137 @@
+"""
+AMI Event Recorder
+Optional (AMI_RECORD_PATH) append-only recording of every raw AMI event, for
+debugging active call tracking offline and replaying captured traffic
+(see bench/ami_replay.py).
+
+File format, one JSON document per line:
+  {"v": 1, "started": "<iso time>", "offset": <seconds>}   header of each file
+  [<seconds since recording start>, {<event fields>}]      one line per event
+Offsets come from the monotonic clock and continue across rotated files.
+Files rotate at AMI_RECORD_MAX_MB: events.jsonl -> events.jsonl.1 -> ... up to
+AMI_RECORD_FILES files. Writes are buffered and flushed once per second.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AMI_RECORD_PATH = os.getenv("AMI_RECORD_PATH", "")
+AMI_RECORD_MAX_BYTES = int(float(os.getenv("AMI_RECORD_MAX_MB", "50")) * 1024 * 1024)
+AMI_RECORD_FILES = int(os.getenv("AMI_RECORD_FILES", "5"))
+FLUSH_INTERVAL = 1.0
+
+
+class AMIRecorder:
+    def __init__(self, path: str, max_bytes: int = AMI_RECORD_MAX_BYTES, max_files: int = AMI_RECORD_FILES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_files = max(1, max_files)
+        self.events = 0
+        self._start = time.monotonic()
+        self._file = None
+        self._size = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8", buffering=64 * 1024)
+        self._size = self._file.tell()
+        self._write(json.dumps({"v": 1, "started": datetime.utcnow().isoformat(),
+                                "offset": round(time.monotonic() - self._start, 6)}))
+
+    def _write(self, line: str):
+        self._file.write(line + "\n")
+        self._size += len(line) + 1
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.max_files - 1, 0, -1):
+            src = self.path if i == 1 else f"{self.path}.{i - 1}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i}")
+        if self.max_files == 1:
+            os.remove(self.path)
+        self._open()
+
+    def record(self, event):
+        """Append one event (a panoramisk Message or dict)."""
+        fields = {k: v for k, v in event.items() if not (k == "content" and not v)}
+        self._write(json.dumps([round(time.monotonic() - self._start, 6), fields], separators=(",", ":")))
+        self.events += 1
+        if self._size >= self.max_bytes:
+            try:
+                self._rotate()
+            except OSError as e:
+                logger.error(f"AMI recording rotation failed: {e}")
+
+    def start_flushing(self):
+        """Flush the write buffer once per second from the running loop."""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        if self._file and not self._file.closed:
+            self._file.flush()
+
+    def close(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+        if self._file and not self._file.closed:
+            self._file.close()
+        logger.info(f"AMI recording closed after {self.events} events")
+
+
+def create_from_env() -> Optional[AMIRecorder]:
+    """Recorder for AMI_RECORD_PATH, or None when recording is off."""
+    if not AMI_RECORD_PATH:
+        return None
+    try:
+        recorder = AMIRecorder(AMI_RECORD_PATH)
+    except OSError as e:
+        logger.error(f"AMI recording disabled, cannot open {AMI_RECORD_PATH}: {e}")
+        return None
+    logger.warning(f"Recording all AMI events to {AMI_RECORD_PATH} "
+                   f"({AMI_RECORD_MAX_BYTES // (1024 * 1024)} MB x {AMI_RECORD_FILES} files)")
+    return recorder
+
+
+def recording_files(path: str) -> List[str]:
+    """The files of a (rotated) recording, oldest first."""
+    files = []
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        files.append(f"{path}.{i}")
+        i += 1
+    files.reverse()
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_recording(path: str) -> Iterator[Tuple[float, dict]]:
+    """Yield (offset_seconds, event_fields) from all files of a recording, in order."""
+    for file_path in recording_files(path):
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Truncated last line of a file that was still being written
+                    continue
+                if isinstance(entry, list) and len(entry) == 2:
+                    yield entry[0], entry[1]
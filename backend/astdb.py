@@ -0,0 +1,136 @@
+"""
+AstDB Sync
+Keeps call forwarding and ring timeouts in Asterisk's internal database (AstDB)
+so the dialplan reads them at runtime instead of being regenerated and reloaded
+on every change.
+
+Layout:
+  CF/<extension>/unconditional        -> forward destination
+  CF/<extension>/busy                 -> forward destination
+  CF/<extension>/no_answer            -> forward destination
+  CF/<extension>/no_answer_ring_time  -> seconds before no-answer forward
+  RINGTIMEOUT/<extension>             -> seconds before voicemail
+"""
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from anyio import from_thread
+
+from sqlalchemy import select
+
+from database import AsyncSessionLocal, CallForward, VoicemailMailbox
+
+logger = logging.getLogger(__name__)
+
+CF_FAMILY = "CF"
+RING_TIMEOUT_FAMILY = "RINGTIMEOUT"
+FORWARD_TYPES = ("unconditional", "busy", "no_answer")
+DEFAULT_RING_TIMEOUT = 20
+
+# Reference to AMI client (set from main.py)
+ami_client = None
+
+
+def set_ami_client(client):
+    global ami_client
+    ami_client = client
+
+
+async def db_put(family: str, key: str, value) -> bool:
+    """Write a single AstDB value via AMI DBPut."""
+    if not ami_client or not ami_client.connected:
+        logger.warning(f"AstDB put {family}/{key} skipped: AMI not connected")
+        return False
+    try:
+        response = await ami_client.send_action("DBPut", Family=family, Key=key, Val=str(value))
+        return bool(getattr(response, "success", True))
+    except Exception as e:
+        logger.error(f"AstDB put {family}/{key} failed: {e}")
+        return False
+
+
+async def db_del(family: str, key: str) -> bool:
+    """Delete a single AstDB value via AMI DBDel. Missing keys are not an error."""
+    if not ami_client or not ami_client.connected:
+        logger.warning(f"AstDB del {family}/{key} skipped: AMI not connected")
+        return False
+    try:
+        await ami_client.send_action("DBDel", Family=family, Key=key)
+        return True
+    except Exception as e:
+        logger.error(f"AstDB del {family}/{key} failed: {e}")
+        return False
+
+
+async def sync_call_forwards(extension: str, forwards: List[CallForward]) -> bool:
+    """Publish the enabled forwards of one extension, removing all others."""
+    family = f"{CF_FAMILY}/{extension}"
+    by_type = {f.forward_type: f for f in forwards if f.enabled}
+    ok = True
+    for ftype in FORWARD_TYPES:
+        fwd = by_type.get(ftype)
+        if fwd:
+            ok = await db_put(family, ftype, fwd.destination) and ok
+        else:
+            ok = await db_del(family, ftype) and ok
+    cfna = by_type.get("no_answer")
+    if cfna:
+        ok = await db_put(family, "no_answer_ring_time", cfna.ring_time or DEFAULT_RING_TIMEOUT) and ok
+    else:
+        ok = await db_del(family, "no_answer_ring_time") and ok
+    return ok
+
+
+async def sync_ring_timeout(extension: str, ring_timeout: Optional[int]) -> bool:
+    """Publish the ring timeout of one extension."""
+    return await db_put(RING_TIMEOUT_FAMILY, extension, ring_timeout or DEFAULT_RING_TIMEOUT)
+
+
+async def sync_ring_timeouts(timeouts: List[Tuple[str, Optional[int]]]) -> bool:
+    """Publish the ring timeouts of many extensions at once (bulk provisioning)."""
+    results = await asyncio.gather(*(sync_ring_timeout(ext, ring_timeout) for ext, ring_timeout in timeouts))
+    return all(results)
+
+
+async def remove_extension(extension: str) -> bool:
+    """Remove all AstDB keys of a deleted extension."""
+    ok = await sync_call_forwards(extension, [])
+    ok = await db_del(RING_TIMEOUT_FAMILY, extension) and ok
+    return ok
+
+
+async def sync_all_from_db() -> bool:
+    """Replace the CF and RINGTIMEOUT families with the current database state.
+    Called whenever the AMI connection is (re-)established."""
+    if not ami_client or not ami_client.connected:
+        return False
+    async with AsyncSessionLocal() as db:
+        forwards = (await db.execute(select(CallForward).where(CallForward.enabled == True))).scalars().all()
+        mailboxes = (await db.execute(select(VoicemailMailbox))).scalars().all()
+
+    for family in (CF_FAMILY, RING_TIMEOUT_FAMILY):
+        try:
+            await ami_client.send_action("DBDelTree", Family=family)
+        except Exception as e:
+            logger.warning(f"AstDB deltree {family} failed: {e}")
+
+    ok = True
+    for fwd in forwards:
+        ok = await db_put(f"{CF_FAMILY}/{fwd.extension}", fwd.forward_type, fwd.destination) and ok
+        if fwd.forward_type == "no_answer":
+            ok = await db_put(f"{CF_FAMILY}/{fwd.extension}", "no_answer_ring_time",
+                              fwd.ring_time or DEFAULT_RING_TIMEOUT) and ok
+    for mb in mailboxes:
+        ok = await sync_ring_timeout(mb.extension, mb.ring_timeout) and ok
+    logger.info(f"AstDB synced: {len(forwards)} call forwards, {len(mailboxes)} ring timeouts")
+    return ok
+
+
+def run_sync(func, *args) -> bool:
+    """Run one of the async sync helpers from a sync (threadpool) route handler."""
+    try:
+        return from_thread.run(func, *args)
+    except Exception as e:
+        logger.error(f"AstDB sync failed: {e}")
+        return False
@@ -0,0 +1,5 @@
+"""
+Benchmark tooling: fake AMI server, REST/WebSocket load driver and the
+benchmark suite combining both, AMI replay and a HEP (SIP capture) sender. Run from the backend directory, e.g.
+`python -m bench.suite --help`. Extra dependencies: bench/requirements.txt.
+"""
@@ -0,0 +1,106 @@
+"""
+AMI Replay
+Feeds an ami_recorder recording back into AsteriskAMIClient.handle_event, either at
+the recorded pace (--speed 1, 2, ...) or as fast as possible (--speed 0, the default).
+No Asterisk connection is made.
+
+  python -m bench.ami_replay /var/log/gonopbx/ami-events.jsonl --no-cdr --dump-state state.json
+
+Reports handled events/sec and per-event handler latency. --dump-state writes
+active_calls after the last event, so two runs (before/after a change) can be
+diffed as a regression check. Without --no-cdr, CDRs go to DATABASE_URL.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from panoramisk.message import Message
+
+from ami_client import AsteriskAMIClient
+from ami_recorder import read_recording
+from bench.load import LatencyStats
+
+TIME_FIELDS = ("start_time", "answer_time")
+
+
+async def replay(path: str, speed: float = 0.0, write_cdr: bool = True, limit: int = 0) -> dict:
+    client = AsteriskAMIClient()
+    broadcasts = 0
+    cdrs = 0
+
+    async def count_broadcast(message: dict):
+        nonlocal broadcasts
+        broadcasts += 1
+
+    client.set_broadcast_callback(count_broadcast)
+    save_cdr = client.save_cdr
+
+    async def count_cdr(*args, **kwargs):
+        nonlocal cdrs
+        cdrs += 1
+        if write_cdr:
+            await save_cdr(*args, **kwargs)
+
+    client.save_cdr = count_cdr
+
+    handler = LatencyStats()
+    events = 0
+    first_offset = None
+    start = time.monotonic()
+    for offset, fields in read_recording(path):
+        if first_offset is None:
+            first_offset = offset
+        if speed > 0:
+            delay = start + (offset - first_offset) / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        t0 = time.perf_counter()
+        try:
+            await client.handle_event(None, Message(fields))
+        except Exception as e:
+            handler.errors += 1
+            logging.error(f"Event {events} ({fields.get('Event')}) failed: {e}")
+        handler.add((time.perf_counter() - t0) * 1000)
+        events += 1
+        if limit and events >= limit:
+            break
+    elapsed = time.monotonic() - start
+
+    return {
+        "events": events,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(events / elapsed, 1) if elapsed else 0.0,
+        "handler_latency": handler.summary(),
+        "broadcasts": broadcasts,
+        "cdrs": cdrs,
+        "cdrs_written": write_cdr,
+        "active_calls": client.active_calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded AMI event stream into the AMI client")
+    parser.add_argument("recording", help="path of the recording (rotated files are picked up)")
+    parser.add_argument("--speed", type=float, default=0.0, help="0 = as fast as possible, 1 = real time")
+    parser.add_argument("--no-cdr", action="store_true", help="do not write CDRs to the database")
+    parser.add_argument("--limit", type=int, default=0, help="stop after N events")
+    parser.add_argument("--dump-state", help="write the final active_calls as JSON to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    result = asyncio.run(replay(args.recording, args.speed, not args.no_cdr, args.limit))
+    active_calls = result.pop("active_calls")
+    if args.dump_state:
+        # Wall-clock fields differ on every run and are left out so dumps can be diffed
+        state = {cid: {k: v for k, v in call.items() if k not in TIME_FIELDS}
+                 for cid, call in active_calls.items()}
+        with open(args.dump_state, "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+    result["active_calls_left"] = len(active_calls)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
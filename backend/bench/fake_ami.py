@@ -0,0 +1,302 @@
+"""
+Fake AMI Server
+A local asyncio server speaking the Asterisk Manager protocol, good enough for
+panoramisk and the backend's AMI paths: Login/Logoff/Ping/Events, PJSIPShowEndpoints,
+PJSIPShowEndpoint, PJSIPShowContacts, PJSIPShowRegistrationsOutbound, Command,
+DBPut/DBDel/DBDelTree and Originate.
+
+Besides answering actions it can push events to all logged-in clients that did
+not log in with "Events: off":
+  - storm(): random DialBegin/DialEnd/Hangup call flows at N calls per second
+  - replay(): a scripted JSON-lines file, one event per line with an "at" offset
+    in seconds, e.g. {"at": 0.5, "Event": "DialBegin", "Linkedid": "1", ...}
+
+Run standalone and point the backend at it:
+  python -m bench.fake_ami --port 5038 --endpoints 50 --rate 20 --duration 60
+  ASTERISK_HOST=127.0.0.1 ASTERISK_PORT=5038 uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("fake_ami")
+
+EOL = "\r\n"
+BANNER = "Asterisk Call Manager/5.0.1" + EOL
+LIST_ACTIONS = {
+    "pjsipshowendpoints": ("EndpointList", "EndpointListComplete"),
+    "pjsipshowendpoint": ("EndpointDetail", "EndpointDetailComplete"),
+    "pjsipshowcontacts": ("ContactList", "ContactListComplete"),
+    "pjsipshowregistrationsoutbound": ("OutboundRegistrationDetail", "OutboundRegistrationDetailComplete"),
+}
+SIMPLE_ACTIONS = {"events", "dbput", "dbdel", "dbdeltree", "originate", "userevent", "setvar"}
+
+
+def encode(message: Dict[str, object]) -> bytes:
+    lines = []
+    for key, value in message.items():
+        if isinstance(value, (list, tuple)):
+            lines.extend(f"{key}: {v}" for v in value)
+        else:
+            lines.append(f"{key}: {value}")
+    return (EOL.join(lines) + EOL + EOL).encode()
+
+
+def parse(block: str) -> Dict[str, str]:
+    message = {}
+    for line in block.split(EOL):
+        if ": " in line:
+            key, value = line.split(": ", 1)
+            message[key.strip()] = value.strip()
+    return message
+
+
+class FakeAMIServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 5038, endpoints: int = 20,
+                 username: Optional[str] = None, secret: Optional[str] = None,
+                 command_output: Optional[Dict[str, List[str]]] = None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.secret = secret
+        self.endpoints = [str(1000 + i) for i in range(endpoints)]
+        self.command_output = command_output or {}
+        self.clients: set = set()
+        self.event_clients: set = set()
+        self.actions_handled = 0
+        self.events_sent = 0
+        self.astdb: Dict[str, str] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Fake AMI listening on {self.host}:{self.port} with {len(self.endpoints)} endpoints")
+
+    async def stop(self):
+        for writer in list(self.clients):
+            writer.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def wait_for_client(self, timeout: float = 30) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.event_clients:
+            if time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    # ==================== Protocol ====================
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(BANNER.encode())
+        buffer = ""
+        authenticated = False
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data.decode(errors="ignore")
+                while EOL + EOL in buffer:
+                    block, buffer = buffer.split(EOL + EOL, 1)
+                    action = parse(block)
+                    if not action.get("Action"):
+                        continue
+                    name = action["Action"].lower()
+                    if name == "login":
+                        authenticated = self._check_login(action)
+                        writer.write(encode(self._response(action, authenticated,
+                                     "Authentication accepted" if authenticated else "Authentication failed")))
+                        if authenticated:
+                            self.clients.add(writer)
+                            if action.get("Events", "on").lower() != "off":
+                                self.event_clients.add(writer)
+                        continue
+                    if not authenticated:
+                        writer.write(encode(self._response(action, False, "Permission denied")))
+                        continue
+                    if name == "logoff":
+                        writer.write(encode(self._response(action, True, "Thanks for all the fish.")))
+                        break
+                    for message in self._respond(name, action):
+                        writer.write(encode(message))
+                    self.actions_handled += 1
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            self.event_clients.discard(writer)
+            writer.close()
+
+    def _check_login(self, action: Dict[str, str]) -> bool:
+        if self.username is None:
+            return True
+        return action.get("Username") == self.username and action.get("Secret") == self.secret
+
+    @staticmethod
+    def _response(action: Dict[str, str], success: bool, text: str = "", **fields) -> Dict[str, object]:
+        message = {"Response": "Success" if success else "Error", "ActionID": action.get("ActionID", "")}
+        if text:
+            message["Message"] = text
+        message.update(fields)
+        return message
+
+    def _respond(self, name: str, action: Dict[str, str]) -> List[Dict[str, object]]:
+        action_id = action.get("ActionID", "")
+        if name == "ping":
+            return [self._response(action, True, Ping="Pong", Timestamp=f"{time.time():.6f}")]
+        if name == "command":
+            return [self._response(action, True, "Command output follows",
+                                   Output=self._command(action.get("Command", "")))]
+        if name in LIST_ACTIONS:
+            event_name, complete_name = LIST_ACTIONS[name]
+            items = self._list_items(name, action)
+            messages = [self._response(action, True, "Following list will follow", EventList="start")]
+            messages += [{"Event": event_name, "ActionID": action_id, **item} for item in items]
+            messages.append({"Event": complete_name, "ActionID": action_id,
+                             "EventList": "Complete", "ListItems": len(items)})
+            return messages
+        if name in SIMPLE_ACTIONS:
+            if name == "dbput":
+                self.astdb[f"{action.get('Family')}/{action.get('Key')}"] = action.get("Val", "")
+            elif name == "dbdel":
+                self.astdb.pop(f"{action.get('Family')}/{action.get('Key')}", None)
+            elif name == "dbdeltree":
+                prefix = f"{action.get('Family')}/"
+                for key in [k for k in self.astdb if k.startswith(prefix)]:
+                    del self.astdb[key]
+            elif name == "originate":
+                return [self._response(action, True, "Originate successfully queued")]
+            return [self._response(action, True)]
+        return [self._response(action, False, "Invalid/unknown command")]
+
+    def _list_items(self, name: str, action: Dict[str, str]) -> List[Dict[str, object]]:
+        if name == "pjsipshowendpoints":
+            return [{"ObjectType": "endpoint", "ObjectName": ep, "Transport": "transport-udp",
+                     "Aor": ep, "Auths": f"auth{ep}", "DeviceState": "Not in use", "ActiveChannels": ""}
+                    for ep in self.endpoints]
+        endpoint = action.get("Endpoint", "")
+        if name == "pjsipshowendpoint":
+            return [{"ObjectType": "endpoint", "ObjectName": endpoint, "DeviceState": "Not in use"}]
+        if name == "pjsipshowcontacts":
+            return [{"ObjectType": "contact", "ObjectName": f"{endpoint}@sip:{endpoint}@192.0.2.10:5060",
+                     "Uri": f"sip:{endpoint}@192.0.2.10:5060", "Endpoint": endpoint, "Status": "Reachable",
+                     "RoundtripUsec": random.randint(2000, 40000)}]
+        return []
+
+    def _command(self, command: str) -> List[str]:
+        if command in self.command_output:
+            return self.command_output[command]
+        return [f"{command}: ok"]
+
+    # ==================== Events ====================
+
+    def send_event(self, event: Dict[str, object]):
+        """Push one event to every logged-in client that wants events."""
+        data = encode(event)
+        for writer in list(self.event_clients):
+            try:
+                writer.write(data)
+            except Exception:
+                self.event_clients.discard(writer)
+        self.events_sent += 1
+
+    async def _call_flow(self, linkedid: str, ring: float, talk: float, answer: bool):
+        caller, callee = random.sample(self.endpoints, 2) if len(self.endpoints) > 1 else ("1000", "1001")
+        common = {"Linkedid": linkedid, "Uniqueid": linkedid}
+        # CallerIDName carries the send time so WebSocket clients can measure broadcast latency
+        self.send_event({"Event": "DialBegin", **common, "CallerIDNum": caller,
+                         "CallerIDName": f"bench-{time.time():.6f}", "DestCallerIDNum": callee,
+                         "DestCallerIDName": callee, "Channel": f"PJSIP/{caller}-{linkedid}",
+                         "DestChannel": f"PJSIP/{callee}-{linkedid}"})
+        await asyncio.sleep(ring)
+        self.send_event({"Event": "DialEnd", **common, "DialStatus": "ANSWER" if answer else "NOANSWER"})
+        if answer:
+            await asyncio.sleep(talk)
+        self.send_event({"Event": "Hangup", **common, "Cause": "16", "Cause-txt": "Normal Clearing"})
+
+    async def storm(self, calls_per_second: float, duration: float, ring=(0.2, 2.0), talk=(0.5, 5.0),
+                    answer_ratio: float = 0.8) -> Dict[str, float]:
+        """Start calls at a fixed rate for `duration` seconds and wait until all have hung up."""
+        tasks = []
+        start = time.monotonic()
+        interval = 1 / calls_per_second
+        n = 0
+        while time.monotonic() - start < duration:
+            linkedid = f"bench-{int(start)}-{n}"
+            tasks.append(asyncio.create_task(self._call_flow(
+                linkedid, random.uniform(*ring), random.uniform(*talk), random.random() < answer_ratio)))
+            n += 1
+            await asyncio.sleep(max(0.0, start + n * interval - time.monotonic()))
+        await asyncio.gather(*tasks)
+        return {"calls": n, "events": n * 3, "seconds": round(time.monotonic() - start, 2)}
+
+    async def replay(self, path: str, speed: float = 1.0) -> int:
+        """Send the events of a JSON-lines script at their "at" offsets (scaled by speed)."""
+        with open(path) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+        events.sort(key=lambda e: e.get("at", 0))
+        start = time.monotonic()
+        for event in events:
+            delay = start + event.pop("at", 0) / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.send_event(event)
+        return len(events)
+
+
+async def _main(args):
+    server = FakeAMIServer(args.host, args.port, endpoints=args.endpoints,
+                           username=args.username, secret=args.secret)
+    await server.start()
+    try:
+        if args.script or args.rate:
+            logger.info("Waiting for an AMI client to log in...")
+            if not await server.wait_for_client(args.wait):
+                logger.error("No client connected")
+                return
+            if args.script:
+                count = await server.replay(args.script, args.speed)
+                logger.info(f"Replayed {count} events")
+            if args.rate:
+                result = await server.storm(args.rate, args.duration)
+                logger.info(f"Storm finished: {result}")
+        if args.serve:
+            await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Asterisk AMI server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5038)
+    parser.add_argument("--endpoints", type=int, default=20, help="number of fake PJSIP endpoints")
+    parser.add_argument("--username", help="require this AMI user (default: accept any login)")
+    parser.add_argument("--secret")
+    parser.add_argument("--rate", type=float, default=0, help="calls per second for a random event storm")
+    parser.add_argument("--duration", type=float, default=30, help="storm duration in seconds")
+    parser.add_argument("--script", help="JSON-lines event script to replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument("--wait", type=float, default=60, help="seconds to wait for the backend to connect")
+    parser.add_argument("--serve", action="store_true", help="keep serving after storm/replay")
+    args = parser.parse_args()
+    if not args.rate and not args.script:
+        args.serve = True
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+HEP Sender
+Sends synthetic SIP dialogs as HEPv3 datagrams over UDP, the way Asterisk's
+res_hep_pjsip does. Each call is INVITE/100/180/200/ACK/BYE/200 (7 messages);
+responses use the local address as source so they show up as "sent".
+
+Against a running backend (SIP debug enabled, SIP_CAPTURE=hep):
+  python -m bench.hep_sender --port 9060 --rate 100 --duration 10
+In-process, checking that every message reached a SIPDebugBuffer:
+  python -m bench.hep_sender --in-process --rate 200 --duration 5
+"""
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import time
+import uuid
+import zlib
+from typing import List, Optional
+
+from hep import (CHUNK_AUTH_KEY, CHUNK_CAPTURE_ID, CHUNK_COMPRESSED_PAYLOAD, CHUNK_DST_IP4, CHUNK_DST_PORT,
+                 CHUNK_IP_FAMILY, CHUNK_PAYLOAD, CHUNK_PROTOCOL, CHUNK_PROTO_TYPE, CHUNK_SRC_IP4, CHUNK_SRC_PORT,
+                 CHUNK_TS_SEC, CHUNK_TS_USEC, PROTO_TYPE_SIP)
+
+LOCAL_IP = "127.0.0.1"
+REMOTE_IP = "192.0.2.10"
+MESSAGES_PER_CALL = 7
+
+
+def _chunk(chunk_type: int, value: bytes) -> bytes:
+    return struct.pack("!HHH", 0, chunk_type, 6 + len(value)) + value
+
+
+def encode_hep3(payload: bytes, src_ip: str, src_port: int, dst_ip: str, dst_port: int,
+                timestamp: Optional[float] = None, password: str = "", compress: bool = False) -> bytes:
+    ts = time.time() if timestamp is None else timestamp
+    body = b"".join([
+        _chunk(CHUNK_IP_FAMILY, bytes([socket.AF_INET])),
+        _chunk(CHUNK_PROTOCOL, bytes([17])),
+        _chunk(CHUNK_SRC_IP4, socket.inet_aton(src_ip)),
+        _chunk(CHUNK_DST_IP4, socket.inet_aton(dst_ip)),
+        _chunk(CHUNK_SRC_PORT, struct.pack("!H", src_port)),
+        _chunk(CHUNK_DST_PORT, struct.pack("!H", dst_port)),
+        _chunk(CHUNK_TS_SEC, struct.pack("!I", int(ts))),
+        _chunk(CHUNK_TS_USEC, struct.pack("!I", int((ts % 1) * 1_000_000))),
+        _chunk(CHUNK_PROTO_TYPE, bytes([PROTO_TYPE_SIP])),
+        _chunk(CHUNK_CAPTURE_ID, struct.pack("!I", 1)),
+        _chunk(CHUNK_AUTH_KEY, password.encode()) if password else b"",
+        _chunk(CHUNK_COMPRESSED_PAYLOAD, zlib.compress(payload)) if compress else _chunk(CHUNK_PAYLOAD, payload),
+    ])
+    return struct.pack("!4sH", b"HEP3", 6 + len(body)) + body
+
+
+def call_messages(n: int, local_ip: str = LOCAL_IP, remote_ip: str = REMOTE_IP) -> List[tuple]:
+    """(sent, sip_text) for one synthetic call from 0170<n> to extension 1000."""
+    call_id = f"{uuid.uuid4()}@{remote_ip}"
+    caller = f"0170{n:07d}"
+    from_h = f'"{caller}" <sip:{caller}@{remote_ip}>;tag=f{n}'
+    to_h = "<sip:1000@" + local_ip + ">"
+    to_tagged = to_h + f";tag=t{n}"
+
+    def req(method: str, cseq: int, to: str) -> str:
+        return (f"{method} sip:1000@{local_ip}:5060 SIP/2.0\r\n"
+                f"Via: SIP/2.0/UDP {remote_ip}:5060;branch=z9hG4bK{n}{method}\r\n"
+                f"From: {from_h}\r\nTo: {to}\r\nCall-ID: {call_id}\r\nCSeq: {cseq} {method}\r\n"
+                f"Max-Forwards: 70\r\nContent-Length: 0\r\n\r\n")
+
+    def resp(code: str, cseq: int, method: str, to: str) -> str:
+        return (f"SIP/2.0 {code}\r\n"
+                f"Via: SIP/2.0/UDP {remote_ip}:5060;branch=z9hG4bK{n}{method}\r\n"
+                f"From: {from_h}\r\nTo: {to}\r\nCall-ID: {call_id}\r\nCSeq: {cseq} {method}\r\n"
+                f"Content-Length: 0\r\n\r\n")
+
+    return [
+        (False, req("INVITE", 1, to_h)),
+        (True, resp("100 Trying", 1, "INVITE", to_h)),
+        (True, resp("180 Ringing", 1, "INVITE", to_tagged)),
+        (True, resp("200 OK", 1, "INVITE", to_tagged)),
+        (False, req("ACK", 1, to_tagged)),
+        (False, req("BYE", 2, to_tagged)),
+        (True, resp("200 OK", 2, "BYE", to_tagged)),
+    ]
+
+
+def packets_for_call(n: int, password: str = "", compress: bool = False) -> List[bytes]:
+    packets = []
+    for sent, text in call_messages(n):
+        if sent:
+            src, dst = (LOCAL_IP, 5060), (REMOTE_IP, 5060)
+        else:
+            src, dst = (REMOTE_IP, 5060), (LOCAL_IP, 5060)
+        packets.append(encode_hep3(text.encode(), src[0], src[1], dst[0], dst[1],
+                                   password=password, compress=compress))
+    return packets
+
+
+async def send(host: str, port: int, rate: float, duration: float, password: str = "",
+               compress: bool = False) -> dict:
+    """Send `rate` calls per second (7 messages each) for `duration` seconds."""
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(host, port))
+    calls = 0
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < duration:
+            for packet in packets_for_call(calls, password, compress):
+                transport.sendto(packet)
+            calls += 1
+            delay = start + calls / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+    finally:
+        transport.close()
+    elapsed = time.monotonic() - start
+    return {"calls": calls, "messages": calls * MESSAGES_PER_CALL, "seconds": round(elapsed, 2),
+            "messages_per_second": round(calls * MESSAGES_PER_CALL / elapsed, 1)}
+
+
+async def run_in_process(rate: float, duration: float, compress: bool) -> dict:
+    """Listener + SIPDebugBuffer in this process, reports how many messages were stored."""
+    import hep
+    from sip_debug import SIPDebugBuffer
+
+    buffer = SIPDebugBuffer()
+    buffer.enabled = True
+    transport, protocol = await hep.start_listener(buffer._on_hep_packet, host="127.0.0.1", port=0, password="")
+    port = transport.get_extra_info("sockname")[1]
+    try:
+        result = await send("127.0.0.1", port, rate, duration, compress=compress)
+        await asyncio.sleep(0.5)
+    finally:
+        transport.close()
+    calls = buffer.get_calls()
+    sent = sum(1 for m in buffer._messages if m.direction == "sent")
+    result.update({
+        "received": protocol.received,
+        "dropped": protocol.dropped,
+        "stored": buffer.message_count,
+        "stored_bytes": buffer.total_bytes,
+        "stored_calls": len(calls),
+        "stored_sent": sent,
+        "lost": result["messages"] - protocol.received,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send synthetic SIP dialogs as HEPv3 over UDP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9060)
+    parser.add_argument("--rate", type=float, default=50, help="calls per second (7 SIP messages each)")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--password", default="", help="HEP_PASSWORD of the backend, if set")
+    parser.add_argument("--compress", action="store_true", help="send zlib-compressed payload chunks")
+    parser.add_argument("--in-process", action="store_true", help="run the listener locally and verify capture")
+    args = parser.parse_args()
+    if args.in_process:
+        result = asyncio.run(run_in_process(args.rate, args.duration, args.compress))
+    else:
+        result = asyncio.run(send(args.host, args.port, args.rate, args.duration, args.password, args.compress))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Load Driver
+Drives the REST API with concurrent workers and holds WebSocket clients on /ws.
+REST workers report latency percentiles per path. WebSocket clients measure
+broadcast latency of the fake AMI server's DialBegin events: the send time is
+carried in CallerIDName, see bench.fake_ami.
+
+  python -m bench.load --url http://127.0.0.1:8000 --user admin --password ... \
+      --path /api/dashboard/status --path /api/cdr/stats --concurrency 20 --duration 30 --ws 50
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+
+class LatencyStats:
+    def __init__(self):
+        self.values: List[float] = []
+        self.errors = 0
+
+    def add(self, ms: float):
+        self.values.append(ms)
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.values)
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 2)
+
+        return {
+            "count": len(ordered),
+            "errors": self.errors,
+            "p50_ms": pct(50),
+            "p95_ms": pct(95),
+            "p99_ms": pct(99),
+            "max_ms": round(ordered[-1], 2) if ordered else 0.0,
+        }
+
+
+async def login(base_url: str, username: str, password: str) -> str:
+    async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+        response = await client.post("/api/auth/login", json={"username": username, "password": password})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+
+async def rest_load(base_url: str, token: str, paths: List[str], concurrency: int, duration: float) -> dict:
+    """Hit the paths round-robin from `concurrency` workers for `duration` seconds."""
+    stats = {path: LatencyStats() for path in paths}
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits,
+                                 headers={"Authorization": f"Bearer {token}"}) as client:
+        async def worker(offset: int):
+            i = offset
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        stats[path].errors += 1
+                        continue
+                except httpx.HTTPError:
+                    stats[path].errors += 1
+                    continue
+                stats[path].add((time.perf_counter() - start) * 1000)
+
+        start = time.monotonic()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.monotonic() - start
+
+    total = sum(len(s.values) for s in stats.values())
+    return {
+        "requests": total,
+        "requests_per_second": round(total / elapsed, 1) if elapsed else 0.0,
+        "paths": {path: s.summary() for path, s in stats.items()},
+    }
+
+
+class WebSocketClients:
+    """Keeps n /ws connections open and records DialBegin broadcast latency."""
+
+    def __init__(self, ws_url: str, token: str, count: int):
+        self.url = f"{ws_url}?token={token}"
+        self.count = count
+        self.latency = LatencyStats()
+        self.messages = 0
+        self.connected = 0
+        self._tasks: List[asyncio.Task] = []
+        self._stop = asyncio.Event()
+
+    async def start(self, timeout: float = 10):
+        self._tasks = [asyncio.create_task(self._client()) for _ in range(self.count)]
+        deadline = time.monotonic() + timeout
+        while self.connected < self.count and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def stop(self):
+        self._stop.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _client(self):
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                self.connected += 1
+                while not self._stop.is_set():
+                    raw = await ws.recv()
+                    received = time.time()
+                    self.messages += 1
+                    self._measure(raw, received)
+        except (websockets.ConnectionClosed, OSError):
+            self.latency.errors += 1
+
+    def _measure(self, raw, received: float):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+        if message.get("type") != "ami_event" or message.get("event_name") != "DialBegin":
+            return
+        # The triggering call is the newest one: AMI events are handled in order
+        sent = None
+        for call in message.get("active_calls", []):
+            name = call.get("caller_name") or ""
+            if name.startswith("bench-"):
+                try:
+                    ts = float(name[6:])
+                except ValueError:
+                    continue
+                sent = ts if sent is None else max(sent, ts)
+        if sent is not None:
+            self.latency.add((received - sent) * 1000)
+
+    def summary(self) -> dict:
+        return {"clients": self.count, "connected": self.connected, "messages": self.messages,
+                "broadcast_latency": self.latency.summary()}
+
+
+def ws_url_for(base_url: str) -> str:
+    return base_url.replace("https://", "wss://").replace("http://", "ws://").rstrip("/") + "/ws"
+
+
+async def _main(args):
+    token = await login(args.url, args.user, args.password)
+    clients: Optional[WebSocketClients] = None
+    if args.ws:
+        clients = WebSocketClients(ws_url_for(args.url), token, args.ws)
+        await clients.start()
+    result = {}
+    if args.path:
+        result["rest"] = await rest_load(args.url, token, args.path, args.concurrency, args.duration)
+    else:
+        await asyncio.sleep(args.duration)
+    if clients:
+        await clients.stop()
+        result["websocket"] = clients.summary()
+    print(json.dumps(result, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="REST and WebSocket load driver")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--path", action="append", help="GET path to load (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--ws", type=int, default=0, help="number of WebSocket clients")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
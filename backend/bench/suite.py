@@ -0,0 +1,136 @@
+"""
+Benchmark Suite
+Runs the fake AMI server in-process, waits for the backend to connect to it,
+then fires a DialBegin/DialEnd/Hangup storm while WebSocket clients (and
+optionally REST workers) are attached. Throughput numbers come from the
+backend's own /metrics counters, so they measure what the backend handled,
+not what was sent.
+
+  ASTERISK_HOST=127.0.0.1 ASTERISK_PORT=15038 uvicorn main:app --port 8000   # backend under test
+  python -m bench.suite --ami-port 15038 --password ... --rate 50 --duration 30 --ws 50 \
+      --path /api/dashboard/status
+
+Reports events/sec handled, WebSocket broadcast latency, CDR writes/sec and
+CDR write latency, plus REST latency percentiles when --path is given.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, Optional
+
+import httpx
+
+from bench.fake_ami import FakeAMIServer
+from bench.load import WebSocketClients, login, rest_load, ws_url_for
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+
+
+def parse_metrics(text: str) -> Dict[str, Dict[str, float]]:
+    """{metric_name: {label_string: value}} from the Prometheus text format."""
+    samples: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples[name][labels or ""] = float(value)
+    return samples
+
+
+def metric_sum(samples: dict, name: str, label_filter: Optional[str] = None) -> float:
+    return sum(v for labels, v in samples.get(name, {}).items() if not label_filter or label_filter in labels)
+
+
+async def scrape(base_url: str, metrics_token: Optional[str]) -> dict:
+    params = {"token": metrics_token} if metrics_token else None
+    async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+        response = await client.get("/metrics", params=params)
+        response.raise_for_status()
+        return parse_metrics(response.text)
+
+
+async def run(args) -> dict:
+    server = FakeAMIServer(args.ami_host, args.ami_port, endpoints=args.endpoints)
+    await server.start()
+    try:
+        logging.info(f"Waiting for the backend to connect to the fake AMI on port {server.port}...")
+        if not await server.wait_for_client(args.wait):
+            raise SystemExit("Backend did not connect to the fake AMI server "
+                             f"(start it with ASTERISK_HOST={args.ami_host} ASTERISK_PORT={server.port})")
+        # Let the connect callback (AstDB sync) finish before measuring
+        await asyncio.sleep(2)
+
+        token = await login(args.url, args.user, args.password)
+        clients = WebSocketClients(ws_url_for(args.url), token, args.ws) if args.ws else None
+        if clients:
+            await clients.start()
+
+        before = await scrape(args.url, args.metrics_token)
+        jobs = [server.storm(args.rate, args.duration)]
+        if args.path:
+            jobs.append(rest_load(args.url, token, args.path, args.concurrency, args.duration))
+        results = await asyncio.gather(*jobs)
+        await asyncio.sleep(args.drain)
+        after = await scrape(args.url, args.metrics_token)
+        if clients:
+            await clients.stop()
+    finally:
+        await server.stop()
+
+    storm = results[0]
+    seconds = storm["seconds"] + args.drain
+
+    def delta(name: str, label_filter: Optional[str] = None) -> float:
+        return metric_sum(after, name, label_filter) - metric_sum(before, name, label_filter)
+
+    call_events = sum(delta("gonopbx_ami_events_total", f'event="{e}"') for e in ("DialBegin", "DialEnd", "Hangup"))
+    cdr_writes = delta("gonopbx_cdr_write_duration_seconds_count")
+    cdr_time = delta("gonopbx_cdr_write_duration_seconds_sum")
+    report = {
+        "storm": storm,
+        "ami": {
+            "events_sent": storm["events"],
+            "events_handled": int(call_events),
+            "events_handled_per_second": round(call_events / storm["seconds"], 1) if storm["seconds"] else 0.0,
+            "actions_answered": server.actions_handled,
+        },
+        "cdr": {
+            "writes": int(cdr_writes),
+            "writes_per_second": round(cdr_writes / seconds, 1) if seconds else 0.0,
+            "avg_write_ms": round(cdr_time / cdr_writes * 1000, 2) if cdr_writes else 0.0,
+        },
+    }
+    if clients:
+        report["websocket"] = clients.summary()
+    if args.path:
+        report["rest"] = results[1]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AMI storm + WebSocket/REST benchmark against a running backend")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="backend base URL")
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--metrics-token", help="METRICS_TOKEN of the backend, if set")
+    parser.add_argument("--ami-host", default="127.0.0.1")
+    parser.add_argument("--ami-port", type=int, default=15038)
+    parser.add_argument("--endpoints", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=20, help="calls per second")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--drain", type=float, default=3, help="seconds to wait for the backend to catch up")
+    parser.add_argument("--wait", type=float, default=60, help="seconds to wait for the backend's AMI login")
+    parser.add_argument("--ws", type=int, default=10, help="number of WebSocket clients")
+    parser.add_argument("--path", action="append", help="GET path to load during the storm (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Caller-ID Lookup Index
+In-memory number -> contact index over the global and per-extension address
+books, used to name callers in live calls, WebSocket events and CDRs.
+Numbers are keyed by phone_numbers.contact_number_key() in a hash map; company
+switchboards (numbers written with a trailing "-0", e.g. "+49 221 66980-0")
+also go into a digit trie, so direct-dial numbers of that company
+("+4922166980123") match by longest prefix. The index is loaded once at
+startup and updated incrementally on contact create/update/delete and import.
+"""
+import logging
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from phone_numbers import contact_number_key, normalize_number
+
+logger = logging.getLogger(__name__)
+
+MAX_DIRECT_DIAL_DIGITS = 6  # digits a direct-dial number may add to a switchboard prefix
+MIN_PREFIX_DIGITS = 6
+
+_SWITCHBOARD_RE = re.compile(r"[-/ ]\s*0\s*$")
+
+# contact_id, name, company
+Entry = Tuple[int, str, Optional[str]]
+
+
+class CallerIDIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # number key -> {owner_extension (None = global): entries}; a book may hold the
+        # same number more than once, the most recently indexed contact wins
+        self._numbers: Dict[str, Dict[Optional[str], List[Entry]]] = {}
+        # digit trie of switchboard prefixes; "" holds {owner_extension: entries} at a node
+        self._trie: dict = {}
+        # contact_id -> (owner_extension, number key, switchboard prefix)
+        self._contacts: Dict[int, Tuple[Optional[str], Optional[str], Optional[str]]] = {}
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._contacts)
+
+    def load(self, rows: Iterable[tuple]):
+        """Replace the index with (id, owner_extension, name, company, external_number, internal_extension) rows."""
+        start = time.perf_counter()
+        fresh = CallerIDIndex()
+        for row in rows:
+            fresh._add(*row)
+        with self._lock:
+            self._numbers, self._trie, self._contacts = fresh._numbers, fresh._trie, fresh._contacts
+            self.loaded = True
+        logger.info(f"Caller-ID index loaded: {len(self._contacts)} contacts in {time.perf_counter() - start:.2f}s")
+
+    def upsert(self, contact_id: int, owner_extension: Optional[str], name: str, company: Optional[str],
+               external_number: Optional[str], internal_extension: Optional[str]):
+        with self._lock:
+            self._remove(contact_id)
+            self._add(contact_id, owner_extension, name, company, external_number, internal_extension)
+
+    def upsert_contact(self, contact):
+        self.upsert(contact.id, contact.owner_extension, contact.name, contact.company,
+                    contact.external_number, contact.internal_extension)
+
+    def remove(self, contact_id: int):
+        with self._lock:
+            self._remove(contact_id)
+
+    def _add(self, contact_id, owner_extension, name, company, external_number, internal_extension):
+        key = contact_number_key(external_number, internal_extension)
+        prefix = None
+        if external_number and _SWITCHBOARD_RE.search(external_number):
+            base = normalize_number(_SWITCHBOARD_RE.sub("", external_number))
+            if base and len(base.lstrip("+")) >= MIN_PREFIX_DIGITS:
+                prefix = base
+        if not key and not prefix:
+            return
+        entry = (contact_id, name, company)
+        if key:
+            self._numbers.setdefault(key, {}).setdefault(owner_extension, []).append(entry)
+        if prefix:
+            node = self._trie
+            for digit in prefix:
+                node = node.setdefault(digit, {})
+            node.setdefault("", {}).setdefault(owner_extension, []).append(entry)
+        self._contacts[contact_id] = (owner_extension, key, prefix)
+
+    def _remove(self, contact_id: int):
+        indexed = self._contacts.pop(contact_id, None)
+        if not indexed:
+            return
+        owner_extension, key, prefix = indexed
+        if key:
+            owners = self._numbers.get(key)
+            if owners and _drop(owners, owner_extension, contact_id) and not owners:
+                del self._numbers[key]
+        if prefix:
+            path = [self._trie]
+            for digit in prefix:
+                node = path[-1].get(digit)
+                if node is None:
+                    return
+                path.append(node)
+            owners = path[-1].get("", {})
+            if _drop(owners, owner_extension, contact_id) and not owners:
+                path[-1].pop("", None)
+            # Prune empty nodes
+            for depth in range(len(prefix), 0, -1):
+                if path[depth]:
+                    break
+                del path[depth - 1][prefix[depth - 1]]
+
+    def lookup(self, number: Optional[str], extension: Optional[str] = None) -> Optional[dict]:
+        """Contact for a caller number; the extension's own address book wins over the global one."""
+        key = normalize_number(number)
+        if not key:
+            return None
+        owners = self._numbers.get(key)
+        if owners:
+            entry = _newest(owners, extension)
+            if entry:
+                return self._result(entry, key, exact=True)
+        if not key.startswith("+"):
+            return None
+        # Longest switchboard prefix that leaves at most MAX_DIRECT_DIAL_DIGITS
+        node = self._trie
+        best = None
+        for depth, digit in enumerate(key, 1):
+            node = node.get(digit)
+            if node is None:
+                break
+            owners = node.get("")
+            if owners and len(key) - depth <= MAX_DIRECT_DIAL_DIGITS:
+                entry = _newest(owners, extension)
+                if entry:
+                    best = entry
+        return self._result(best, key, exact=False) if best else None
+
+    @staticmethod
+    def _result(entry: Entry, key: str, exact: bool) -> dict:
+        contact_id, name, company = entry
+        # A switchboard match names the company, not the person behind the switchboard
+        display_name = name if exact or not company else company
+        return {"contact_id": contact_id, "name": name, "company": company, "number": key, "exact": exact,
+                "display_name": display_name}
+
+    def stats(self) -> dict:
+        return {"loaded": self.loaded, "contacts": len(self._contacts), "numbers": len(self._numbers)}
+
+
+def _newest(owners: Dict[Optional[str], List[Entry]], extension: Optional[str]) -> Optional[Entry]:
+    """The extension's own entry if it has one, else the global one."""
+    entries = (owners.get(extension) if extension else None) or owners.get(None)
+    return entries[-1] if entries else None
+
+
+def _drop(owners: Dict[Optional[str], List[Entry]], owner_extension: Optional[str], contact_id: int) -> bool:
+    """Remove contact_id from owners[owner_extension]; True if it was there."""
+    entries = owners.get(owner_extension)
+    if not entries:
+        return False
+    remaining = [entry for entry in entries if entry[0] != contact_id]
+    if len(remaining) == len(entries):
+        return False
+    if remaining:
+        owners[owner_extension] = remaining
+    else:
+        del owners[owner_extension]
+    return True
+
+
+index = CallerIDIndex()
+
+
+def load_from_db():
+    """(Re)build the index from the contacts table (blocking)."""
+    from database import SessionLocal, Contact
+    db = SessionLocal()
+    try:
+        rows = db.query(Contact.id, Contact.owner_extension, Contact.name, Contact.company,
+                        Contact.external_number, Contact.internal_extension).yield_per(5000)
+        index.load(tuple(row) for row in rows)
+    finally:
+        db.close()
+
+
+def add_imported(rows: List[dict]):
+    """Index rows of a bulk insert; each dict needs "id" plus the contact fields."""
+    for row in rows:
+        index.upsert(row["id"], row.get("owner_extension"), row["name"], row.get("company"),
+                     row.get("external_number"), row.get("internal_extension"))
@@ -0,0 +1,168 @@
+"""
+Config Apply Job Queue
+Runs config_store applies and rollbacks in one dedicated background worker thread,
+so request handlers only commit their rows and enqueue a job. Queued apply jobs
+are coalesced: one render + reload covers every apply that was waiting.
+Job state changes are pushed to WebSocket clients as "config_job" messages.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from database import SessionLocal
+import config_store
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 200  # finished jobs kept for status lookups
+
+_queue: "queue.Queue[Optional[dict]]" = queue.Queue()
+_jobs: "OrderedDict[str, dict]" = OrderedDict()
+_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_broadcast_callback = None
+
+
+def start(loop: asyncio.AbstractEventLoop, broadcast_callback=None):
+    """Start the worker thread. broadcast_callback is an async function taking a message dict."""
+    global _worker, _loop, _broadcast_callback
+    _loop = loop
+    _broadcast_callback = broadcast_callback
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_run, name="config-apply", daemon=True)
+        _worker.start()
+        logger.info("Config apply worker started")
+
+
+def stop(timeout: float = 10):
+    """Stop the worker after the jobs already queued have been processed."""
+    global _worker
+    if _worker and _worker.is_alive():
+        _queue.put(None)
+        _worker.join(timeout)
+    _worker = None
+
+
+def enqueue(reason: str, created_by: str = "system") -> dict:
+    """Queue a render-and-apply of the current database state. Returns the job."""
+    return _add_job({"action": "apply", "reason": reason, "created_by": created_by})
+
+
+def enqueue_rollback(generation_id: int, created_by: str = "system") -> dict:
+    """Queue a rollback to a stored generation. Returns the job."""
+    return _add_job({"action": "rollback", "reason": f"rollback to generation {generation_id}",
+                     "created_by": created_by, "target_generation_id": generation_id})
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def list_jobs(limit: int = 50) -> list:
+    with _lock:
+        return [dict(job) for job in reversed(_jobs.values())][:limit]
+
+
+def _add_job(fields: dict) -> dict:
+    job = {
+        "id": uuid.uuid4().hex[:12],
+        "status": "queued",
+        "generation_id": None,
+        "changed_files": [],
+        "error": None,
+        "created_at": datetime.utcnow().isoformat(),
+        "finished_at": None,
+        **fields,
+    }
+    with _lock:
+        _jobs[job["id"]] = job
+        while len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+    _queue.put(job)
+    _notify(job)
+    return dict(job)
+
+
+def _update(jobs: list, **fields):
+    with _lock:
+        for job in jobs:
+            job.update(fields)
+    for job in jobs:
+        _notify(job)
+
+
+def _notify(job: dict):
+    if not _broadcast_callback or not _loop or _loop.is_closed():
+        return
+    message = {"type": "config_job", "job": dict(job)}
+    try:
+        asyncio.run_coroutine_threadsafe(_broadcast_callback(message), _loop)
+    except RuntimeError as e:
+        logger.debug(f"Config job notification dropped: {e}")
+
+
+def _next_batch(first: dict) -> tuple[list, dict | None, bool]:
+    """Collect the first job plus all directly following queued apply jobs.
+    Returns (batch, held job, stop_requested); the held job is the non-apply job
+    that ended the batch and must run right after it."""
+    batch = [first]
+    if first["action"] != "apply":
+        return batch, None, False
+    while True:
+        try:
+            job = _queue.get_nowait()
+        except queue.Empty:
+            return batch, None, False
+        if job is None:
+            return batch, None, True
+        if job["action"] != "apply":
+            return batch, job, False
+        batch.append(job)
+
+
+def _run():
+    stop_requested = False
+    held = None
+    while not stop_requested:
+        # Keep ordering: a rollback that ended the previous batch runs before anything queued after it
+        job = held or _queue.get()
+        held = None
+        if job is None:
+            break
+        batch, held, stop_requested = _next_batch(job)
+        _process(batch)
+
+
+def _process(batch: list):
+    _update(batch, status="running")
+    first = batch[0]
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        if first["action"] == "rollback":
+            generation = config_store.get_generation(db, first["target_generation_id"])
+            changed = config_store.activate(db, generation)
+        else:
+            reason = "; ".join(dict.fromkeys(job["reason"] for job in batch))
+            generation, changed = config_store.apply_current(db, created_by=first["created_by"], reason=reason)
+        _update(batch, status="applied", generation_id=generation.id, changed_files=changed,
+                finished_at=datetime.utcnow().isoformat())
+        logger.info(f"Config job(s) {', '.join(j['id'] for j in batch)} applied as generation {generation.id}")
+        metrics.CONFIG_APPLY_SECONDS.observe(time.perf_counter() - start, action=first["action"], status="applied")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Config job(s) {', '.join(j['id'] for j in batch)} failed: {e}")
+        _update(batch, status="failed", error=str(e), finished_at=datetime.utcnow().isoformat())
+        metrics.CONFIG_APPLY_SECONDS.observe(time.perf_counter() - start, action=first["action"], status="failed")
+    finally:
+        db.close()
@@ -0,0 +1,262 @@
+"""
+Versioned Config Store
+Every rendered set of Asterisk config files is stored as an immutable,
+content-addressed generation. Applying a generation stages all files, swaps
+them into place, copies them into the Asterisk container and reloads the
+affected modules in a single step. If the reload fails, the previous files
+are restored. A rollback re-applies a stored generation without
+re-rendering anything from the database.
+"""
+import os
+import json
+import difflib
+import hashlib
+import logging
+import subprocess
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from database import (
+    SIPPeer, SIPTrunk, InboundRoute, CallForward, VoicemailMailbox, RingGroup, IVRMenu,
+    SystemSettings, ConfigBlob, ConfigGeneration,
+)
+from pjsip_config import build_pjsip_config, DEFAULT_CODECS
+from dialplan import generate_extensions_config
+from voicemail_config import generate_voicemail_config, ensure_mailbox_greetings
+from queue_config import generate_queues_config
+from acl_config import generate_acl_config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = "/etc/asterisk/custom"
+ACTIVE_SETTING_KEY = "active_config_generation"
+SMTP_KEYS = ["smtp_host", "smtp_port", "smtp_tls", "smtp_user", "smtp_password", "smtp_from"]
+
+# Managed files and the CLI command that reloads them, in reload order
+# (acl.conf before pjsip.conf, which references the ACL).
+MANAGED_FILES = {
+    "acl.conf": "module reload res_acl",
+    "pjsip.conf": "pjsip reload",
+    "extensions.conf": "dialplan reload",
+    "voicemail.conf": "voicemail reload",
+    "queues.conf": "queue reload all",
+}
+
+
+class ConfigApplyError(Exception):
+    pass
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _setting(db: Session, key: str, default: str = "") -> str:
+    s = db.query(SystemSettings).filter(SystemSettings.key == key).first()
+    return s.value if s and s.value is not None else default
+
+
+def render_configs(db: Session) -> Dict[str, str]:
+    """Render all managed config files from the current database state."""
+    peers = db.query(SIPPeer).all()
+    trunks = db.query(SIPTrunk).all()
+    mailboxes = db.query(VoicemailMailbox).all()
+    groups = db.query(RingGroup).all()
+
+    global_codecs = _setting(db, "global_codecs", DEFAULT_CODECS)
+    acl_ips = json.loads(_setting(db, "ip_whitelist") or "[]")
+    acl_on = _setting(db, "ip_whitelist_enabled") == "true" and len(acl_ips) > 0
+    smtp_settings = {key: _setting(db, key) for key in SMTP_KEYS}
+
+    renderers = {
+        "acl.conf": lambda: generate_acl_config(acl_ips) if acl_on else "; ACL disabled\n",
+        "pjsip.conf": lambda: build_pjsip_config(peers, trunks, global_codecs=global_codecs, acl_enabled=acl_on),
+        "extensions.conf": lambda: generate_extensions_config(
+            db.query(InboundRoute).filter(InboundRoute.enabled == True).all(),
+            db.query(CallForward).filter(CallForward.enabled == True).all(),
+            mailboxes, peers, trunks, groups, db.query(IVRMenu).all(),
+        ),
+        "voicemail.conf": lambda: generate_voicemail_config(mailboxes, smtp_settings),
+        "queues.conf": lambda: generate_queues_config(groups),
+    }
+    files = {}
+    for name, render in renderers.items():
+        with metrics.CONFIG_RENDER_SECONDS.time(file=name):
+            files[name] = render()
+    return files
+
+
+def store_generation(db: Session, files: Dict[str, str], created_by: str = "system", reason: str = "") -> ConfigGeneration:
+    """Store a file set, reusing existing blobs and generations with identical content."""
+    manifest = {}
+    for name in sorted(files):
+        blob_hash = _sha256(files[name])
+        if db.get(ConfigBlob, blob_hash) is None:
+            db.add(ConfigBlob(hash=blob_hash, content=files[name]))
+        manifest[name] = blob_hash
+    manifest_json = json.dumps(manifest, sort_keys=True)
+    content_hash = _sha256(manifest_json)
+
+    generation = db.query(ConfigGeneration).filter(ConfigGeneration.content_hash == content_hash).first()
+    if generation is None:
+        generation = ConfigGeneration(content_hash=content_hash, manifest=manifest_json,
+                                      created_by=created_by, reason=reason[:200] if reason else None)
+        db.add(generation)
+    db.commit()
+    db.refresh(generation)
+    return generation
+
+
+def load_files(db: Session, generation: ConfigGeneration) -> Dict[str, str]:
+    """Return {filename: content} of a stored generation."""
+    files = {}
+    for name, blob_hash in json.loads(generation.manifest).items():
+        blob = db.get(ConfigBlob, blob_hash)
+        if blob is None:
+            raise ConfigApplyError(f"Blob {blob_hash} of generation {generation.id} is missing")
+        files[name] = blob.content
+    return files
+
+
+def get_active_generation(db: Session) -> Optional[ConfigGeneration]:
+    active_id = _setting(db, ACTIVE_SETTING_KEY)
+    if not active_id:
+        return None
+    return db.get(ConfigGeneration, int(active_id))
+
+
+def _set_active(db: Session, generation: ConfigGeneration):
+    setting = db.query(SystemSettings).filter(SystemSettings.key == ACTIVE_SETTING_KEY).first()
+    if setting:
+        setting.value = str(generation.id)
+    else:
+        db.add(SystemSettings(key=ACTIVE_SETTING_KEY, value=str(generation.id),
+                              description="Currently applied config generation"))
+    db.commit()
+
+
+def _read_live_files() -> Dict[str, Optional[str]]:
+    live = {}
+    for name in MANAGED_FILES:
+        try:
+            with open(os.path.join(CONFIG_DIR, name)) as f:
+                live[name] = f.read()
+        except FileNotFoundError:
+            live[name] = None
+    return live
+
+
+def _publish_files(files: Dict[str, str]):
+    """Stage all files next to their targets, then swap them in with os.replace."""
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    staged = []
+    try:
+        for name, content in files.items():
+            tmp_path = os.path.join(CONFIG_DIR, f".{name}.new")
+            with open(tmp_path, 'w') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            staged.append((tmp_path, os.path.join(CONFIG_DIR, name)))
+    except Exception:
+        for tmp_path, _ in staged:
+            os.unlink(tmp_path)
+        raise
+    for tmp_path, path in staged:
+        os.replace(tmp_path, path)
+
+
+def _reload(names: List[str]):
+    """Copy the given files into the Asterisk container and reload their modules in one exec."""
+    ordered = [name for name in MANAGED_FILES if name in names]
+    copy = " && ".join(
+        f"cp /etc/asterisk/custom/{n} /etc/asterisk/.{n}.new && mv -f /etc/asterisk/.{n}.new /etc/asterisk/{n}"
+        for n in ordered
+    )
+    reload = " && ".join(f'asterisk -rx "{MANAGED_FILES[n]}"' for n in ordered)
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            ['docker', 'exec', 'pbx_asterisk', 'sh', '-c', f"{copy} && {reload}"],
+            capture_output=True,
+            text=True,
+            timeout=20
+        )
+    except Exception as e:
+        raise ConfigApplyError(f"Reload failed: {e}")
+    finally:
+        elapsed = time.perf_counter() - start
+        for name in ordered:
+            metrics.CONFIG_RELOAD_SECONDS.observe(elapsed, file=name)
+    if result.returncode != 0:
+        raise ConfigApplyError(f"Reload failed: {result.stderr.strip() or result.stdout.strip()}")
+
+
+def activate(db: Session, generation: ConfigGeneration) -> List[str]:
+    """Publish a stored generation and reload once. Returns the changed file names.
+    On reload failure the previous files are restored and ConfigApplyError is raised."""
+    files = load_files(db, generation)
+    live = _read_live_files()
+    changed = [name for name in MANAGED_FILES if name in files and files[name] != live.get(name)]
+
+    if changed:
+        _publish_files({name: files[name] for name in changed})
+        try:
+            _reload(changed)
+        except ConfigApplyError as e:
+            logger.error(f"Config generation {generation.id} failed to apply, restoring previous files: {e}")
+            _publish_files({name: live[name] for name in changed if live[name] is not None})
+            try:
+                _reload(changed)
+            except ConfigApplyError as restore_error:
+                logger.error(f"Restoring previous config failed: {restore_error}")
+            raise
+
+    _set_active(db, generation)
+    logger.info(f"Config generation {generation.id} ({generation.content_hash[:12]}) active, "
+                f"reloaded: {', '.join(changed) or 'nothing'}")
+    return changed
+
+
+def apply_current(db: Session, created_by: str = "system", reason: str = "") -> Tuple[ConfigGeneration, List[str]]:
+    """Render the config set from the database, store it as a generation and apply it.
+    Returns the generation and the names of the files that changed."""
+    files = render_configs(db)
+    generation = store_generation(db, files, created_by=created_by, reason=reason)
+    changed = activate(db, generation)
+    ensure_mailbox_greetings(db.query(VoicemailMailbox).all())
+    return generation, changed
+
+
+def get_generation(db: Session, generation_id: int) -> ConfigGeneration:
+    generation = db.get(ConfigGeneration, generation_id)
+    if generation is None:
+        raise ConfigApplyError(f"Config generation {generation_id} not found")
+    return generation
+
+
+def rollback(db: Session, generation_id: int) -> ConfigGeneration:
+    """Re-apply a stored generation without re-rendering from the database."""
+    generation = get_generation(db, generation_id)
+    activate(db, generation)
+    return generation
+
+
+def diff_generations(db: Session, old: ConfigGeneration, new: ConfigGeneration) -> Dict[str, str]:
+    """Unified diff per file between two generations (unchanged files are omitted)."""
+    old_files = load_files(db, old)
+    new_files = load_files(db, new)
+    diffs = {}
+    for name in sorted(set(old_files) | set(new_files)):
+        a = old_files.get(name, "")
+        b = new_files.get(name, "")
+        if a == b:
+            continue
+        diffs[name] = "".join(difflib.unified_diff(
+            a.splitlines(keepends=True), b.splitlines(keepends=True),
+            fromfile=f"{old.id}/{name}", tofile=f"{new.id}/{name}",
+        ))
+    return diffs
@@ -0,0 +1,222 @@
+"""
+Contact Import
+Streams a CSV upload into the contacts table: the file is decoded and parsed
+incrementally, rows are normalized and loaded in batches of IMPORT_BATCH_SIZE
+with one executemany INSERT (committed per batch), so memory stays bounded by
+the batch, not the file. Rows whose number key (phone_numbers.contact_number_key)
+already exists in the target address book, or earlier in the file, are skipped.
+New contacts are added to the caller-ID index batch by batch.
+Progress is kept for status lookups and pushed to WebSocket clients as
+"contacts_import" messages.
+"""
+import asyncio
+import codecs
+import csv
+import logging
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from database import Contact
+from phone_numbers import contact_number_key
+from contact_search import search_text
+import callerid_index
+import phonebook
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 2000
+READ_CHUNK_BYTES = 64 * 1024
+MAX_IMPORTS = 50  # finished imports kept for status lookups
+COLUMNS = ("name", "internal_extension", "external_number", "company", "tag", "note")
+_LINE_END_RE = re.compile(r"(?<=\n)|(?<=\r)(?!\n)")
+_MAX_LENGTHS = {"name": 100, "internal_extension": 20, "external_number": 50, "company": 100, "tag": 50}
+
+_imports: "OrderedDict[str, dict]" = OrderedDict()
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_broadcast_callback = None
+
+
+def set_broadcast(loop: asyncio.AbstractEventLoop, broadcast_callback):
+    """broadcast_callback is an async function taking a message dict."""
+    global _loop, _broadcast_callback
+    _loop = loop
+    _broadcast_callback = broadcast_callback
+
+
+def get_import(import_id: str) -> Optional[dict]:
+    with _lock:
+        progress = _imports.get(import_id)
+        return dict(progress) if progress else None
+
+
+def _notify(progress: dict):
+    if not _broadcast_callback or not _loop or _loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(
+            _broadcast_callback({"type": "contacts_import", "import": dict(progress)}), _loop)
+    except RuntimeError as e:
+        logger.debug(f"Contact import notification dropped: {e}")
+
+
+def _lines(raw: BinaryIO) -> Iterator[str]:
+    """Text lines (with their line endings) of the upload, decoded while streaming.
+    UTF-8 (with or without BOM) is decoded strictly; at the first byte that is not
+    UTF-8 the rest of the file is read as Latin-1. Everything decoded up to that
+    point was ASCII, which reads the same in both, so nothing has to be re-read.
+    A file that mixes real UTF-8 and Latin-1 text is rejected."""
+    bom = raw.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8
+    if not bom:
+        raw.seek(0)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    utf8 = True
+    non_ascii = bom  # a BOM declares UTF-8
+    pending = ""
+    while True:
+        chunk = raw.read(READ_CHUNK_BYTES)
+        final = not chunk
+        if utf8:
+            buffered = decoder.getstate()[0]
+            try:
+                text = decoder.decode(chunk, final=final)
+            except UnicodeDecodeError:
+                if non_ascii:
+                    raise HTTPException(status_code=400,
+                                        detail="CSV-Datei mischt UTF-8 und Latin-1, bitte einheitlich als UTF-8 speichern")
+                utf8 = False
+                text = (buffered + chunk).decode("latin-1")
+            else:
+                non_ascii = non_ascii or not text.isascii()
+        else:
+            text = chunk.decode("latin-1")
+        pending += text
+        if final:
+            if pending:
+                yield pending
+            return
+        # A "\r" at the end may be the first half of "\r\n"
+        carry = "\r" if pending.endswith("\r") else ""
+        lines = _LINE_END_RE.split(pending[:-1] if carry else pending)
+        pending = lines.pop() + carry
+        yield from lines
+
+
+def _rows(lines: Iterator[str]) -> Iterator[Dict[str, Optional[str]]]:
+    """Contact fields per CSV row, by header if there is a "name" column, else by position."""
+    reader = csv.reader(lines)
+    first = next(reader, None)
+    if first is None:
+        return
+    headers = [h.strip().lower() for h in first]
+    if "name" in headers:
+        positions = [(column, headers.index(column)) for column in COLUMNS if column in headers]
+    else:
+        positions = list(zip(COLUMNS, range(len(COLUMNS))))
+        reader = _prepend(first, reader)
+    for row in reader:
+        values = dict.fromkeys(COLUMNS, "")
+        for column, index in positions:
+            value = row[index].strip() if index < len(row) else ""
+            values[column] = value[:_MAX_LENGTHS[column]] if column in _MAX_LENGTHS else value
+        yield {column: value or None for column, value in values.items()}
+
+
+def _prepend(first: list, reader) -> Iterator[list]:
+    yield first
+    yield from reader
+
+
+def import_csv(db: Session, raw: BinaryIO, owner_extension: Optional[str], total_bytes: Optional[int] = None,
+               created_by: str = "system") -> dict:
+    """Import a CSV file object into the global (owner_extension None) or an extension address book."""
+    progress = {
+        "id": uuid.uuid4().hex[:12],
+        "status": "running",
+        "owner_extension": owner_extension,
+        "rows": 0,
+        "created": 0,
+        "duplicates": 0,
+        "skipped": 0,
+        "bytes_read": 0,
+        "total_bytes": total_bytes,
+        "error": None,
+        "created_by": created_by,
+        "started_at": datetime.utcnow().isoformat(),
+        "finished_at": None,
+    }
+    with _lock:
+        _imports[progress["id"]] = progress
+        while len(_imports) > MAX_IMPORTS:
+            _imports.popitem(last=False)
+    _notify(progress)
+
+    batch: List[dict] = []
+    try:
+        for row in _rows(_lines(raw)):
+            progress["rows"] += 1
+            if not row.get("name"):
+                progress["skipped"] += 1
+                continue
+            row["owner_extension"] = owner_extension
+            row["number_key"] = contact_number_key(row.get("external_number"), row.get("internal_extension"))
+            row["search_text"] = search_text(row["name"], row.get("company"), row.get("internal_extension"),
+                                             row.get("external_number"))
+            batch.append(row)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                _flush(db, batch, progress, raw)
+                batch = []
+        _flush(db, batch, progress, raw)
+        progress["status"] = "done"
+    except Exception as e:
+        db.rollback()
+        progress.update(status="failed", error=str(e))
+        logger.error(f"Contact import {progress['id']} failed after {progress['rows']} rows: {e}")
+        raise
+    finally:
+        if progress["created"]:
+            phonebook.invalidate(owner_extension)
+        progress["finished_at"] = datetime.utcnow().isoformat()
+        _notify(progress)
+    logger.info(f"Contact import {progress['id']}: {progress['created']} created, "
+                f"{progress['duplicates']} duplicates, {progress['skipped']} skipped")
+    return dict(progress)
+
+
+def _flush(db: Session, batch: List[dict], progress: dict, raw: BinaryIO):
+    if batch:
+        keys = {row["number_key"] for row in batch if row["number_key"]}
+        existing = set()
+        if keys:
+            owner = (Contact.owner_extension.is_(None) if progress["owner_extension"] is None
+                     else Contact.owner_extension == progress["owner_extension"])
+            existing = set(db.scalars(select(Contact.number_key).where(owner, Contact.number_key.in_(keys))))
+        new_rows = []
+        for row in batch:
+            key = row["number_key"]
+            if key:
+                if key in existing:
+                    progress["duplicates"] += 1
+                    continue
+                existing.add(key)
+            new_rows.append(row)
+        if new_rows:
+            ids = db.scalars(insert(Contact).returning(Contact.id, sort_by_parameter_order=True), new_rows).all()
+            for row, contact_id in zip(new_rows, ids):
+                row["id"] = contact_id
+        db.commit()
+        callerid_index.add_imported(new_rows)
+        progress["created"] += len(new_rows)
+    try:
+        progress["bytes_read"] = raw.tell()
+    except (OSError, ValueError):
+        pass
+    _notify(progress)
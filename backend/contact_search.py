@@ -0,0 +1,83 @@
+"""
+Contact Search
+Every contact carries search_text: lowercased name and company plus the digits
+of its numbers (as written and normalized). On PostgreSQL it is covered by a
+pg_trgm GIN index (substring matches) and a C-collated btree on
+(search_text, id) (name prefix matches and result order), both created at
+startup in main.py. Results are ordered by search_text, i.e. by name, and
+paginated by keyset cursor.
+Queries of up to two characters match name prefixes, longer ones match
+substrings anywhere; all whitespace separated terms must match. A query that
+looks like a phone number is matched on digits only.
+"""
+import base64
+import json
+import re
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from database import Contact
+from phone_numbers import contact_number_key
+
+_NUMBER_QUERY_RE = re.compile(r"^\+?[\d\s\-/().]+$")
+_NON_DIGITS = re.compile(r"\D")
+MIN_SUBSTRING_LENGTH = 3
+
+
+def search_text(name: Optional[str], company: Optional[str], internal_extension: Optional[str],
+                external_number: Optional[str]) -> str:
+    numbers = []
+    for value in (internal_extension, external_number, contact_number_key(external_number, internal_extension)):
+        digits = _NON_DIGITS.sub("", value or "")
+        if digits and digits not in numbers:
+            numbers.append(digits)
+    return " | ".join([(name or "").lower(), (company or "").lower(), " ".join(numbers)])[:400]
+
+
+def _terms(q: str) -> List[str]:
+    q = q.strip()
+    if _NUMBER_QUERY_RE.match(q) and any(c.isdigit() for c in q):
+        return [_NON_DIGITS.sub("", q)]
+    return q.lower().split()
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def encode_cursor(contact: Contact) -> str:
+    return base64.urlsafe_b64encode(json.dumps([contact.search_text, contact.id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        text, contact_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(text), int(contact_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Ungültiger Cursor")
+
+
+def search(db: Session, q: str, owner_filter, limit: int, cursor: Optional[str] = None) -> Tuple[List[Contact], Optional[str]]:
+    """One page of contacts matching q within owner_filter, plus the cursor of the next page."""
+    terms = _terms(q)
+    if not terms:
+        return [], None
+    # Byte order on PostgreSQL, so the btree serves both LIKE 'prefix%' and ORDER BY
+    sort_key = Contact.search_text.collate("C") if db.bind.dialect.name == "postgresql" else Contact.search_text
+    query = db.query(Contact).filter(owner_filter)
+    if len(terms) == 1 and len(terms[0]) < MIN_SUBSTRING_LENGTH and not terms[0].isdigit():
+        query = query.filter(sort_key.like(_escape_like(terms[0]) + "%", escape="\\"))
+    else:
+        for term in terms:
+            query = query.filter(Contact.search_text.like("%" + _escape_like(term) + "%", escape="\\"))
+    if cursor:
+        after_text, after_id = _decode_cursor(cursor)
+        query = query.filter(or_(sort_key > after_text, and_(sort_key == after_text, Contact.id > after_id)))
+    rows = query.order_by(sort_key, Contact.id).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
@@ -3,6 +3,7 @@ Dialplan (extensions.conf) Generator
 Generates from-trunk context for inbound DID routing
 """
 import os
+import re
 import logging
 import subprocess
 from typing import List, Optional
@@ -13,85 +14,53 @@ logger = logging.getLogger(__name__)
 EXTENSIONS_CONFIG_PATH = "/etc/asterisk/custom/extensions.conf"
 
 
-def _build_forward_map(forwards: List[CallForward]) -> dict:
-    """Build a dict: extension -> {forward_type: CallForward}"""
-    fwd_map: dict = {}
-    for fwd in forwards:
-        if fwd.extension not in fwd_map:
-            fwd_map[fwd.extension] = {}
-        fwd_map[fwd.extension][fwd.forward_type] = fwd
-    return fwd_map
-
-
-def _generate_dial_logic(extension: str, fwd_map: dict, ring_time: int = 30, early_answer: bool = False) -> str:
-    """Generate dial logic for an extension with optional call forwarding.
+def _generate_dial_logic(extension: str, early_answer: bool = False) -> str:
+    """Generate dial logic for an extension.
+    Call forwarding and ring timeout are read from AstDB at runtime by the
+    generic [sub-dial-extension] subroutine, so changing them needs no reload.
     early_answer: if True, Answer() the channel before Dial() to stabilize
     the SIP dialog for inbound trunk calls (prevents provider BYE race condition).
     """
-    forwards = fwd_map.get(extension, {})
-    cfu = forwards.get("unconditional")
-    cfb = forwards.get("busy")
-    cfna = forwards.get("no_answer")
-
-    lines = []
-
-    # Unconditional forward - skip dialing the extension entirely
-    if cfu:
-        lines.append(f' same => n,NoOp(CFU active: forwarding to {cfu.destination})')
-        if early_answer:
-            lines.append(f' same => n,Answer()')
-            lines.append(f' same => n,Wait(0.5)')
-        lines.append(f' same => n,Dial(PJSIP/{cfu.destination}@trunk,{ring_time},tT)')
-        lines.append(f' same => n,Hangup()')
-        return "\n".join(lines)
-
-    # Answer early for inbound trunk calls to prevent provider BYE race condition
-    if early_answer:
-        lines.append(f' same => n,Answer()')
-        lines.append(f' same => n,Wait(0.5)')
-
-    # Check if device is reachable before dialing - if not, go straight to voicemail
-    actual_ring = cfna.ring_time if cfna else ring_time
-    lines.append(f' same => n,Set(DEVICE_STATE=${{DEVICE_STATE(PJSIP/{extension})}})')
-    lines.append(f' same => n,GotoIf($["${{DEVICE_STATE}}" = "UNAVAILABLE"]?unavail)')
-    lines.append(f' same => n,GotoIf($["${{DEVICE_STATE}}" = "INVALID"]?unavail)')
-    lines.append(f' same => n,Dial(PJSIP/{extension},{actual_ring},tTr)')
-
-    if cfb and cfna:
-        lines.append(f' same => n,GotoIf($["${{DIALSTATUS}}" = "BUSY"]?busy:noanswer)')
-        lines.append(f' same => n(noanswer),NoOp(CFNA: forwarding to {cfna.destination})')
-        lines.append(f' same => n,Dial(PJSIP/{cfna.destination}@trunk,30,tT)')
-        lines.append(f' same => n,VoiceMail({extension}@default,u)')
-        lines.append(f' same => n,Hangup()')
-        lines.append(f' same => n(busy),NoOp(CFB: forwarding to {cfb.destination})')
-        lines.append(f' same => n,Dial(PJSIP/{cfb.destination}@trunk,30,tT)')
-        lines.append(f' same => n,VoiceMail({extension}@default,b)')
-        lines.append(f' same => n,Hangup()')
-    elif cfb:
-        lines.append(f' same => n,GotoIf($["${{DIALSTATUS}}" = "BUSY"]?busy:unavail)')
-        lines.append(f' same => n(unavail),VoiceMail({extension}@default,u)')
-        lines.append(f' same => n,Hangup()')
-        lines.append(f' same => n(busy),NoOp(CFB: forwarding to {cfb.destination})')
-        lines.append(f' same => n,Dial(PJSIP/{cfb.destination}@trunk,30,tT)')
-        lines.append(f' same => n,VoiceMail({extension}@default,b)')
-        lines.append(f' same => n,Hangup()')
-    elif cfna:
-        lines.append(f' same => n,GotoIf($["${{DIALSTATUS}}" = "BUSY"]?busy:noanswer)')
-        lines.append(f' same => n(noanswer),NoOp(CFNA: forwarding to {cfna.destination})')
-        lines.append(f' same => n,Dial(PJSIP/{cfna.destination}@trunk,30,tT)')
-        lines.append(f' same => n,VoiceMail({extension}@default,u)')
-        lines.append(f' same => n,Hangup()')
-        lines.append(f' same => n(busy),VoiceMail({extension}@default,b)')
-        lines.append(f' same => n,Hangup()')
-    else:
-        # No forwarding - standard behavior
-        lines.append(f' same => n,GotoIf($["${{DIALSTATUS}}" = "BUSY"]?busy:unavail)')
-        lines.append(f' same => n(unavail),VoiceMail({extension}@default,u)')
-        lines.append(f' same => n,Hangup()')
-        lines.append(f' same => n(busy),VoiceMail({extension}@default,b)')
-        lines.append(f' same => n,Hangup()')
+    return f" same => n,Gosub(sub-dial-extension,s,1({extension},{1 if early_answer else 0}))\n same => n,Hangup()"
+
+
+def _generate_dial_subroutine() -> str:
+    """Generate the generic dial subroutine.
+    ARG1 = extension, ARG2 = 1 for early answer (inbound trunk calls).
+    AstDB layout is documented in astdb.py."""
+    return """[sub-dial-extension]
+; Generic extension dialing - forwarding and ring timeout are read from AstDB
+exten => s,1,NoOp(Dial ${ARG1})
+ same => n,Set(LOCAL(EXT)=${ARG1})
+ same => n,Set(LOCAL(RING)=${DB(RINGTIMEOUT/${EXT})})
+ same => n,ExecIf($["${RING}" = ""]?Set(LOCAL(RING)=20))
+ same => n,Set(LOCAL(CFU)=${DB(CF/${EXT}/unconditional)})
+ same => n,Set(LOCAL(CFB)=${DB(CF/${EXT}/busy)})
+ same => n,Set(LOCAL(CFNA)=${DB(CF/${EXT}/no_answer)})
+ same => n,ExecIf($["${ARG2}" = "1"]?Answer())
+ same => n,ExecIf($["${ARG2}" = "1"]?Wait(0.5))
+ same => n,GotoIf($["${CFU}" = ""]?nocfu)
+ same => n,NoOp(CFU active: forwarding to ${CFU})
+ same => n,Dial(PJSIP/${CFU}@trunk,${RING},tT)
+ same => n,Hangup()
+ same => n(nocfu),ExecIf($["${CFNA}" != "" & "${DB(CF/${EXT}/no_answer_ring_time)}" != ""]?Set(LOCAL(RING)=${DB(CF/${EXT}/no_answer_ring_time)}))
+ same => n,Set(DEVICE_STATE=${DEVICE_STATE(PJSIP/${EXT})})
+ same => n,GotoIf($["${DEVICE_STATE}" = "UNAVAILABLE"]?unavail)
+ same => n,GotoIf($["${DEVICE_STATE}" = "INVALID"]?unavail)
+ same => n,Dial(PJSIP/${EXT},${RING},tTr)
+ same => n,GotoIf($["${DIALSTATUS}" = "BUSY"]?busy)
+ same => n(unavail),GotoIf($["${CFNA}" = ""]?vm_unavail)
+ same => n,NoOp(CFNA: forwarding to ${CFNA})
+ same => n,Dial(PJSIP/${CFNA}@trunk,30,tT)
+ same => n(vm_unavail),VoiceMail(${EXT}@default,u)
+ same => n,Hangup()
+ same => n(busy),GotoIf($["${CFB}" = ""]?vm_busy)
+ same => n,NoOp(CFB: forwarding to ${CFB})
+ same => n,Dial(PJSIP/${CFB}@trunk,30,tT)
+ same => n(vm_busy),VoiceMail(${EXT}@default,b)
+ same => n,Hangup()
 
-    return "\n".join(lines)
+"""
 
 
 def _build_outbound_map(routes: List[InboundRoute], peers: Optional[List[SIPPeer]] = None) -> dict:
@@ -128,11 +97,6 @@ def _build_outbound_map(routes: List[InboundRoute], peers: Optional[List[SIPPeer
     return outbound
 
 
-def _build_ring_timeout_map(mailboxes: List[VoicemailMailbox]) -> dict:
-    """Build a dict: extension -> ring_timeout"""
-    return {mb.extension: (mb.ring_timeout or 20) for mb in mailboxes}
-
-
 def _generate_ring_group_logic(group: RingGroup) -> str:
     """Generate dial logic for a ring group (queue)."""
     queue_name = f"rg_{group.id}"
@@ -177,10 +141,45 @@ def _generate_ivr_context(menu: IVRMenu) -> str:
     return ctx
 
 
+def _generate_outbound_dispatch() -> str:
+    """Jump to the caller's outbound-{ext} context if one exists."""
+    target = "outbound-${CHANNEL(endpoint)}"
+    return f' same => n,GotoIf($[${{DIALPLAN_EXISTS({target},${{EXTEN}},1)}}]?{target},${{EXTEN}},1)\n'
+
+
+def _generate_outbound_context(ext: str, info: dict, trunk_map: dict) -> str:
+    """Generate the outbound-{ext} context with CID/PAI and trunk selection."""
+    route = info["route"]
+    pai = info["pai"]
+    tid = route.trunk_id
+    trunk = trunk_map.get(tid)
+
+    body = f" same => n,NoOp(Outbound via trunk-ep-{tid} with CID {route.did})\n"
+    if trunk and trunk.provider == "telekom_allip":
+        # Telekom All-IP: CallerID must be the Anschlussnummer (from_user), not the DID
+        allip_num = getattr(trunk, "from_user", None) or route.did
+        body += f" same => n,Set(CALLERID(num)={allip_num})\n"
+        body += f" same => n,Set(PJSIP_HEADER(add,P-Preferred-Identity)=<sip:{allip_num}@tel.t-online.de>)\n"
+    else:
+        body += f" same => n,Set(CALLERID(num)={route.did})\n"
+        if pai:
+            pai_domain = trunk.sip_server if trunk else "localhost"
+            body += f" same => n,Set(PJSIP_HEADER(add,P-Asserted-Identity)=<sip:{pai}@{pai_domain}>)\n"
+    body += f" same => n,Dial(PJSIP/${{EXTEN}}@trunk-ep-{tid},120,tT)\n"
+    body += " same => n,Hangup()\n"
+
+    ctx = f"[outbound-{ext}]\n"
+    ctx += f"exten => _0X.,1,NoOp(Outbound call from {ext} to ${{EXTEN}})\n" + body
+    ctx += f"exten => _+X.,1,NoOp(Outbound intl call from {ext} to ${{EXTEN}})\n" + body
+    ctx += "\n"
+    return ctx
+
+
 def generate_extensions_config(routes: List[InboundRoute], forwards: Optional[List[CallForward]] = None, mailboxes: Optional[List[VoicemailMailbox]] = None, peers: Optional[List[SIPPeer]] = None, trunks: Optional[List[SIPTrunk]] = None, ring_groups: Optional[List[RingGroup]] = None, ivr_menus: Optional[List[IVRMenu]] = None) -> str:
-    """Generate extensions.conf with internal context, outbound routing, call forwarding, and from-trunk inbound routing"""
+    """Generate extensions.conf with internal context, outbound routing, call forwarding, and from-trunk inbound routing.
+    forwards and mailboxes are not rendered: call forwarding and ring timeouts
+    live in AstDB (see astdb.py) and are read by [sub-dial-extension] at runtime."""
 
-    fwd_map = _build_forward_map(forwards or [])
     outbound_map = _build_outbound_map(routes, peers)
 
     # Build trunk lookup for PAI domain
@@ -188,7 +187,6 @@ def generate_extensions_config(routes: List[InboundRoute], forwards: Optional[Li
     if trunks:
         for t in trunks:
             trunk_map[t.id] = t
-    ring_timeout_map = _build_ring_timeout_map(mailboxes or [])
 
     config = """; Auto-generated dialplan configuration
 ; Generated by Asterisk PBX GUI
@@ -231,10 +229,7 @@ clearglobalvars=no
             config += f"exten => {m.extension},1,NoOp(IVR {m.name})\n"
             config += f" same => n,Goto(ivr-{m.id},s,1)\n\n"
 
-    # Internal extension dialing pattern
-    config += "exten => _1XXX,1,NoOp(Internal Call from ${CALLERID(all)} to ${EXTEN})\n"
-    config += " same => n,Set(CALLERID(name)=${CALLERID(name)})\n"
-    # BLF hints for peers
+    # BLF hints for peers (before the dial pattern so its "same" lines attach to _1XXX)
     if peers:
         for p in peers:
             try:
@@ -242,79 +237,41 @@ clearglobalvars=no
                     config += f"exten => {p.extension},hint,PJSIP/{p.extension}\n"
             except Exception:
                 continue
-    # Collect extensions that need per-extension overrides (forwarding or custom ring_timeout)
-    override_extensions = set(fwd_map.keys())
-    for ext, timeout in ring_timeout_map.items():
-        if timeout != 20:
-            override_extensions.add(ext)
-
-    # Add forwarding logic for internal calls (default ring_timeout 20s)
-    config += _generate_dial_logic("${EXTEN}", {}, 20)
+
+    # Internal extension dialing pattern
+    config += "exten => _1XXX,1,NoOp(Internal Call from ${CALLERID(all)} to ${EXTEN})\n"
+    config += " same => n,Set(CALLERID(name)=${CALLERID(name)})\n"
+    config += _generate_dial_logic("${EXTEN}")
     config += "\n\n"
 
-    # Generate per-extension overrides
-    for ext in sorted(override_extensions):
-        ext_ring = ring_timeout_map.get(ext, 20)
-        config += f"; Extension {ext} - custom rules\n"
-        config += f"exten => {ext},1,NoOp(Call to {ext} with forwarding)\n"
-        config += f" same => n,Set(CALLERID(name)=${{CALLERID(name)}})\n"
-        config += _generate_dial_logic(ext, fwd_map, ext_ring)
-        config += "\n\n"
+    # Peers outside the _1XXX pattern need an exact extension
+    if peers:
+        for p in peers:
+            if p.enabled and not re.match(r"^1\d{3}$", p.extension):
+                config += f"exten => {p.extension},1,NoOp(Internal Call from ${{CALLERID(all)}} to {p.extension})\n"
+                config += f" same => n,Set(CALLERID(name)=${{CALLERID(name)}})\n"
+                config += _generate_dial_logic(p.extension)
+                config += "\n\n"
 
     # === Outbound calling ===
+    # Dispatch via per-extension context: one DIALPLAN_EXISTS lookup instead of
+    # one GotoIf per extension, so the number of priorities is constant.
     if outbound_map:
         config += "; === Outbound calling via assigned trunks ===\n"
         # Match external numbers: 0X. (national/international German dialing)
         config += "exten => _0X.,1,NoOp(Outbound call from ${CHANNEL(endpoint)} to ${EXTEN})\n"
-        for ext in outbound_map:
-            config += f' same => n,GotoIf($["${{CHANNEL(endpoint)}}x" = "{ext}x"]?out-{ext})\n'
+        config += _generate_outbound_dispatch()
         config += " same => n,NoOp(No outbound route for this extension)\n"
         config += " same => n,Playback(ss-noservice)\n"
         config += " same => n,Hangup()\n"
-        for ext, info in outbound_map.items():
-            route = info["route"]
-            pai = info["pai"]
-            tid = route.trunk_id
-            trunk = trunk_map.get(tid)
-            config += f"\n same => n(out-{ext}),NoOp(Outbound via trunk-ep-{tid} with CID {route.did})\n"
-            if trunk and trunk.provider == "telekom_allip":
-                # Telekom All-IP: CallerID must be the Anschlussnummer (from_user), not the DID
-                allip_num = getattr(trunk, "from_user", None) or route.did
-                config += f" same => n,Set(CALLERID(num)={allip_num})\n"
-                config += f" same => n,Set(PJSIP_HEADER(add,P-Preferred-Identity)=<sip:{allip_num}@tel.t-online.de>)\n"
-            else:
-                config += f" same => n,Set(CALLERID(num)={route.did})\n"
-                if pai:
-                    pai_domain = trunk.sip_server if trunk else "localhost"
-                    config += f" same => n,Set(PJSIP_HEADER(add,P-Asserted-Identity)=<sip:{pai}@{pai_domain}>)\n"
-            config += f" same => n,Dial(PJSIP/${{EXTEN}}@trunk-ep-{tid},120,tT)\n"
-            config += f" same => n,Hangup()\n"
         config += "\n"
 
         # Also match + prefixed numbers (international with +)
         config += "; International with + prefix\n"
         config += "exten => _+X.,1,NoOp(Outbound intl call from ${CHANNEL(endpoint)} to ${EXTEN})\n"
-        for ext in outbound_map:
-            config += f' same => n,GotoIf($["${{CHANNEL(endpoint)}}x" = "{ext}x"]?out-{ext})\n'
+        config += _generate_outbound_dispatch()
         config += " same => n,Playback(ss-noservice)\n"
         config += " same => n,Hangup()\n"
-        for ext, info in outbound_map.items():
-            route = info["route"]
-            pai = info["pai"]
-            tid = route.trunk_id
-            trunk = trunk_map.get(tid)
-            config += f"\n same => n(out-{ext}),NoOp(Outbound via trunk-ep-{tid} with CID {route.did})\n"
-            if trunk and trunk.provider == "telekom_allip":
-                allip_num = getattr(trunk, "from_user", None) or route.did
-                config += f" same => n,Set(CALLERID(num)={allip_num})\n"
-                config += f" same => n,Set(PJSIP_HEADER(add,P-Preferred-Identity)=<sip:{allip_num}@tel.t-online.de>)\n"
-            else:
-                config += f" same => n,Set(CALLERID(num)={route.did})\n"
-                if pai:
-                    pai_domain = trunk.sip_server if trunk else "localhost"
-                    config += f" same => n,Set(PJSIP_HEADER(add,P-Asserted-Identity)=<sip:{pai}@{pai_domain}>)\n"
-            config += f" same => n,Dial(PJSIP/${{EXTEN}}@trunk-ep-{tid},120,tT)\n"
-            config += f" same => n,Hangup()\n"
         config += "\n"
 
     config += """; Voicemail access - dial *98 to check voicemail
@@ -377,8 +334,7 @@ exten => s,1,NoOp(Inbound call with no DID in Request-URI)
                 config += " same => n,Wait(0.5)\n"
                 config += _generate_ring_group_logic(rg)
             else:
-                ext_ring = ring_timeout_map.get(ext, 20)
-                config += _generate_dial_logic(ext, fwd_map, ext_ring, early_answer=True)
+                config += _generate_dial_logic(ext, early_answer=True)
             config += "\n"
     else:
         config += """
@@ -394,6 +350,12 @@ exten => _[+0-9].,1,NoOp(Unmatched inbound DID ${EXTEN})
  same => n,Hangup()
 """
 
+    config += "\n" + _generate_dial_subroutine()
+
+    # Append per-extension outbound contexts
+    for ext, info in outbound_map.items():
+        config += _generate_outbound_context(ext, info, trunk_map)
+
     # Append IVR contexts
     if ivr_menus:
         for m in ivr_menus:
@@ -403,6 +365,48 @@ exten => _[+0-9].,1,NoOp(Unmatched inbound DID ${EXTEN})
     return config
 
 
+def analyze_dialplan(config: str) -> dict:
+    """Report size and priority counts of a generated extensions.conf.
+    outbound_dispatch_priorities is the number of priorities an outbound call
+    runs through in [internal] before it reaches its outbound-{ext} context."""
+    contexts: dict = {}
+    current = None
+    extensions = 0
+    priorities = 0
+    dispatch = 0
+    in_dispatch = False
+    for raw in config.split("\n"):
+        line = raw.strip()
+        if not line or line.startswith(";"):
+            continue
+        if line.startswith("[") and "]" in line:
+            current = line[1:line.index("]")]
+            contexts.setdefault(current, 0)
+            in_dispatch = False
+            continue
+        if line.startswith("exten =>"):
+            if ",hint," in line:
+                continue
+            extensions += 1
+            in_dispatch = current == "internal" and line.startswith("exten => _0X.,")
+        elif not line.startswith("same =>"):
+            continue
+        priorities += 1
+        if current is not None:
+            contexts[current] += 1
+        if in_dispatch:
+            dispatch += 1
+    return {
+        "bytes": len(config.encode()),
+        "lines": config.count("\n"),
+        "contexts": len(contexts),
+        "extensions": extensions,
+        "priorities": priorities,
+        "outbound_dispatch_priorities": dispatch,
+        "priorities_by_context": contexts,
+    }
+
+
 def write_extensions_config(routes: List[InboundRoute], forwards: Optional[List[CallForward]] = None, mailboxes: Optional[List[VoicemailMailbox]] = None, peers: Optional[List[SIPPeer]] = None, trunks: Optional[List[SIPTrunk]] = None, ring_groups: Optional[List[RingGroup]] = None, ivr_menus: Optional[List[IVRMenu]] = None) -> bool:
     """Write extensions.conf to shared volume"""
     try:
@@ -413,7 +417,10 @@ def write_extensions_config(routes: List[InboundRoute], forwards: Optional[List[
         with open(EXTENSIONS_CONFIG_PATH, 'w') as f:
             f.write(config_content)
 
-        logger.info(f"extensions.conf written with {len(routes)} inbound routes")
+        stats = analyze_dialplan(config_content)
+        logger.info(f"extensions.conf written with {len(routes)} inbound routes "
+                    f"({stats['bytes']} bytes, {stats['priorities']} priorities, "
+                    f"{stats['outbound_dispatch_priorities']} outbound dispatch steps)")
         return True
 
     except Exception as e:
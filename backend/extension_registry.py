@@ -0,0 +1,150 @@
+"""
+Extension Registry
+One namespace for the numbers of SIP peers, ring groups and IVR menus: every
+such number has a row in extension_registry, unique on extension. Peer, group
+and IVR writes claim, rename and release their number in the same transaction,
+so two requests racing for one number cannot both succeed - the loser fails on
+the unique constraint (commit() turns that into a 400).
+Lookups are served from an in-process cache (number -> kind), loaded on first
+use and updated only once a claim or release is committed. sync_from_db()
+rebuilds the table from the three source tables at startup.
+"""
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import ExtensionRegistry, SIPPeer, RingGroup, IVRMenu
+
+logger = logging.getLogger(__name__)
+
+KINDS = {"peer": "Nebenstelle", "group": "Gruppe", "ivr": "IVR"}
+_PENDING_KEY = "extension_registry"
+
+_lock = threading.Lock()
+_cache: Dict[str, str] = {}
+_loaded = False
+
+
+def load(db: Session):
+    """(Re)load the cache from the registry table."""
+    global _loaded
+    rows = db.query(ExtensionRegistry.extension, ExtensionRegistry.kind).all()
+    with _lock:
+        _cache.clear()
+        _cache.update({extension: kind for extension, kind in rows})
+        _loaded = True
+    logger.info(f"Extension registry loaded: {len(rows)} numbers")
+
+
+def lookup(db: Session, extensions: Iterable[str]) -> Dict[str, str]:
+    """{extension: kind} for those of extensions that are in use."""
+    if not _loaded:
+        load(db)
+    return {ext: _cache[ext] for ext in set(extensions) if ext in _cache}
+
+
+def kind_of(db: Session, extension: str) -> Optional[str]:
+    return lookup(db, [extension]).get(extension)
+
+
+def ensure_free(db: Session, extension: str, label: str, own_kind: str):
+    """400 if extension is taken; label names the number in the message ("Gruppen-Nummer")."""
+    kind = kind_of(db, extension)
+    if kind == own_kind:
+        raise HTTPException(status_code=400, detail=f"{label} existiert bereits")
+    if kind:
+        raise HTTPException(status_code=400, detail=f"{label} ist bereits als {KINDS[kind]} vergeben")
+
+
+def claim(db: Session, extension: str, kind: str):
+    db.add(ExtensionRegistry(extension=extension, kind=kind))
+    db.info.setdefault(_PENDING_KEY, []).append((extension, kind))
+
+
+def claim_many(db: Session, extensions: Iterable[str], kind: str):
+    for extension in extensions:
+        claim(db, extension, kind)
+
+
+def release(db: Session, extension: str):
+    db.query(ExtensionRegistry).filter(ExtensionRegistry.extension == extension).delete(synchronize_session=False)
+    db.info.setdefault(_PENDING_KEY, []).append((extension, None))
+
+
+def rename(db: Session, old_extension: str, new_extension: str, kind: str):
+    if old_extension == new_extension:
+        return
+    release(db, old_extension)
+    claim(db, new_extension, kind)
+
+
+def is_conflict(error: IntegrityError) -> bool:
+    return "extension_registry" in str(error.orig)
+
+
+def conflict_error(db: Session) -> HTTPException:
+    """The 400 for a lost race; the cache evidently missed the winner, so it is reloaded."""
+    load(db)
+    return HTTPException(status_code=400, detail="Nummer wurde soeben anderweitig vergeben")
+
+
+def commit(db: Session):
+    """db.commit(); a number claimed concurrently by another request becomes a 400."""
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_conflict(e):
+            raise conflict_error(db)
+        raise
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending or not _loaded:
+        return
+    with _lock:
+        for extension, kind in pending:
+            if kind is None:
+                _cache.pop(extension, None)
+            else:
+                _cache[extension] = kind
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def sync_from_db(db: Session) -> int:
+    """Make the registry match sip_peers, ring_groups and ivr_menus; returns the number of changed rows.
+    Numbers used twice (possible before the registry existed) keep the first owner: peer, group, ivr."""
+    wanted: Dict[str, str] = {}
+    for model, kind in ((SIPPeer, "peer"), (RingGroup, "group"), (IVRMenu, "ivr")):
+        for (extension,) in db.query(model.extension):
+            if extension in wanted:
+                logger.warning(f"Extension {extension} is used by a {wanted[extension]} and a {kind}")
+                continue
+            wanted[extension] = kind
+    current = {row.extension: row for row in db.query(ExtensionRegistry)}
+    changed = 0
+    for extension, row in current.items():
+        if extension not in wanted:
+            db.delete(row)
+            changed += 1
+        elif row.kind != wanted[extension]:
+            row.kind = wanted[extension]
+            changed += 1
+    missing = [{"extension": ext, "kind": kind} for ext, kind in wanted.items() if ext not in current]
+    if missing:
+        db.bulk_insert_mappings(ExtensionRegistry, missing)
+        changed += len(missing)
+    db.commit()
+    load(db)
+    return changed
@@ -0,0 +1,214 @@
+"""
+HEP Capture - Receives SIP packets from Asterisk's res_hep/res_hep_pjsip (HEPv3 over UDP).
+Asterisk pushes every SIP message it sends or receives, so capture needs no AMI
+polling. hep.conf is written by the backend when capture is enabled, because
+res_hep only accepts a numeric capture_address.
+"""
+import asyncio
+import logging
+import os
+import socket
+import struct
+import subprocess
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+HEP_LISTEN = os.getenv("HEP_LISTEN", "0.0.0.0")
+HEP_PORT = int(os.getenv("HEP_PORT", "9060"))
+HEP_PASSWORD = os.getenv("HEP_PASSWORD", "")
+# Address Asterisk sends to; detected from the route to ASTERISK_HOST when empty
+HEP_CAPTURE_ADDRESS = os.getenv("HEP_CAPTURE_ADDRESS", "")
+HEP_CONFIG_PATH = "/etc/asterisk/custom/hep.conf"
+
+_HEADER = struct.Struct("!4sH")
+_CHUNK = struct.Struct("!HHH")
+
+# Generic chunk types (vendor 0) of HEPv3
+CHUNK_IP_FAMILY = 0x01
+CHUNK_PROTOCOL = 0x02
+CHUNK_SRC_IP4 = 0x03
+CHUNK_DST_IP4 = 0x04
+CHUNK_SRC_IP6 = 0x05
+CHUNK_DST_IP6 = 0x06
+CHUNK_SRC_PORT = 0x07
+CHUNK_DST_PORT = 0x08
+CHUNK_TS_SEC = 0x09
+CHUNK_TS_USEC = 0x0a
+CHUNK_PROTO_TYPE = 0x0b
+CHUNK_CAPTURE_ID = 0x0c
+CHUNK_AUTH_KEY = 0x0e
+CHUNK_PAYLOAD = 0x0f
+CHUNK_COMPRESSED_PAYLOAD = 0x10
+CHUNK_CORRELATION_ID = 0x11
+
+PROTO_TYPE_SIP = 1
+
+
+@dataclass
+class HEPPacket:
+    src_ip: str
+    src_port: int
+    dst_ip: str
+    dst_port: int
+    timestamp: float
+    proto_type: int
+    payload: bytes
+    auth_key: str = ""
+    correlation_id: str = ""
+
+
+def parse_hep3(data: bytes) -> Optional[HEPPacket]:
+    """Decode one HEPv3 datagram, None if it is not valid HEPv3."""
+    if len(data) < _HEADER.size:
+        return None
+    magic, total = _HEADER.unpack_from(data)
+    if magic != b"HEP3" or total > len(data):
+        return None
+
+    src_ip = dst_ip = ""
+    src_port = dst_port = ts_sec = ts_usec = 0
+    proto_type = 0
+    payload = b""
+    auth_key = correlation_id = ""
+    offset = _HEADER.size
+    while offset + _CHUNK.size <= total:
+        vendor, chunk_type, length = _CHUNK.unpack_from(data, offset)
+        if length < _CHUNK.size or offset + length > total:
+            return None
+        value = data[offset + _CHUNK.size:offset + length]
+        offset += length
+        if vendor != 0:
+            continue
+        if chunk_type == CHUNK_SRC_IP4 or chunk_type == CHUNK_SRC_IP6:
+            src_ip = socket.inet_ntop(socket.AF_INET if len(value) == 4 else socket.AF_INET6, value)
+        elif chunk_type == CHUNK_DST_IP4 or chunk_type == CHUNK_DST_IP6:
+            dst_ip = socket.inet_ntop(socket.AF_INET if len(value) == 4 else socket.AF_INET6, value)
+        elif chunk_type == CHUNK_SRC_PORT:
+            src_port = int.from_bytes(value, "big")
+        elif chunk_type == CHUNK_DST_PORT:
+            dst_port = int.from_bytes(value, "big")
+        elif chunk_type == CHUNK_TS_SEC:
+            ts_sec = int.from_bytes(value, "big")
+        elif chunk_type == CHUNK_TS_USEC:
+            ts_usec = int.from_bytes(value, "big")
+        elif chunk_type == CHUNK_PROTO_TYPE:
+            proto_type = value[0] if value else 0
+        elif chunk_type == CHUNK_PAYLOAD:
+            payload = value
+        elif chunk_type == CHUNK_COMPRESSED_PAYLOAD:
+            try:
+                payload = zlib.decompress(value)
+            except zlib.error:
+                return None
+        elif chunk_type == CHUNK_AUTH_KEY:
+            auth_key = value.rstrip(b"\x00").decode(errors="replace")
+        elif chunk_type == CHUNK_CORRELATION_ID:
+            correlation_id = value.decode(errors="replace")
+
+    if not payload:
+        return None
+    return HEPPacket(src_ip, src_port, dst_ip, dst_port, ts_sec + ts_usec / 1_000_000,
+                     proto_type, payload, auth_key, correlation_id)
+
+
+class HEPProtocol(asyncio.DatagramProtocol):
+    """Hands every valid SIP packet to on_packet(packet, sender_ip)."""
+
+    def __init__(self, on_packet: Callable[[HEPPacket, str], None], password: str = HEP_PASSWORD):
+        self.on_packet = on_packet
+        self.password = password
+        self.received = 0
+        self.dropped = 0
+
+    def datagram_received(self, data: bytes, addr):
+        packet = parse_hep3(data)
+        if packet is None or packet.proto_type != PROTO_TYPE_SIP or \
+                (self.password and packet.auth_key != self.password):
+            self.dropped += 1
+            return
+        self.received += 1
+        try:
+            self.on_packet(packet, addr[0])
+        except Exception as e:
+            self.dropped += 1
+            logger.warning(f"HEP packet from {addr[0]} could not be stored: {e}")
+
+    def error_received(self, exc):
+        logger.warning(f"HEP socket error: {exc}")
+
+
+async def start_listener(on_packet: Callable[[HEPPacket, str], None], host: str = HEP_LISTEN,
+                         port: int = HEP_PORT, password: str = HEP_PASSWORD):
+    """Open the UDP socket. Returns (transport, protocol)."""
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: HEPProtocol(on_packet, password), local_addr=(host, port)
+    )
+    try:
+        # Bursts of SIP traffic arrive faster than single datagrams are handled
+        transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    except OSError:
+        pass
+    logger.info(f"HEP listener on {host}:{transport.get_extra_info('sockname')[1]}/udp")
+    return transport, protocol
+
+
+def capture_address(asterisk_host: str) -> str:
+    """Our address as seen from Asterisk (res_hep needs a numeric host)."""
+    if HEP_CAPTURE_ADDRESS:
+        return HEP_CAPTURE_ADDRESS
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        # connect() on UDP only selects the route, nothing is sent
+        s.connect((socket.gethostbyname(asterisk_host), 5060))
+        return f"{s.getsockname()[0]}:{HEP_PORT}"
+
+
+def generate_hep_config(enabled: bool, address: str = "") -> str:
+    lines = [
+        "; Auto-generated by GonoPBX - SIP debug capture (HEP)",
+        "[general]",
+        f"enabled = {'yes' if enabled else 'no'}",
+    ]
+    if address:
+        lines.append(f"capture_address = {address}")
+    if HEP_PASSWORD:
+        lines.append(f"capture_password = {HEP_PASSWORD}")
+    lines += ["capture_id = 1", "uuid_type = call-id", ""]
+    return "\n".join(lines)
+
+
+def write_hep_config(enabled: bool, address: str = "") -> bool:
+    try:
+        os.makedirs(os.path.dirname(HEP_CONFIG_PATH), exist_ok=True)
+        with open(HEP_CONFIG_PATH, "w") as f:
+            f.write(generate_hep_config(enabled, address))
+        return True
+    except Exception as e:
+        logger.error(f"Failed to write HEP config: {e}")
+        return False
+
+
+def reload_hep() -> bool:
+    """Copy hep.conf into the Asterisk container and (re)load res_hep + res_hep_pjsip.
+    res_hep declines to load without hep.conf, so `module load` comes first."""
+    try:
+        result = subprocess.run(
+            ['docker', 'exec', 'pbx_asterisk', 'sh', '-c',
+             'cp /etc/asterisk/custom/hep.conf /etc/asterisk/hep.conf; '
+             'asterisk -rx "module load res_hep.so"; asterisk -rx "module reload res_hep"; '
+             'asterisk -rx "module load res_hep_pjsip.so"'],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+        if result.returncode == 0:
+            logger.info("Asterisk HEP capture reloaded")
+            return True
+        logger.error(f"HEP reload failed: {result.stderr}")
+        return False
+    except Exception as e:
+        logger.error(f"Failed to reload HEP: {e}")
+        return False
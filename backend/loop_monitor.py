@@ -0,0 +1,179 @@
+"""
+Event Loop Monitor
+Continuously measures asyncio scheduling lag (how late a sleeping task wakes up)
+and keeps a rolling window of samples for percentiles. In debug mode a watchdog
+thread additionally captures the stack of the event loop thread whenever the
+loop has not ticked for longer than the threshold, which points straight at the
+blocking call (a sync DB query in an async handler, subprocess.run, ...).
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000
+WINDOW_SIZE = 3000          # samples kept for percentiles (5 min at 100 ms)
+MAX_SLOW_EVENTS = 50        # stacks kept in debug mode
+DEFAULT_THRESHOLD_MS = float(os.getenv("LOOP_MONITOR_THRESHOLD_MS", "50"))
+
+_samples: deque = deque(maxlen=WINDOW_SIZE)
+_slow_events: deque = deque(maxlen=MAX_SLOW_EVENTS)
+_lock = threading.Lock()
+_task: Optional[asyncio.Task] = None
+_loop_thread_id: Optional[int] = None
+_last_tick = 0.0
+_total_samples = 0
+_max_lag_ms = 0.0
+_started_at: Optional[str] = None
+
+_watchdog: Optional[threading.Thread] = None
+_watchdog_stop = threading.Event()
+_threshold_ms = DEFAULT_THRESHOLD_MS
+
+
+def start(debug: bool = False, threshold_ms: Optional[float] = None):
+    """Start the lag sampler on the running loop (and the watchdog if debug is set)."""
+    global _task, _loop_thread_id, _last_tick, _started_at
+    if _task is None or _task.done():
+        _loop_thread_id = threading.get_ident()
+        _last_tick = time.monotonic()
+        _started_at = datetime.utcnow().isoformat()
+        _task = asyncio.get_running_loop().create_task(_sample_lag())
+        logger.info(f"Event loop monitor started (interval {SAMPLE_INTERVAL * 1000:.0f} ms)")
+    if debug:
+        enable_debug(threshold_ms)
+
+
+async def stop():
+    global _task
+    disable_debug()
+    if _task and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+    _task = None
+
+
+def enable_debug(threshold_ms: Optional[float] = None):
+    """Start the watchdog that records the loop thread's stack on stalls > threshold_ms."""
+    global _watchdog, _threshold_ms
+    if threshold_ms:
+        _threshold_ms = threshold_ms
+    if _watchdog and _watchdog.is_alive():
+        return
+    _watchdog_stop.clear()
+    _watchdog = threading.Thread(target=_watch, name="loop-watchdog", daemon=True)
+    _watchdog.start()
+    logger.warning(f"Event loop watchdog enabled, recording stacks of stalls > {_threshold_ms:.0f} ms")
+
+
+def disable_debug():
+    global _watchdog
+    if _watchdog and _watchdog.is_alive():
+        _watchdog_stop.set()
+        _watchdog.join(2)
+        logger.info("Event loop watchdog disabled")
+    _watchdog = None
+
+
+def debug_enabled() -> bool:
+    return _watchdog is not None and _watchdog.is_alive()
+
+
+def reset():
+    """Clear collected samples and recorded stalls."""
+    global _total_samples, _max_lag_ms
+    with _lock:
+        _samples.clear()
+        _slow_events.clear()
+        _total_samples = 0
+        _max_lag_ms = 0.0
+
+
+async def _sample_lag():
+    global _last_tick, _total_samples, _max_lag_ms
+    while True:
+        expected = time.monotonic() + SAMPLE_INTERVAL
+        await asyncio.sleep(SAMPLE_INTERVAL)
+        now = time.monotonic()
+        lag_ms = max(0.0, (now - expected) * 1000)
+        _last_tick = now
+        with _lock:
+            _samples.append(lag_ms)
+            _total_samples += 1
+            if lag_ms > _max_lag_ms:
+                _max_lag_ms = lag_ms
+
+
+def _watch():
+    """Watchdog thread: a tick older than the threshold means the loop is stuck in a callback."""
+    stall_tick = None
+    while not _watchdog_stop.wait(min(_threshold_ms, SAMPLE_INTERVAL * 1000) / 2000):
+        tick = _last_tick
+        blocked_ms = (time.monotonic() - tick) * 1000 - SAMPLE_INTERVAL * 1000
+        if blocked_ms < _threshold_ms:
+            continue
+        if stall_tick == tick:
+            # Same stall still ongoing, just extend its duration
+            with _lock:
+                if _slow_events:
+                    _slow_events[-1]["blocked_ms"] = round(blocked_ms, 1)
+            continue
+        stall_tick = tick
+        frame = sys._current_frames().get(_loop_thread_id)
+        stack = traceback.format_stack(frame) if frame else []
+        with _lock:
+            _slow_events.append({
+                "detected_at": datetime.utcnow().isoformat(),
+                "blocked_ms": round(blocked_ms, 1),
+                "stack": [line.rstrip() for line in stack],
+            })
+        logger.warning(f"Event loop blocked for {blocked_ms:.0f} ms at:\n{''.join(stack[-6:])}")
+
+
+def _percentile(ordered: list, pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 2)
+
+
+def get_stats() -> dict:
+    """Lag percentiles over the sample window plus totals since start/reset."""
+    with _lock:
+        ordered = sorted(_samples)
+        total = _total_samples
+        max_lag = _max_lag_ms
+    return {
+        "running": _task is not None and not _task.done(),
+        "started_at": _started_at,
+        "interval_ms": SAMPLE_INTERVAL * 1000,
+        "window_samples": len(ordered),
+        "total_samples": total,
+        "lag_ms": {
+            "p50": _percentile(ordered, 50),
+            "p90": _percentile(ordered, 90),
+            "p99": _percentile(ordered, 99),
+            "max_window": round(ordered[-1], 2) if ordered else 0.0,
+            "max_total": round(max_lag, 2),
+        },
+        "over_threshold": sum(1 for lag in ordered if lag >= _threshold_ms),
+        "debug": debug_enabled(),
+        "threshold_ms": _threshold_ms,
+    }
+
+
+def get_slow_events() -> list:
+    """Recorded stalls (debug mode), newest first."""
+    with _lock:
+        return list(reversed(_slow_events))
@@ -3,10 +3,12 @@ Asterisk PBX GUI - Backend API
 FastAPI application with Asterisk AMI integration
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, Query, HTTPException, Header, Request
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import asyncio
+import json
 import logging
 from datetime import datetime
 
@@ -20,18 +22,35 @@ logger = logging.getLogger(__name__)
 # Import our modules
 import os
 from ami_client import AsteriskAMIClient
-from database import engine, Base
+from database import engine, async_engine, Base
 from routers import peers, trunks, routes, dashboard, cdr, voicemail, callforward, groups, ivr, contacts
 from routers import auth as auth_router, users as users_router
 from routers import settings as settings_router
 from routers import audit as audit_router
+from routers import configs as configs_router
+from routers import diagnostics as diagnostics_router
 from routers import sip_debug as sip_debug_router
+from routers import phonebook as phonebook_router
 from auth import get_password_hash, get_current_user
-from database import SessionLocal, User, SIPPeer, VoicemailMailbox, SystemSettings
-from voicemail_config import write_voicemail_config, reload_voicemail
+from database import SessionLocal, User, SIPPeer, SIPTrunk, VoicemailMailbox, SystemSettings
+from pjsip_config import PJSIP_REALTIME
 from email_config import write_msmtp_config
 from mqtt_client import mqtt_publisher
 from version import VERSION
+import astdb
+import pjsip_realtime
+import config_store
+import config_jobs
+import loop_monitor
+import metrics
+import profiler
+import ami_recorder
+import sip_trace
+import voicemail_indexer
+import voicemail_audio
+import contact_import
+import callerid_index
+import extension_registry
 
 # Global AMI client instance
 ami_client = None
@@ -55,18 +74,24 @@ class ConnectionManager:
     async def broadcast(self, message: dict):
         """Broadcast message to all connected clients"""
         disconnected = []
+        # Serialize once for all clients; default=str covers the datetimes in active_calls
+        text = json.dumps(message, default=str)
+        metrics.WEBSOCKET_SEND_PENDING.inc(len(self.active_connections))
         for connection in self.active_connections:
             try:
-                await connection.send_json(message)
+                await connection.send_text(text)
             except Exception as e:
                 logger.error(f"Error broadcasting to client: {e}")
                 disconnected.append(connection)
+            finally:
+                metrics.WEBSOCKET_SEND_PENDING.dec()
         
         # Remove disconnected clients
         for conn in disconnected:
             self.disconnect(conn)
 
 manager = ConnectionManager()
+metrics.WEBSOCKET_CLIENTS.set_function(lambda: len(manager.active_connections))
 
 
 # Lifecycle management
@@ -77,6 +102,17 @@ async def lifespan(app: FastAPI):
     
     # Startup
     logger.info("Starting Asterisk PBX GUI Backend...")
+
+    # Development guard: with ASYNCIO_DEBUG=true asyncio logs every callback (e.g. a
+    # request handler step) that holds the event loop longer than the threshold
+    if os.getenv("ASYNCIO_DEBUG", "").strip().lower() in ("1", "true", "yes"):
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = float(os.getenv("ASYNCIO_SLOW_CALLBACK_MS", "5")) / 1000
+        logger.warning(f"asyncio debug mode on, slow callback threshold {loop.slow_callback_duration * 1000:.0f} ms")
+
+    # Continuous event loop lag measurement, optionally with the blocking-call watchdog
+    loop_monitor.start(debug=os.getenv("LOOP_MONITOR_DEBUG", "").strip().lower() in ("1", "true", "yes"))
     
     # Create database tables
     Base.metadata.create_all(bind=engine)
@@ -251,6 +287,68 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"Migration check for audit_logs table: {e}")
 
+    # Migrate: add number_key/search_text columns to contacts and fill them for existing rows
+    try:
+        from sqlalchemy import text, inspect as sa_inspect_contacts
+        from database import Contact
+        from phone_numbers import contact_number_key
+        from contact_search import search_text
+        contact_columns = [c['name'] for c in sa_inspect_contacts(engine).get_columns('contacts')]
+        for column, ddl in (("number_key", "VARCHAR(50)"), ("search_text", "VARCHAR(400)")):
+            if column not in contact_columns:
+                with engine.connect() as conn:
+                    conn.execute(text(f"ALTER TABLE contacts ADD COLUMN {column} {ddl}"))
+                    conn.commit()
+                logger.info(f"Migration: added {column} column to contacts")
+        for index in Contact.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text("SELECT id, name, company, internal_extension, external_number FROM contacts "
+                     "WHERE search_text IS NULL")
+            ).all()
+            updates = [{"_id": r[0], "number_key": contact_number_key(r[4], r[3]),
+                        "search_text": search_text(r[1], r[2], r[3], r[4])} for r in rows]
+            if updates:
+                conn.execute(
+                    text("UPDATE contacts SET number_key = :number_key, search_text = :search_text WHERE id = :_id"),
+                    updates
+                )
+                logger.info(f"Migration: set number_key/search_text for {len(updates)} contacts")
+    except Exception as e:
+        logger.warning(f"Migration check for contacts number_key/search_text: {e}")
+
+    # Migrate: contact search indexes (PostgreSQL: trigram GIN for substrings, C-collated btree for prefix/order)
+    if engine.dialect.name == "postgresql":
+        try:
+            from sqlalchemy import text
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_contacts_search_trgm "
+                                  "ON contacts USING gin (search_text gin_trgm_ops)"))
+                conn.execute(text('CREATE INDEX IF NOT EXISTS ix_contacts_search_order '
+                                  'ON contacts ((search_text COLLATE "C"), id)'))
+        except Exception as e:
+            logger.warning(f"Migration check for contact search indexes: {e}")
+
+    # Migrate: keyset pagination indexes on voicemail_records
+    try:
+        for index in voicemail.VoicemailRecord.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        logger.warning(f"Migration check for voicemail_records indexes: {e}")
+
+    # Migrate: extension_registry mirrors the numbers of peers, ring groups and IVRs
+    db = SessionLocal()
+    try:
+        changed = extension_registry.sync_from_db(db)
+        if changed:
+            logger.info(f"Migration: extension_registry updated ({changed} numbers)")
+    except Exception as e:
+        logger.warning(f"Migration check for extension_registry: {e}")
+    finally:
+        db.close()
+
     # Seed admin user if not exists
     db = SessionLocal()
     try:
@@ -296,11 +394,25 @@ async def lifespan(app: FastAPI):
             write_msmtp_config(smtp_settings)
             logger.info("msmtp config written to Asterisk container")
 
-        # Regenerate voicemail.conf with SMTP settings
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        write_voicemail_config(all_mailboxes, smtp_settings)
-        reload_voicemail()
-        logger.info(f"Voicemail config generated with {len(all_mailboxes)} mailboxes")
+        # PJSIP realtime: write sorcery/extconfig/res_pgsql.conf and rebuild the ps_* tables
+        try:
+            if pjsip_realtime.write_realtime_configs(PJSIP_REALTIME):
+                pjsip_realtime.reload_realtime_configs()
+            if PJSIP_REALTIME:
+                global_codecs, acl_on = pjsip_realtime.load_endpoint_defaults(db)
+                pjsip_realtime.sync_all(db, peers, db.query(SIPTrunk).all(), global_codecs, acl_on)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Failed to sync PJSIP realtime tables: {e}")
+
+        # Render all Asterisk configs (incl. voicemail.conf with SMTP settings) and apply
+        # them as a config generation; only files that differ from disk are reloaded
+        try:
+            generation, _ = config_store.apply_current(db, reason="startup")
+            logger.info(f"Config generation {generation.id} active")
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Failed to apply config generation at startup: {e}")
     finally:
         db.close()
 
@@ -334,14 +446,38 @@ async def lifespan(app: FastAPI):
     dashboard.set_ami_client(ami_client)
     trunks.set_ami_client(ami_client)
     sip_debug_router.set_ami_client(ami_client)
+    trace_store = sip_trace.create_from_env()
+    sip_debug_router.set_trace_store(trace_store)
+    astdb.set_ami_client(ami_client)
     
     # Set broadcast callback
     ami_client.set_broadcast_callback(manager.broadcast)
+
+    # Optional raw event recording for offline debugging/replay
+    recorder = ami_recorder.create_from_env()
+    if recorder:
+        ami_client.set_recorder(recorder)
+        recorder.start_flushing()
+
+    # Config applies run in a background worker and report back via WebSocket
+    config_jobs.start(asyncio.get_running_loop(), manager.broadcast)
+    contact_import.set_broadcast(asyncio.get_running_loop(), manager.broadcast)
+    voicemail_indexer.on_new_message(lambda vm: voicemail_audio.audio_cache.prefetch(vm.file_path))
+    voicemail_indexer.start(manager.broadcast)
+
+    # Push call forwarding / ring timeouts to AstDB whenever AMI (re-)connects
+    ami_client.set_connect_callback(astdb.sync_all_from_db)
     
     # Connect MQTT publisher if not already configured from DB settings
     if not mqtt_publisher.connected and mqtt_publisher.enabled:
         mqtt_publisher.connect()
 
+    # Caller names for live calls and CDRs, needed before the first AMI event
+    try:
+        await asyncio.to_thread(callerid_index.load_from_db)
+    except Exception as e:
+        logger.error(f"Caller-ID index not loaded: {e}")
+
     # Start AMI connection in background
     asyncio.create_task(ami_client.connect())
 
@@ -355,8 +491,16 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down backend...")
     mqtt_publisher.disconnect()
+    await asyncio.to_thread(config_jobs.stop)
+    await loop_monitor.stop()
+    await voicemail_indexer.stop()
     if ami_client:
         await ami_client.disconnect()
+        if ami_client.recorder:
+            ami_client.recorder.close()
+    if trace_store:
+        trace_store.close()
+    await async_engine.dispose()
     logger.info("Shutdown complete")
 
 
@@ -368,6 +512,13 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Request latency histograms for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Per-request profiling (X-Profile header), only installed when a token is configured
+if profiler.PROFILE_REQUEST_TOKEN:
+    app.add_middleware(profiler.RequestProfilerMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -390,9 +541,12 @@ app.include_router(callforward.router, prefix="/api/callforward", tags=["Call Fo
 app.include_router(groups.router, prefix="/api/groups", tags=["Ring Groups"])
 app.include_router(ivr.router, prefix="/api/ivr", tags=["IVR"])
 app.include_router(contacts.router, prefix="/api/contacts", tags=["Contacts"])
+app.include_router(phonebook_router.router, prefix="/api/phonebook", tags=["Phonebook"])
 app.include_router(settings_router.router, prefix="/api/settings", tags=["Settings"])
 app.include_router(audit_router.router, prefix="/api/audit", tags=["Audit"])
 app.include_router(sip_debug_router.router, prefix="/api/sip-debug", tags=["SIP Debug"])
+app.include_router(configs_router.router, prefix="/api/configs", tags=["Config Generations"])
+app.include_router(diagnostics_router.router, prefix="/api/diagnostics", tags=["Diagnostics"])
 
 
 # Root endpoint
@@ -407,6 +561,15 @@ async def root():
     }
 
 
+# Prometheus metrics
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics(request: Request, token: str = Query(None), authorization: str = Header(None)):
+    """Prometheus text format; needs METRICS_TOKEN, or a loopback client if none is set"""
+    if not metrics.check_token(authorization, token, request.client.host if request.client else None):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # Health check
 @app.get("/api/health")
 async def health_check():
@@ -513,11 +676,11 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(None)):
         
         if ami_client:
             calls = await ami_client.get_active_channels()
-            await websocket.send_json({
+            await websocket.send_text(json.dumps({
                 "type": "active_calls",
                 "active_calls": calls,
                 "timestamp": datetime.utcnow().isoformat()
-            })
+            }, default=str))
         
         while True:
             data = await websocket.receive_text()
@@ -0,0 +1,267 @@
+"""
+Prometheus Metrics
+Minimal in-process counters, gauges and histograms rendered in the Prometheus
+text exposition format at /metrics - no client library or collector needed,
+`curl localhost:8000/metrics` works for local testing. Without METRICS_TOKEN
+only loopback clients are served.
+All metric objects are thread-safe; the hot-path cost is one lock and a dict lookup.
+"""
+import abc
+import hmac
+import ipaddress
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+_registry: list = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abc.abstractmethod
+    def _samples(self) -> list:
+        """The sample lines of this metric."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Evaluate function at scrape time instead of storing a value."""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def _samples(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> list:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                le = 'le="{}"'.format(_format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+def _is_loopback(host: Optional[str]) -> bool:
+    try:
+        return ipaddress.ip_address(host or "").is_loopback
+    except ValueError:
+        return False
+
+
+def check_token(authorization: Optional[str], token: Optional[str], client_host: Optional[str]) -> bool:
+    """With METRICS_TOKEN set, /metrics needs it (Bearer header or ?token=); without, only loopback clients get in."""
+    if not METRICS_TOKEN:
+        return _is_loopback(client_host)
+    if token and hmac.compare_digest(token, METRICS_TOKEN):
+        return True
+    return bool(authorization) and hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}")
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware recording request latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope.get("method", ""),
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            )
+
+
+# ==================== Metric definitions ====================
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "gonopbx_http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"))
+
+AMI_EVENTS = Counter(
+    "gonopbx_ami_events_total", "AMI events received by event type", ("event",))
+AMI_ACTION_SECONDS = Histogram(
+    "gonopbx_ami_action_duration_seconds", "AMI action round-trip latency", ("action",), buckets=FAST_BUCKETS)
+AMI_ACTION_TIMEOUTS = Counter(
+    "gonopbx_ami_action_timeouts_total", "AMI actions that hit their timeout", ("action",))
+AMI_ACTIONS_INFLIGHT = Gauge(
+    "gonopbx_ami_actions_inflight", "AMI actions currently waiting for a response")
+AMI_ACTIONS_INFLIGHT.set(0)
+AMI_CIRCUIT_OPEN = Gauge(
+    "gonopbx_ami_circuit_open", "1 while the AMI action circuit breaker rejects actions")
+AMI_CIRCUIT_OPEN.set(0)
+
+WEBSOCKET_CLIENTS = Gauge(
+    "gonopbx_websocket_clients", "Connected WebSocket clients")
+WEBSOCKET_SEND_PENDING = Gauge(
+    "gonopbx_websocket_send_pending", "WebSocket messages currently being sent (send queue depth)")
+WEBSOCKET_SEND_PENDING.set(0)
+
+CDR_WRITE_SECONDS = Histogram(
+    "gonopbx_cdr_write_duration_seconds", "Latency of writing one CDR row", buckets=FAST_BUCKETS)
+
+CONFIG_RENDER_SECONDS = Histogram(
+    "gonopbx_config_render_duration_seconds", "Time to render one config file from the database", ("file",),
+    buckets=FAST_BUCKETS)
+CONFIG_RELOAD_SECONDS = Histogram(
+    "gonopbx_config_reload_duration_seconds", "Duration of the copy+reload step that included the file", ("file",))
+CONFIG_APPLY_SECONDS = Histogram(
+    "gonopbx_config_apply_duration_seconds", "Duration of a config job (render, store, publish, reload)",
+    ("action", "status"))
+
+SIP_DEBUG_MESSAGES = Gauge(
+    "gonopbx_sip_debug_buffer_messages", "SIP messages held in the debug buffer")
+SIP_DEBUG_BYTES = Gauge(
+    "gonopbx_sip_debug_buffer_bytes", "Memory accounted to the SIP debug buffer (compressed)")
+
+DB_POOL_CHECKOUT_WAIT_SECONDS = Histogram(
+    "gonopbx_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection", ("pool",),
+    buckets=FAST_BUCKETS)
+DB_POOL_CHECKED_OUT = Gauge(
+    "gonopbx_db_pool_checked_out", "DB connections currently checked out", ("pool",))
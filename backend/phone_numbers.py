@@ -0,0 +1,36 @@
+"""
+Phone Number Normalization
+Turns the many ways numbers are written in address books ("030 123-45",
+"+49 (0)30 12345", "0049 30 12345") into one comparable key: E.164 with a
+leading "+" for external numbers, plain digits for short internal numbers.
+National numbers get DEFAULT_COUNTRY_CODE.
+"""
+import os
+import re
+from typing import Optional
+
+DEFAULT_COUNTRY_CODE = os.getenv("DEFAULT_COUNTRY_CODE", "49")
+
+_NON_DIGITS = re.compile(r"\D")
+_TRUNK_PREFIX = re.compile(r"\(0\)")
+
+
+def normalize_number(raw: Optional[str], country_code: str = DEFAULT_COUNTRY_CODE) -> Optional[str]:
+    if not raw:
+        return None
+    value = _TRUNK_PREFIX.sub("", raw.strip())
+    digits = _NON_DIGITS.sub("", value)
+    if not digits:
+        return None
+    if value.startswith("+"):
+        return "+" + digits
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    if digits.startswith("0"):
+        return "+" + country_code + digits[1:]
+    return digits
+
+
+def contact_number_key(external_number: Optional[str], internal_extension: Optional[str] = None) -> Optional[str]:
+    """Deduplication/lookup key of a contact: its external number, else its extension."""
+    return normalize_number(external_number) or normalize_number(internal_extension)
@@ -0,0 +1,114 @@
+"""
+Remote Phonebook
+Renders the global and per-extension address books for desk phones
+(Yealink and Snom XML, CSV). Rendered documents are cached with their ETag
+per address book and format; contact changes invalidate the affected book,
+and the next poll renders it once. Phones re-validate with If-None-Match,
+so unchanged polls never touch the database.
+Phones authenticate with a per-book token (HMAC of PHONEBOOK_SECRET, which
+defaults to JWT_SECRET), so a phone's URL only opens its own book.
+"""
+import asyncio
+import csv
+import hashlib
+import hmac
+import io
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from auth import JWT_SECRET
+from database import SessionLocal, Contact
+
+PHONEBOOK_SECRET = os.getenv("PHONEBOOK_SECRET", "") or JWT_SECRET
+FORMATS = {
+    "yealink.xml": "application/xml; charset=utf-8",
+    "snom.xml": "application/xml; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+}
+
+_lock = threading.Lock()
+_generations: Dict[Optional[str], int] = {}
+# (owner_extension, format) -> (generation, etag, body)
+_cache: Dict[Tuple[Optional[str], str], Tuple[int, str, bytes]] = {}
+_render_locks: Dict[Tuple[Optional[str], str], asyncio.Lock] = {}
+
+
+def book_token(owner_extension: Optional[str]) -> str:
+    book = f"phonebook:{owner_extension or 'global'}"
+    return hmac.new(PHONEBOOK_SECRET.encode(), book.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def check_token(owner_extension: Optional[str], token: Optional[str]) -> bool:
+    return bool(token) and hmac.compare_digest(token, book_token(owner_extension))
+
+
+def invalidate(owner_extension: Optional[str]):
+    """Mark the book of owner_extension (None = global) as changed."""
+    with _lock:
+        _generations[owner_extension] = _generations.get(owner_extension, 0) + 1
+
+
+async def get_document(owner_extension: Optional[str], fmt: str) -> Tuple[str, bytes]:
+    """(etag, body) of a book, rendered at most once per change."""
+    key = (owner_extension, fmt)
+    cached = _cache.get(key)
+    if cached and cached[0] == _generations.get(owner_extension, 0):
+        return cached[1], cached[2]
+    lock = _render_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        generation = _generations.get(owner_extension, 0)
+        cached = _cache.get(key)
+        if cached and cached[0] == generation:
+            return cached[1], cached[2]
+        body = await asyncio.to_thread(render, owner_extension, fmt)
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        _cache[key] = (generation, etag, body)
+        return etag, body
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def render(owner_extension: Optional[str], fmt: str) -> bytes:
+    db = SessionLocal()
+    try:
+        owner = Contact.owner_extension.is_(None) if owner_extension is None else Contact.owner_extension == owner_extension
+        rows = db.query(Contact.name, Contact.company, Contact.internal_extension, Contact.external_number) \
+            .filter(owner).order_by(Contact.name.asc()).all()
+    finally:
+        db.close()
+    title = "Telefonbuch" if owner_extension is None else f"Telefonbuch {owner_extension}"
+    if fmt == "csv":
+        return _render_csv(rows)
+    root = "YealinkIPPhoneDirectory" if fmt == "yealink.xml" else "SnomIPPhoneDirectory"
+    return _render_xml(root, title, rows)
+
+
+def _render_xml(root: str, title: str, rows) -> bytes:
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>', f"<{root}>", f"<Title>{escape(title)}</Title>"]
+    for name, company, internal, external in rows:
+        numbers = [n for n in (internal, external) if n]
+        if not numbers:
+            continue
+        label = f"{name} ({company})" if company else name
+        parts.append("<DirectoryEntry>")
+        parts.append(f"<Name>{escape(label)}</Name>")
+        parts.extend(f"<Telephone>{escape(number)}</Telephone>" for number in numbers)
+        parts.append("</DirectoryEntry>")
+    parts.append(f"</{root}>")
+    return "\n".join(parts).encode()
+
+
+def _render_csv(rows) -> bytes:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["name", "company", "internal_extension", "external_number"])
+    for name, company, internal, external in rows:
+        writer.writerow([name or "", company or "", internal or "", external or ""])
+    return output.getvalue().encode()
@@ -51,11 +51,18 @@ def _detect_external_ip() -> str:
 EXTERNAL_IP = _detect_external_ip()
 SIP_PORT = os.getenv("SIP_PORT", "5060")
 
+# Realtime mode: endpoints, auths and aors live in the ps_* tables (see pjsip_realtime.py)
+# and pjsip.conf only keeps transports, templates, registrations and identifies.
+PJSIP_REALTIME = os.getenv("PJSIP_REALTIME", "").strip().lower() in ("1", "true", "yes")
+
 DEFAULT_CODECS = "ulaw,alaw,g722,opus"
 
 
-def generate_pjsip_config(peers: List[SIPPeer], global_codecs: str = DEFAULT_CODECS, acl_enabled: bool = False) -> str:
-    """Generate complete pjsip.conf content"""
+def generate_pjsip_config(peers: List[SIPPeer], global_codecs: str = DEFAULT_CODECS, acl_enabled: bool = False,
+                          realtime: bool = False) -> str:
+    """Generate complete pjsip.conf content.
+    realtime: if True, peers are served from the ps_* tables and not rendered here
+    """
 
     # Build allow lines from global codecs
     codec_list = [c.strip() for c in global_codecs.split(",") if c.strip()]
@@ -111,6 +118,9 @@ qualify_frequency=60
 ; === Peers ===
 """
 
+    if realtime:
+        return config + "; peers are loaded from the ps_endpoints/ps_auths/ps_aors realtime tables\n"
+
     for peer in peers:
         if peer.enabled:
             # Per-peer codec override
@@ -141,39 +151,65 @@ password={peer.secret}
     return config
 
 
-def generate_trunk_config(trunk: SIPTrunk, skip_identify: bool = False) -> str:
-    """Generate PJSIP config section for a single SIP trunk.
-    skip_identify: if True, omit the identify section (another trunk already matches this server)
-    """
-    tid = trunk.id
-    config = f"\n; --- Trunk: {trunk.name} (ID {tid}) ---\n"
-
-    transport_line = ""
-    from_domain = trunk.sip_server
-    client_domain = trunk.sip_server
-    from_user_line = ""
-    auth_realm_line = ""
-    contact_user = trunk.username
+def trunk_settings(trunk: SIPTrunk) -> dict:
+    """Provider specific transport/domain settings of a trunk, shared by the
+    pjsip.conf and realtime generators."""
+    settings = {
+        "transport": "",
+        "from_domain": trunk.sip_server,
+        "client_domain": trunk.sip_server,
+        "from_user": "",
+        "realm": "",
+        "contact_user": trunk.username,
+    }
     if getattr(trunk, "from_user", None):
         from_user_value = trunk.from_user.strip()
         if from_user_value:
-            from_user_line = f"\nfrom_user={from_user_value}"
-            contact_user = from_user_value
+            settings["from_user"] = from_user_value
+            settings["contact_user"] = from_user_value
     if trunk.provider == "telekom_deutschlandlan":
-        transport_line = "\ntransport=transport-tcp"
-        from_domain = "sip-trunk.telekom.de"
-        client_domain = "sip-trunk.telekom.de"
+        settings["transport"] = "transport-tcp"
+        settings["from_domain"] = "sip-trunk.telekom.de"
+        settings["client_domain"] = "sip-trunk.telekom.de"
     if trunk.provider == "telekom_companyflex":
-        transport_line = "\ntransport=transport-tcp"
-        from_domain = "tel.t-online.de"
-        client_domain = "tel.t-online.de"
+        settings["transport"] = "transport-tcp"
+        settings["from_domain"] = "tel.t-online.de"
+        settings["client_domain"] = "tel.t-online.de"
     if trunk.provider == "telekom_allip":
-        transport_line = "\ntransport=transport-tcp"
-        from_domain = "tel.t-online.de"
-        client_domain = "tel.t-online.de"
-        auth_realm_line = "\nrealm=tel.t-online.de"
+        settings["transport"] = "transport-tcp"
+        settings["from_domain"] = "tel.t-online.de"
+        settings["client_domain"] = "tel.t-online.de"
+        settings["realm"] = "tel.t-online.de"
+    return settings
+
 
-    if trunk.auth_mode == "registration":
+def generate_trunk_config(trunk: SIPTrunk, skip_identify: bool = False, realtime: bool = False) -> str:
+    """Generate PJSIP config section for a single SIP trunk.
+    skip_identify: if True, omit the identify section (another trunk already matches this server)
+    realtime: if True, only render registration and identify (endpoint/auth/aor are in ps_* tables)
+    """
+    tid = trunk.id
+    config = f"\n; --- Trunk: {trunk.name} (ID {tid}) ---\n"
+
+    ts = trunk_settings(trunk)
+    transport_line = f"\ntransport={ts['transport']}" if ts["transport"] else ""
+    from_domain = ts["from_domain"]
+    client_domain = ts["client_domain"]
+    from_user_line = f"\nfrom_user={ts['from_user']}" if ts["from_user"] else ""
+    auth_realm_line = f"\nrealm={ts['realm']}" if ts["realm"] else ""
+    contact_user = ts["contact_user"]
+
+    if realtime:
+        if trunk.auth_mode == "registration":
+            config += f"""
+[trunk-{tid}]
+type=registration
+outbound_auth=trunk-auth-{tid}
+server_uri=sip:{trunk.sip_server}
+client_uri=sip:{contact_user}@{client_domain}
+contact_user={contact_user}
+"""
+    elif trunk.auth_mode == "registration":
         config += f"""
 [trunk-{tid}]
 type=registration
@@ -240,23 +276,29 @@ match={trunk.sip_server}
 
     return config
 
-    return config
+
+def build_pjsip_config(peers: List[SIPPeer], trunks: List[SIPTrunk] = None, global_codecs: str = DEFAULT_CODECS, acl_enabled: bool = False) -> str:
+    """Generate pjsip.conf content including all trunks"""
+    config_content = generate_pjsip_config(peers, global_codecs, acl_enabled=acl_enabled, realtime=PJSIP_REALTIME)
+
+    if trunks:
+        config_content += "\n; === SIP Trunks ===\n"
+        # Track which SIP servers already have an identify section
+        # to avoid duplicate matches (multiple trunks from same provider)
+        seen_servers: set = set()
+        for trunk in trunks:
+            if trunk.enabled:
+                config_content += generate_trunk_config(trunk, skip_identify=trunk.sip_server in seen_servers,
+                                                        realtime=PJSIP_REALTIME)
+                seen_servers.add(trunk.sip_server)
+
+    return config_content
 
 
 def write_pjsip_config(peers: List[SIPPeer], trunks: List[SIPTrunk] = None, global_codecs: str = DEFAULT_CODECS, acl_enabled: bool = False) -> bool:
     """Write PJSIP config to file"""
     try:
-        config_content = generate_pjsip_config(peers, global_codecs, acl_enabled=acl_enabled)
-
-        if trunks:
-            config_content += "\n; === SIP Trunks ===\n"
-            # Track which SIP servers already have an identify section
-            # to avoid duplicate matches (multiple trunks from same provider)
-            seen_servers: set = set()
-            for trunk in trunks:
-                if trunk.enabled:
-                    config_content += generate_trunk_config(trunk, skip_identify=trunk.sip_server in seen_servers)
-                    seen_servers.add(trunk.sip_server)
+        config_content = build_pjsip_config(peers, trunks, global_codecs, acl_enabled)
 
         os.makedirs(os.path.dirname(PJSIP_CONFIG_PATH), exist_ok=True)
 
@@ -0,0 +1,246 @@
+"""
+PJSIP Realtime Sync
+Optional mode (PJSIP_REALTIME=true) in which Asterisk loads endpoints, auths and
+aors on demand from the ps_* tables via res_config_pgsql, so adding or changing
+a peer is a row upsert instead of a pjsip.conf rewrite plus `pjsip reload`.
+Registrations and identifies of trunks stay in pjsip.conf.
+"""
+import os
+import logging
+import subprocess
+from typing import List, Tuple
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from database import DATABASE_URL, SIPPeer, SIPTrunk, SystemSettings, PsEndpoint, PsAuth, PsAor
+from pjsip_config import DEFAULT_CODECS, trunk_settings
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = "/etc/asterisk/custom"
+REALTIME_FILES = ("sorcery.conf", "extconfig.conf", "res_pgsql.conf")
+
+
+def load_endpoint_defaults(db: Session) -> Tuple[str, bool]:
+    """Return (global_codecs, acl_enabled) from system settings."""
+    setting = db.query(SystemSettings).filter(SystemSettings.key == "global_codecs").first()
+    global_codecs = setting.value if setting else DEFAULT_CODECS
+    acl_setting = db.query(SystemSettings).filter(SystemSettings.key == "ip_whitelist_enabled").first()
+    acl_on = acl_setting is not None and acl_setting.value == "true"
+    return global_codecs, acl_on
+
+
+def _peer_rows(peer: SIPPeer, global_codecs: str, acl_enabled: bool) -> Tuple[dict, dict, dict]:
+    """Build ps_endpoints/ps_auths/ps_aors values for a peer.
+    Mirrors the endpoint-basic/auth-basic/aor-basic templates of pjsip.conf."""
+    ext = peer.extension
+    codecs = peer.codecs or global_codecs
+    pg = (peer.pickup_group or "").strip() or None
+    endpoint = {
+        "id": ext,
+        "transport": None,
+        "aors": ext,
+        "auth": f"auth{ext}",
+        "outbound_auth": None,
+        "context": "internal",
+        "disallow": "all",
+        "allow": ",".join(c.strip() for c in codecs.split(",") if c.strip()),
+        "direct_media": "no",
+        "rtp_symmetric": "yes",
+        "force_rport": "yes",
+        "rewrite_contact": "yes",
+        "ice_support": "yes",
+        "callerid": f'"{peer.caller_id or ext}" <{ext}>',
+        "language": "de",
+        "call_group": pg,
+        "pickup_group": pg,
+        "acl": "registration-whitelist" if acl_enabled else None,
+        "from_domain": None,
+        "from_user": None,
+    }
+    auth = {"id": f"auth{ext}", "auth_type": "userpass", "username": ext, "password": peer.secret, "realm": None}
+    aor = {"id": ext, "contact": None, "max_contacts": 5, "remove_existing": "yes", "qualify_frequency": 60}
+    return endpoint, auth, aor
+
+
+def _trunk_rows(trunk: SIPTrunk) -> Tuple[dict, dict | None, dict]:
+    """Build ps_endpoints/ps_auths/ps_aors values for a trunk (auth is None for IP auth)."""
+    tid = trunk.id
+    ts = trunk_settings(trunk)
+    registration = trunk.auth_mode == "registration"
+    endpoint = {
+        "id": f"trunk-ep-{tid}",
+        "transport": ts["transport"] or None,
+        "aors": f"trunk-aor-{tid}",
+        "auth": None,
+        "outbound_auth": f"trunk-auth-{tid}" if registration else None,
+        "context": trunk.context,
+        "disallow": "all",
+        "allow": trunk.codecs,
+        "direct_media": "no",
+        "rtp_symmetric": "yes",
+        "force_rport": "yes",
+        "rewrite_contact": "yes",
+        "ice_support": None,
+        "callerid": None,
+        "language": "de",
+        "call_group": None,
+        "pickup_group": None,
+        "acl": None,
+        "from_domain": ts["from_domain"],
+        "from_user": ts["from_user"] or None,
+    }
+    auth = None
+    if registration:
+        auth = {"id": f"trunk-auth-{tid}", "auth_type": "userpass", "username": trunk.username,
+                "password": trunk.password, "realm": ts["realm"] or None}
+    aor = {"id": f"trunk-aor-{tid}", "contact": f"sip:{trunk.sip_server}", "max_contacts": None,
+           "remove_existing": None, "qualify_frequency": 60}
+    return endpoint, auth, aor
+
+
+def _upsert(db: Session, model, values: dict):
+    row = db.get(model, values["id"])
+    if row is None:
+        db.add(model(**values))
+    else:
+        for key, value in values.items():
+            setattr(row, key, value)
+
+
+def _delete(db: Session, model, object_id: str):
+    row = db.get(model, object_id)
+    if row is not None:
+        db.delete(row)
+
+
+def upsert_peer(db: Session, peer: SIPPeer, global_codecs: str, acl_enabled: bool):
+    """Write (or remove, if disabled) the realtime rows of one peer. Caller commits."""
+    if not peer.enabled:
+        delete_peer(db, peer.extension)
+        return
+    endpoint, auth, aor = _peer_rows(peer, global_codecs, acl_enabled)
+    _upsert(db, PsEndpoint, endpoint)
+    _upsert(db, PsAuth, auth)
+    _upsert(db, PsAor, aor)
+
+
+def delete_peer(db: Session, extension: str):
+    """Remove the realtime rows of one peer. Caller commits."""
+    _delete(db, PsEndpoint, extension)
+    _delete(db, PsAuth, f"auth{extension}")
+    _delete(db, PsAor, extension)
+
+
+def sync_trunks(db: Session, trunks: List[SIPTrunk]):
+    """Replace all trunk rows with the given trunks. Caller commits."""
+    db.query(PsEndpoint).filter(PsEndpoint.id.like("trunk-ep-%")).delete()
+    db.query(PsAuth).filter(PsAuth.id.like("trunk-auth-%")).delete()
+    db.query(PsAor).filter(PsAor.id.like("trunk-aor-%")).delete()
+    for trunk in trunks:
+        if not trunk.enabled:
+            continue
+        endpoint, auth, aor = _trunk_rows(trunk)
+        db.add(PsEndpoint(**endpoint))
+        if auth:
+            db.add(PsAuth(**auth))
+        db.add(PsAor(**aor))
+
+
+def sync_all(db: Session, peers: List[SIPPeer], trunks: List[SIPTrunk], global_codecs: str, acl_enabled: bool):
+    """Rebuild all ps_* rows from the peer and trunk tables and commit.
+    Used at startup and when global codecs or the IP whitelist change."""
+    db.query(PsEndpoint).delete()
+    db.query(PsAuth).delete()
+    db.query(PsAor).delete()
+    for peer in peers:
+        if peer.enabled:
+            endpoint, auth, aor = _peer_rows(peer, global_codecs, acl_enabled)
+            db.add(PsEndpoint(**endpoint))
+            db.add(PsAuth(**auth))
+            db.add(PsAor(**aor))
+    sync_trunks(db, trunks)
+    db.commit()
+    logger.info(f"PJSIP realtime tables synced with {len(peers)} peers, {len(trunks)} trunks")
+
+
+def generate_realtime_configs(enabled: bool) -> dict:
+    """Generate sorcery.conf, extconfig.conf and res_pgsql.conf.
+    With realtime disabled the files carry no mappings, so Asterisk falls back to pjsip.conf."""
+    header = "; Auto-generated by GonoPBX - PJSIP realtime is {}\n".format("enabled" if enabled else "disabled")
+    if not enabled:
+        return {name: header for name in REALTIME_FILES}
+
+    url = make_url(DATABASE_URL)
+    return {
+        "sorcery.conf": header + """
+[res_pjsip]
+endpoint=realtime,ps_endpoints
+auth=realtime,ps_auths
+aor=realtime,ps_aors
+""",
+        "extconfig.conf": header + """
+[settings]
+ps_endpoints => pgsql,general
+ps_auths => pgsql,general
+ps_aors => pgsql,general
+""",
+        "res_pgsql.conf": header + f"""
+[general]
+dbhost={url.host or "postgres"}
+dbport={url.port or 5432}
+dbname={url.database}
+dbuser={url.username}
+dbpass={url.password or ""}
+requirements=warn
+""",
+    }
+
+
+def write_realtime_configs(enabled: bool) -> bool:
+    """Write the realtime config files. Returns True if any file changed."""
+    changed = False
+    try:
+        os.makedirs(CONFIG_DIR, exist_ok=True)
+        for name, content in generate_realtime_configs(enabled).items():
+            path = os.path.join(CONFIG_DIR, name)
+            try:
+                with open(path) as f:
+                    if f.read() == content:
+                        continue
+            except FileNotFoundError:
+                pass
+            with open(path, 'w') as f:
+                f.write(content)
+            changed = True
+    except Exception as e:
+        logger.error(f"Failed to write PJSIP realtime config: {e}")
+        return False
+    if changed:
+        logger.info(f"PJSIP realtime config written (realtime {'enabled' if enabled else 'disabled'})")
+    return changed
+
+
+def reload_realtime_configs() -> bool:
+    """Copy the realtime config files into the Asterisk container and reload the database driver.
+    The sorcery mapping itself is only re-read when res_pjsip loads, so switching the mode
+    takes effect after the next Asterisk restart."""
+    files = " ".join(f"/etc/asterisk/custom/{name}" for name in REALTIME_FILES)
+    try:
+        result = subprocess.run(
+            ['docker', 'exec', 'pbx_asterisk', 'sh', '-c',
+             f'cp {files} /etc/asterisk/ && asterisk -rx "module reload res_config_pgsql.so"'],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+        if result.returncode == 0:
+            logger.warning("PJSIP realtime config changed - restart Asterisk to apply the sorcery mapping")
+            return True
+        else:
+            logger.error(f"PJSIP realtime reload failed: {result.stderr}")
+            return False
+    except Exception as e:
+        logger.error(f"Failed to reload PJSIP realtime config: {e}")
+        return False
@@ -0,0 +1,151 @@
+"""
+Sampling Profiler
+Statistical stack sampler for production use: a daemon thread snapshots the
+stacks of all threads (including the event loop thread) via sys._current_frames()
+at a fixed interval and aggregates them into collapsed stacks
+("thread;outer;...;inner count"), the input format of flamegraph.pl and speedscope.
+
+Per-request profiling is opt-in: only when PROFILE_REQUEST_TOKEN is set, the
+middleware is installed and profiles requests carrying `X-Profile: <token>`.
+Without the token nothing is sampled and no middleware runs.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Optional
+
+PROFILE_REQUEST_TOKEN = os.getenv("PROFILE_REQUEST_TOKEN", "")
+PROFILE_HEADER = b"x-profile"
+MAX_REQUEST_PROFILES = 20
+MAX_STACK_DEPTH = 128
+
+# Leaf frames of threads that are only waiting (loop selector, idle worker threads)
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+_request_profiles: "OrderedDict[str, dict]" = OrderedDict()
+_request_lock = threading.Lock()
+
+
+class StackSampler:
+    """Samples the stacks of all threads until stop() is called."""
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False, loop_thread_id: Optional[int] = None):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.loop_thread_id = loop_thread_id
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._started = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+        return self.stacks
+
+    def _thread_name(self, ident: int, names: dict) -> str:
+        if ident == self.loop_thread_id:
+            return "event-loop"
+        return names.get(ident, f"thread-{ident}")
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_id:
+                    continue
+                frames = []
+                while frame is not None and len(frames) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    frames.append((os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                if not frames or (not self.include_idle and frames[0] in IDLE_LEAVES):
+                    continue
+                stack = ";".join(f"{func} ({filename})" for filename, func in reversed(frames))
+                self.stacks[f"{self._thread_name(ident, names)};{stack}"] += 1
+            self.samples += 1
+            if self._stop.wait(self.interval):
+                break
+
+
+def collapsed(stacks: Counter) -> str:
+    """Collapsed-stack text, heaviest stacks first."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def get_request_profile(profile_id: str) -> Optional[dict]:
+    with _request_lock:
+        return _request_profiles.get(profile_id)
+
+
+def list_request_profiles() -> list:
+    with _request_lock:
+        return [
+            {key: value for key, value in profile.items() if key != "stacks"}
+            for profile in reversed(_request_profiles.values())
+        ]
+
+
+def _store_request_profile(profile: dict):
+    with _request_lock:
+        _request_profiles[profile["id"]] = profile
+        while len(_request_profiles) > MAX_REQUEST_PROFILES:
+            _request_profiles.popitem(last=False)
+
+
+class RequestProfilerMiddleware:
+    """ASGI middleware profiling single requests that send `X-Profile: <PROFILE_REQUEST_TOKEN>`.
+    The profile id is returned in the X-Profile-Id response header. Samples cover all
+    threads, so concurrent requests show up as well."""
+
+    def __init__(self, app):
+        self.app = app
+        self.token = PROFILE_REQUEST_TOKEN.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (PROFILE_HEADER, self.token) not in scope.get("headers", ()):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:12]
+        sampler = StackSampler(interval=0.001, loop_thread_id=threading.get_ident()).start()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            stacks = sampler.stop()
+            _store_request_profile({
+                "id": profile_id,
+                "method": scope.get("method", ""),
+                "path": scope.get("path", ""),
+                "status": status["code"],
+                "duration_ms": round(sampler.duration * 1000, 1),
+                "samples": sampler.samples,
+                "stacks": stacks,
+            })
@@ -9,11 +9,10 @@ from pydantic import BaseModel
 from datetime import datetime
 import logging
 
-from database import get_db, CallForward, SIPPeer, SIPTrunk, RingGroup, IVRMenu, User, VoicemailMailbox
-from dialplan import write_extensions_config, reload_dialplan
-from database import InboundRoute
+from database import get_db, CallForward, SIPPeer, User
 from auth import get_current_user
 from audit import log_action
+import astdb
 
 logger = logging.getLogger(__name__)
 
@@ -50,22 +49,13 @@ class CallForwardResponse(CallForwardBase):
 VALID_FORWARD_TYPES = {"unconditional", "busy", "no_answer"}
 
 
-def regenerate_dialplan(db: Session):
-    """Regenerate dialplan after forwarding changes"""
-    try:
-        all_routes = db.query(InboundRoute).filter(InboundRoute.enabled == True).all()
-        all_forwards = db.query(CallForward).filter(CallForward.enabled == True).all()
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        all_groups = db.query(RingGroup).all()
-        all_ivr = db.query(IVRMenu).all()
-        write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-        reload_dialplan()
-        logger.info("Dialplan regenerated after call forward change")
-    except Exception as e:
-        logger.error(f"Failed to regenerate dialplan: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+def sync_forwards(db: Session, extension: str):
+    """Publish forwarding rules of an extension to AstDB (no dialplan reload needed)"""
+    forwards = db.query(CallForward).filter(CallForward.extension == extension).all()
+    if astdb.run_sync(astdb.sync_call_forwards, extension, forwards):
+        logger.info(f"AstDB call forwards synced for {extension}")
+    else:
+        logger.warning(f"AstDB call forwards for {extension} not synced, will retry on next AMI connect")
 
 
 @router.get("/by-extension/{extension}", response_model=List[CallForwardResponse])
@@ -112,7 +102,7 @@ def create_forward(
     log_action(db, current_user.username, "callforward_created", "callforward", forward.extension,
                {"type": forward.forward_type, "destination": forward.destination},
                request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    sync_forwards(db, forward.extension)
 
     return db_forward
 
@@ -140,7 +130,7 @@ def update_forward(
     logger.info(f"Updated call forward #{forward_id}")
     log_action(db, current_user.username, "callforward_updated", "callforward", str(forward_id),
                None, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    sync_forwards(db, db_forward.extension)
 
     return db_forward
 
@@ -164,6 +154,6 @@ def delete_forward(
     logger.info(f"Deleted call forward: {ext} ({ftype})")
     log_action(db, current_user.username, "callforward_deleted", "callforward", ext,
                {"type": ftype}, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    sync_forwards(db, ext)
 
     return {"status": "deleted"}
@@ -4,13 +4,13 @@ Call history and statistics
 """
 
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from typing import List, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel
 
-from database import get_db, CDR, User
+from database import get_async_db, CDR, User
 from auth import get_current_user
 
 router = APIRouter()
@@ -49,6 +49,20 @@ class CDRStatsResponse(BaseModel):
     calls_this_month: int
 
 
+def _apply_filters(stmt, src, dst, disposition, date_from, date_to):
+    if src:
+        stmt = stmt.where(CDR.src.ilike(f"%{src}%"))
+    if dst:
+        stmt = stmt.where(CDR.dst.ilike(f"%{dst}%"))
+    if disposition:
+        stmt = stmt.where(CDR.disposition == disposition.upper())
+    if date_from:
+        stmt = stmt.where(CDR.call_date >= date_from)
+    if date_to:
+        stmt = stmt.where(CDR.call_date <= date_to)
+    return stmt
+
+
 @router.get("/", response_model=List[CDRResponse])
 async def list_cdr(
     limit: int = Query(50, ge=1, le=500),
@@ -59,27 +73,15 @@ async def list_cdr(
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get call detail records with optional filters"""
     
-    query = db.query(CDR)
-    
-    # Apply filters
-    if src:
-        query = query.filter(CDR.src.ilike(f"%{src}%"))
-    if dst:
-        query = query.filter(CDR.dst.ilike(f"%{dst}%"))
-    if disposition:
-        query = query.filter(CDR.disposition == disposition.upper())
-    if date_from:
-        query = query.filter(CDR.call_date >= date_from)
-    if date_to:
-        query = query.filter(CDR.call_date <= date_to)
+    stmt = _apply_filters(select(CDR), src, dst, disposition, date_from, date_to)
     
     # Order and paginate
-    records = query.order_by(CDR.call_date.desc()).offset(offset).limit(limit).all()
-    return records
+    result = await db.execute(stmt.order_by(CDR.call_date.desc()).offset(offset).limit(limit))
+    return result.scalars().all()
 
 
 @router.get("/count")
@@ -90,28 +92,16 @@ async def count_cdr(
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get total count of CDR records (for pagination)"""
     
-    query = db.query(func.count(CDR.id))
-    
-    if src:
-        query = query.filter(CDR.src.ilike(f"%{src}%"))
-    if dst:
-        query = query.filter(CDR.dst.ilike(f"%{dst}%"))
-    if disposition:
-        query = query.filter(CDR.disposition == disposition.upper())
-    if date_from:
-        query = query.filter(CDR.call_date >= date_from)
-    if date_to:
-        query = query.filter(CDR.call_date <= date_to)
-    
-    return {"count": query.scalar()}
+    stmt = _apply_filters(select(func.count(CDR.id)), src, dst, disposition, date_from, date_to)
+    return {"count": await db.scalar(stmt)}
 
 
 @router.get("/stats", response_model=CDRStatsResponse)
-async def get_cdr_stats(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_cdr_stats(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """Get comprehensive call statistics"""
     
     now = datetime.utcnow()
@@ -119,45 +109,46 @@ async def get_cdr_stats(current_user: User = Depends(get_current_user), db: Sess
     week_start = today_start - timedelta(days=now.weekday())
     month_start = today_start.replace(day=1)
     
-    # Total counts by disposition
-    total_calls = db.query(func.count(CDR.id)).scalar() or 0
-    answered_calls = db.query(func.count(CDR.id)).filter(CDR.disposition == 'ANSWERED').scalar() or 0
-    missed_calls = db.query(func.count(CDR.id)).filter(CDR.disposition == 'NO ANSWER').scalar() or 0
-    busy_calls = db.query(func.count(CDR.id)).filter(CDR.disposition == 'BUSY').scalar() or 0
-    failed_calls = db.query(func.count(CDR.id)).filter(CDR.disposition == 'FAILED').scalar() or 0
-    
-    # Duration stats
-    total_duration = db.query(func.sum(CDR.duration)).scalar() or 0
-    total_billsec = db.query(func.sum(CDR.billsec)).scalar() or 0
-    avg_duration = db.query(func.avg(CDR.duration)).scalar() or 0
-    avg_billsec = db.query(func.avg(CDR.billsec)).filter(CDR.billsec > 0).scalar() or 0
-    
-    # Time-based counts
-    calls_today = db.query(func.count(CDR.id)).filter(CDR.call_date >= today_start).scalar() or 0
-    calls_this_week = db.query(func.count(CDR.id)).filter(CDR.call_date >= week_start).scalar() or 0
-    calls_this_month = db.query(func.count(CDR.id)).filter(CDR.call_date >= month_start).scalar() or 0
+    # All counters in a single round trip (aggregate FILTER clauses)
+    calls = func.count(CDR.id)
+    result = await db.execute(select(
+        calls.label("total_calls"),
+        calls.filter(CDR.disposition == 'ANSWERED').label("answered_calls"),
+        calls.filter(CDR.disposition == 'NO ANSWER').label("missed_calls"),
+        calls.filter(CDR.disposition == 'BUSY').label("busy_calls"),
+        calls.filter(CDR.disposition == 'FAILED').label("failed_calls"),
+        func.sum(CDR.duration).label("total_duration"),
+        func.sum(CDR.billsec).label("total_billsec"),
+        func.avg(CDR.duration).label("avg_duration"),
+        func.avg(CDR.billsec).filter(CDR.billsec > 0).label("avg_billsec"),
+        calls.filter(CDR.call_date >= today_start).label("calls_today"),
+        calls.filter(CDR.call_date >= week_start).label("calls_this_week"),
+        calls.filter(CDR.call_date >= month_start).label("calls_this_month"),
+    ))
+    row = result.one()
     
     return CDRStatsResponse(
-        total_calls=total_calls,
-        answered_calls=answered_calls,
-        missed_calls=missed_calls,
-        busy_calls=busy_calls,
-        failed_calls=failed_calls,
-        total_duration=total_duration,
-        total_billsec=total_billsec,
-        avg_duration=round(avg_duration, 1),
-        avg_billsec=round(avg_billsec, 1),
-        calls_today=calls_today,
-        calls_this_week=calls_this_week,
-        calls_this_month=calls_this_month
+        total_calls=row.total_calls or 0,
+        answered_calls=row.answered_calls or 0,
+        missed_calls=row.missed_calls or 0,
+        busy_calls=row.busy_calls or 0,
+        failed_calls=row.failed_calls or 0,
+        total_duration=row.total_duration or 0,
+        total_billsec=row.total_billsec or 0,
+        avg_duration=round(float(row.avg_duration or 0), 1),
+        avg_billsec=round(float(row.avg_billsec or 0), 1),
+        calls_today=row.calls_today or 0,
+        calls_this_week=row.calls_this_week or 0,
+        calls_this_month=row.calls_this_month or 0
     )
 
 
 @router.get("/recent")
-async def get_recent_calls(limit: int = 10, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_recent_calls(limit: int = 10, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """Get most recent calls for dashboard widget"""
     
-    records = db.query(CDR).order_by(CDR.call_date.desc()).limit(limit).all()
+    result = await db.execute(select(CDR).order_by(CDR.call_date.desc()).limit(limit))
+    records = result.scalars().all()
     
     return {
         "calls": [
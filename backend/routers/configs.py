@@ -0,0 +1,131 @@
+"""
+Config Generations API Router
+Admin-only access to the versioned Asterisk config store: list, apply, rollback and diff,
+plus status of the background config apply jobs
+"""
+import json
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session
+
+from database import get_db, ConfigGeneration, User
+from auth import get_current_user, require_admin
+from audit import log_action
+import config_store
+import config_jobs
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _to_response(generation: ConfigGeneration, active_id: int | None) -> dict:
+    return {
+        "id": generation.id,
+        "content_hash": generation.content_hash,
+        "files": json.loads(generation.manifest),
+        "created_by": generation.created_by,
+        "reason": generation.reason,
+        "created_at": generation.created_at.isoformat() if generation.created_at else None,
+        "active": generation.id == active_id,
+    }
+
+
+def _get_generation(db: Session, generation_id: int) -> ConfigGeneration:
+    generation = db.get(ConfigGeneration, generation_id)
+    if not generation:
+        raise HTTPException(status_code=404, detail="Konfigurationsstand nicht gefunden")
+    return generation
+
+
+@router.get("/")
+def list_generations(
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """List stored config generations, newest first."""
+    active = config_store.get_active_generation(db)
+    active_id = active.id if active else None
+    query = db.query(ConfigGeneration)
+    total = query.count()
+    generations = query.order_by(ConfigGeneration.id.desc()).offset(offset).limit(limit).all()
+    return {
+        "total": total,
+        "active_id": active_id,
+        "generations": [_to_response(g, active_id) for g in generations],
+    }
+
+
+@router.get("/diff")
+def diff_generations(
+    from_id: int = Query(..., alias="from"),
+    to_id: int = Query(..., alias="to"),
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Unified diff per file between two generations."""
+    old = _get_generation(db, from_id)
+    new = _get_generation(db, to_id)
+    return {"from": old.id, "to": new.id, "files": config_store.diff_generations(db, old, new)}
+
+
+@router.get("/jobs")
+def list_jobs(
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+):
+    """Recent config apply jobs, newest first."""
+    return {"jobs": config_jobs.list_jobs(limit)}
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, current_user: User = Depends(get_current_user)):
+    """Status of a single config apply job (queued, running, applied, failed)."""
+    job = config_jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job nicht gefunden")
+    return job
+
+
+@router.get("/{generation_id}")
+def get_generation(
+    generation_id: int,
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Return a generation including the content of all files."""
+    generation = _get_generation(db, generation_id)
+    active = config_store.get_active_generation(db)
+    response = _to_response(generation, active.id if active else None)
+    response["contents"] = config_store.load_files(db, generation)
+    return response
+
+
+@router.post("/apply")
+def apply_generation(
+    request: Request,
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Queue a render of the configuration from the database and apply it."""
+    job = config_jobs.enqueue("manual apply", created_by=current_user.username)
+    log_action(db, current_user.username, "config_applied", "config", job["id"],
+               None, request.client.host if request.client else None)
+    return job
+
+
+@router.post("/{generation_id}/rollback")
+def rollback_generation(
+    generation_id: int,
+    request: Request,
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    """Queue a re-apply of a stored generation as-is (no re-rendering from the database)."""
+    generation = _get_generation(db, generation_id)
+    job = config_jobs.enqueue_rollback(generation.id, created_by=current_user.username)
+    log_action(db, current_user.username, "config_rollback", "config", str(generation.id),
+               None, request.client.host if request.client else None)
+    return job
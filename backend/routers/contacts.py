@@ -5,6 +5,7 @@ Global and per-extension address book
 
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
 from fastapi.responses import Response
+from sqlalchemy import or_, true
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from typing import List, Optional, Literal
@@ -13,6 +14,11 @@ import io
 
 from database import get_db, Contact, SIPPeer, User
 from auth import get_current_user
+from phone_numbers import contact_number_key
+import contact_search
+import contact_import
+import callerid_index
+import phonebook
 
 router = APIRouter()
 
@@ -101,6 +107,57 @@ def list_contacts(
     raise HTTPException(status_code=400, detail="Ungültiger scope")
 
 
+class ContactPage(BaseModel):
+    items: List[ContactOut]
+    next_cursor: Optional[str] = None
+
+
+@router.get("/search", response_model=ContactPage)
+def search_contacts(
+    q: str = Query(..., min_length=1, max_length=100),
+    scope: Literal["global", "extension", "all"] = "global",
+    extension: Optional[str] = None,
+    include_global: bool = True,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Name prefix / substring search over name, company and numbers (see contact_search)"""
+    if scope == "global":
+        _ensure_read_access("global", None, current_user, db)
+        owner_filter = Contact.owner_extension.is_(None)
+    elif scope == "extension":
+        if not extension:
+            raise HTTPException(status_code=400, detail="extension erforderlich")
+        _ensure_read_access("extension", extension, current_user, db)
+        owner_filter = Contact.owner_extension == extension
+        if include_global:
+            owner_filter = or_(owner_filter, Contact.owner_extension.is_(None))
+    else:
+        if current_user.role != "admin":
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Nur Admins dürfen alle Kontakte sehen")
+        owner_filter = true()
+    items, next_cursor = contact_search.search(db, q, owner_filter, limit, cursor)
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/lookup")
+def lookup_caller(
+    number: str = Query(..., min_length=1),
+    extension: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Contact for a phone number from the in-memory caller-ID index"""
+    if extension:
+        _ensure_read_access("extension", extension, current_user, db)
+    contact = callerid_index.index.lookup(number, extension)
+    if not contact:
+        raise HTTPException(status_code=404, detail="Kein Kontakt für diese Nummer")
+    return contact
+
+
 @router.post("/", response_model=ContactOut)
 def create_contact(
     data: ContactCreate,
@@ -125,9 +182,14 @@ def create_contact(
         tag=(data.tag or "").strip() or None,
         note=(data.note or "").strip() or None,
     )
+    contact.number_key = contact_number_key(contact.external_number, contact.internal_extension)
+    contact.search_text = contact_search.search_text(contact.name, contact.company, contact.internal_extension,
+                                                     contact.external_number)
     db.add(contact)
     db.commit()
     db.refresh(contact)
+    callerid_index.index.upsert_contact(contact)
+    phonebook.invalidate(contact.owner_extension)
     return contact
 
 
@@ -156,9 +218,14 @@ def update_contact(
         contact.tag = data.tag.strip() or None
     if data.note is not None:
         contact.note = data.note.strip() or None
+    contact.number_key = contact_number_key(contact.external_number, contact.internal_extension)
+    contact.search_text = contact_search.search_text(contact.name, contact.company, contact.internal_extension,
+                                                     contact.external_number)
 
     db.commit()
     db.refresh(contact)
+    callerid_index.index.upsert_contact(contact)
+    phonebook.invalidate(contact.owner_extension)
     return contact
 
 
@@ -172,12 +239,31 @@ def delete_contact(
     if not contact:
         raise HTTPException(status_code=404, detail="Kontakt nicht gefunden")
     scope = "global" if contact.owner_extension is None else "extension"
-    _ensure_write_access(scope, contact.owner_extension, current_user, db)
+    owner_ext = contact.owner_extension
+    _ensure_write_access(scope, owner_ext, current_user, db)
     db.delete(contact)
     db.commit()
+    callerid_index.index.remove(contact_id)
+    phonebook.invalidate(owner_ext)
     return {"message": "Kontakt gelöscht"}
 
 
+@router.get("/phonebook-urls")
+def get_phonebook_urls(
+    scope: Literal["global", "extension"] = Query("global"),
+    extension: Optional[str] = Query(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Remote phonebook URLs (relative to the API host) to configure on desk phones"""
+    if scope == "extension" and not extension:
+        raise HTTPException(status_code=400, detail="extension erforderlich")
+    owner_ext = extension if scope == "extension" else None
+    _ensure_read_access(scope, owner_ext, current_user, db)
+    params = f"token={phonebook.book_token(owner_ext)}" + (f"&extension={owner_ext}" if owner_ext else "")
+    return {fmt: f"/api/phonebook/{fmt}?{params}" for fmt in phonebook.FORMATS}
+
+
 @router.get("/export")
 def export_contacts(
     scope: Literal["global", "extension"] = Query("global"),
@@ -217,7 +303,7 @@ def export_contacts(
 
 
 @router.post("/import")
-async def import_contacts(
+def import_contacts(
     scope: Literal["global", "extension"] = Query("global"),
     extension: Optional[str] = Query(None),
     file: UploadFile = File(...),
@@ -236,57 +322,18 @@ async def import_contacts(
     if not file.filename.lower().endswith(".csv"):
         raise HTTPException(status_code=400, detail="Nur CSV-Dateien erlaubt")
 
-    raw = await file.read()
-    try:
-        text = raw.decode("utf-8")
-    except UnicodeDecodeError:
-        text = raw.decode("latin-1")
-
-    reader = csv.reader(io.StringIO(text))
-    rows = list(reader)
-    if not rows:
+    size = getattr(file, "size", None)
+    raw = file.file
+    if not raw.read(1):
         raise HTTPException(status_code=400, detail="Leere CSV-Datei")
+    raw.seek(0)
+    # Parsed straight from the spooled upload, batch by batch
+    return contact_import.import_csv(db, raw, owner_ext, total_bytes=size, created_by=current_user.username)
 
-    headers = [h.strip().lower() for h in rows[0]]
-    use_header = "name" in headers
-
-    contacts_created = 0
-    if use_header:
-        dict_reader = csv.DictReader(io.StringIO(text))
-        for row in dict_reader:
-            name = (row.get("name") or "").strip()
-            if not name:
-                continue
-            contact = Contact(
-                owner_extension=owner_ext,
-                name=name,
-                internal_extension=(row.get("internal_extension") or "").strip() or None,
-                external_number=(row.get("external_number") or "").strip() or None,
-                company=(row.get("company") or "").strip() or None,
-                tag=(row.get("tag") or "").strip() or None,
-                note=(row.get("note") or "").strip() or None,
-            )
-            db.add(contact)
-            contacts_created += 1
-    else:
-        # Expect: name, internal_extension, external_number, company, tag, note
-        for row in rows:
-            if not row:
-                continue
-            name = (row[0] if len(row) > 0 else "").strip()
-            if not name:
-                continue
-            contact = Contact(
-                owner_extension=owner_ext,
-                name=name,
-                internal_extension=(row[1] if len(row) > 1 else "").strip() or None,
-                external_number=(row[2] if len(row) > 2 else "").strip() or None,
-                company=(row[3] if len(row) > 3 else "").strip() or None,
-                tag=(row[4] if len(row) > 4 else "").strip() or None,
-                note=(row[5] if len(row) > 5 else "").strip() or None,
-            )
-            db.add(contact)
-            contacts_created += 1
 
-    db.commit()
-    return {"created": contacts_created}
+@router.get("/import/{import_id}")
+def get_import_status(import_id: str, current_user: User = Depends(get_current_user)):
+    progress = contact_import.get_import(import_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Import nicht gefunden")
+    return progress
@@ -5,9 +5,9 @@ Real-time statistics and system status with REAL Asterisk data
 from fastapi import APIRouter, Depends
 from typing import Dict, Any
 from datetime import datetime
-from sqlalchemy import text
+from sqlalchemy import text, select
 import logging
-from database import SessionLocal, User, SIPPeer, SIPTrunk
+from database import AsyncSessionLocal, User, SIPPeer, SIPTrunk
 from auth import get_current_user
 from version import VERSION
 
@@ -33,9 +33,7 @@ async def get_dashboard_status(current_user: User = Depends(get_current_user)) -
         asterisk_status = "connected"
         
         try:
-            response = await ami_client.manager.send_action({
-                'Action': 'PJSIPShowEndpoints'
-            })
+            response = await ami_client.send_action('PJSIPShowEndpoints')
             
             if response:
                 for item in response:
@@ -49,10 +47,7 @@ async def get_dashboard_status(current_user: User = Depends(get_current_user)) -
                         # Hole Contact-Infos für RTT
                         rtt_ms = 0
                         try:
-                            contact_response = await ami_client.manager.send_action({
-                                'Action': 'PJSIPShowContacts',
-                                'Endpoint': endpoint
-                            })
+                            contact_response = await ami_client.send_action('PJSIPShowContacts', Endpoint=endpoint)
                             
                             if contact_response:
                                 for contact_item in contact_response:
@@ -81,32 +76,30 @@ async def get_dashboard_status(current_user: User = Depends(get_current_user)) -
     # Build lookup maps from DB for friendly names
     db_status = "disconnected"
     try:
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db_status = "connected"
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+            db_status = "connected"
 
-        # Map extension -> {caller_id, user_name, avatar_url} for peers
-        peer_map = {}
-        user_info_map = {}
-        for p in db.query(SIPPeer).all():
-            peer_map[p.extension] = p.caller_id or p.extension
-            if p.user_id:
-                user_info_map[p.extension] = p.user_id
+            # Map extension -> {caller_id, user_name, avatar_url} for peers
+            peer_map = {}
+            user_info_map = {}
+            for p in (await db.execute(select(SIPPeer))).scalars():
+                peer_map[p.extension] = p.caller_id or p.extension
+                if p.user_id:
+                    user_info_map[p.extension] = p.user_id
 
-        # Bulk-load users for peers that have user_id
-        user_map = {}
-        if user_info_map:
-            user_ids = list(set(user_info_map.values()))
-            users = db.query(User).filter(User.id.in_(user_ids)).all()
-            for u in users:
-                user_map[u.id] = {"full_name": u.full_name, "avatar_url": u.avatar_url}
+            # Bulk-load users for peers that have user_id
+            user_map = {}
+            if user_info_map:
+                user_ids = list(set(user_info_map.values()))
+                users = (await db.execute(select(User).where(User.id.in_(user_ids)))).scalars()
+                for u in users:
+                    user_map[u.id] = {"full_name": u.full_name, "avatar_url": u.avatar_url}
 
-        # Map "trunk-ep-{id}" -> {name, provider} for trunks
-        trunk_map = {}
-        for t in db.query(SIPTrunk).all():
-            trunk_map[f"trunk-ep-{t.id}"] = {"name": t.name, "provider": t.provider}
-
-        db.close()
+            # Map "trunk-ep-{id}" -> {name, provider} for trunks
+            trunk_map = {}
+            for t in (await db.execute(select(SIPTrunk))).scalars():
+                trunk_map[f"trunk-ep-{t.id}"] = {"name": t.name, "provider": t.provider}
 
         # Enrich endpoints with display_name and type
         for ep in endpoints:
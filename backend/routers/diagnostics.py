@@ -0,0 +1,101 @@
+"""
+Diagnostics API Router
+Admin-only runtime diagnostics: event loop lag, blocking-call stacks and
+the sampling profiler
+"""
+import asyncio
+import threading
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from database import User
+from auth import require_admin
+import loop_monitor
+import profiler
+
+router = APIRouter()
+
+_profile_running = False
+
+
+class LoopDebugUpdate(BaseModel):
+    enabled: bool
+    threshold_ms: Optional[float] = Field(None, ge=5, le=10000)
+
+
+@router.get("/loop")
+async def get_loop_stats(
+    limit: int = Query(20, ge=0, le=loop_monitor.MAX_SLOW_EVENTS),
+    current_user: User = Depends(require_admin),
+):
+    """Event loop lag percentiles and, in debug mode, the stacks of recent stalls."""
+    stats = loop_monitor.get_stats()
+    stats["slow_events"] = loop_monitor.get_slow_events()[:limit]
+    return stats
+
+
+@router.put("/loop/debug")
+async def set_loop_debug(data: LoopDebugUpdate, current_user: User = Depends(require_admin)):
+    """Switch the blocking-call watchdog on or off."""
+    if data.enabled:
+        loop_monitor.enable_debug(data.threshold_ms)
+    else:
+        loop_monitor.disable_debug()
+    return loop_monitor.get_stats()
+
+
+@router.delete("/loop")
+async def reset_loop_stats(current_user: User = Depends(require_admin)):
+    """Clear lag samples and recorded stalls."""
+    loop_monitor.reset()
+    return {"success": True}
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def run_profile(
+    seconds: float = Query(10, gt=0, le=120),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    include_idle: bool = False,
+    current_user: User = Depends(require_admin),
+):
+    """Sample all thread stacks for `seconds` and return collapsed stacks (flamegraph.pl / speedscope)."""
+    global _profile_running
+    if _profile_running:
+        raise HTTPException(status_code=409, detail="Es läuft bereits ein Profiling")
+    _profile_running = True
+    try:
+        sampler = profiler.StackSampler(
+            interval=interval_ms / 1000,
+            include_idle=include_idle,
+            loop_thread_id=threading.get_ident(),
+        ).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stacks = sampler.stop()
+    finally:
+        _profile_running = False
+    return PlainTextResponse(
+        profiler.collapsed(stacks),
+        headers={"X-Profile-Samples": str(sampler.samples)},
+    )
+
+
+@router.get("/profile/requests")
+async def list_request_profiles(current_user: User = Depends(require_admin)):
+    """Profiles recorded for requests sent with the X-Profile header, newest first."""
+    return {
+        "enabled": bool(profiler.PROFILE_REQUEST_TOKEN),
+        "profiles": profiler.list_request_profiles(),
+    }
+
+
+@router.get("/profile/requests/{profile_id}", response_class=PlainTextResponse)
+async def get_request_profile(profile_id: str, current_user: User = Depends(require_admin)):
+    """Collapsed stacks of one profiled request."""
+    profile = profiler.get_request_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profil nicht gefunden")
+    return PlainTextResponse(profiler.collapsed(profile["stacks"]))
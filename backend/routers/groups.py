@@ -9,11 +9,11 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 import logging
 
-from database import get_db, RingGroup, RingGroupMember, SIPPeer, IVRMenu, User, InboundRoute, CallForward, VoicemailMailbox, SIPTrunk
+from database import get_db, RingGroup, RingGroupMember, User, InboundRoute, SIPTrunk
 from auth import get_current_user
-from dialplan import write_extensions_config, reload_dialplan
-from queue_config import write_queues_config, reload_queues
 from audit import log_action
+import config_jobs
+import extension_registry
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +46,7 @@ class RingGroupResponse(RingGroupBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    config_job_id: str | None = None
 
     class Config:
         from_attributes = True
@@ -59,9 +60,8 @@ def _validate_strategy(strategy: str):
 def _validate_members(db: Session, members: List[str]):
     if not members:
         return
-    peers = db.query(SIPPeer).filter(SIPPeer.extension.in_(members)).all()
-    found = {p.extension for p in peers}
-    missing = [m for m in members if m not in found]
+    found = extension_registry.lookup(db, members)
+    missing = [m for m in members if found.get(m) != "peer"]
     if missing:
         raise HTTPException(status_code=400, detail=f"Unbekannte Nebenstellen: {', '.join(missing)}")
 
@@ -115,19 +115,9 @@ def _sync_inbound_route(db: Session, group: RingGroup, trunk_id: int | None, did
     db.commit()
 
 
-def _regenerate_all(db: Session):
-    all_routes = db.query(InboundRoute).all()
-    all_forwards = db.query(CallForward).all()
-    all_mailboxes = db.query(VoicemailMailbox).all()
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    all_groups = db.query(RingGroup).all()
-    all_ivr = db.query(IVRMenu).all()
-
-    write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-    reload_dialplan()
-    write_queues_config(all_groups)
-    reload_queues()
+def _regenerate_all(db: Session, reason: str = "ring groups changed", username: str = "system") -> str:
+    """Queue a config apply (dialplan + queues), returns the job id"""
+    return config_jobs.enqueue(reason, created_by=username)["id"]
 
 
 def _to_response(group: RingGroup) -> dict:
@@ -157,10 +147,7 @@ def list_groups(current_user: User = Depends(get_current_user), db: Session = De
 def create_group(group: RingGroupCreate, request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     if db.query(RingGroup).filter(RingGroup.name == group.name).first():
         raise HTTPException(status_code=400, detail="Gruppenname existiert bereits")
-    if db.query(RingGroup).filter(RingGroup.extension == group.extension).first():
-        raise HTTPException(status_code=400, detail="Gruppen-Nummer existiert bereits")
-    if db.query(SIPPeer).filter(SIPPeer.extension == group.extension).first():
-        raise HTTPException(status_code=400, detail="Gruppen-Nummer ist bereits als Nebenstelle vergeben")
+    extension_registry.ensure_free(db, group.extension, "Gruppen-Nummer", "group")
 
     _validate_strategy(group.strategy)
     if group.ring_time < 5 or group.ring_time > 120:
@@ -178,7 +165,8 @@ def create_group(group: RingGroupCreate, request: Request, current_user: User =
         enabled=group.enabled,
     )
     db.add(db_group)
-    db.commit()
+    extension_registry.claim(db, db_group.extension, "group")
+    extension_registry.commit(db)
     db.refresh(db_group)
 
     for idx, ext in enumerate(group.members):
@@ -193,9 +181,11 @@ def create_group(group: RingGroupCreate, request: Request, current_user: User =
     log_action(db, current_user.username, "group_created", "ring_group", db_group.name,
                {"extension": db_group.extension}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    job_id = _regenerate_all(db, f"group {db_group.name} created", current_user.username)
 
-    return _to_response(db_group)
+    response = _to_response(db_group)
+    response["config_job_id"] = job_id
+    return response
 
 
 @router.put("/{group_id}", response_model=RingGroupResponse)
@@ -209,10 +199,7 @@ def update_group(group_id: int, group: RingGroupUpdate, request: Request, curren
             raise HTTPException(status_code=400, detail="Gruppenname existiert bereits")
 
     if group.extension != db_group.extension:
-        if db.query(RingGroup).filter(RingGroup.extension == group.extension).first():
-            raise HTTPException(status_code=400, detail="Gruppen-Nummer existiert bereits")
-        if db.query(SIPPeer).filter(SIPPeer.extension == group.extension).first():
-            raise HTTPException(status_code=400, detail="Gruppen-Nummer ist bereits als Nebenstelle vergeben")
+        extension_registry.ensure_free(db, group.extension, "Gruppen-Nummer", "group")
 
     _validate_strategy(group.strategy)
     if group.ring_time < 5 or group.ring_time > 120:
@@ -237,8 +224,9 @@ def update_group(group_id: int, group: RingGroupUpdate, request: Request, curren
     db.query(RingGroupMember).filter(RingGroupMember.group_id == db_group.id).delete()
     for idx, ext in enumerate(group.members):
         db.add(RingGroupMember(group_id=db_group.id, extension=ext, position=idx))
+    extension_registry.rename(db, old_extension, db_group.extension, "group")
 
-    db.commit()
+    extension_registry.commit(db)
     db.refresh(db_group)
 
     # Update inbound route if necessary
@@ -257,9 +245,11 @@ def update_group(group_id: int, group: RingGroupUpdate, request: Request, curren
     log_action(db, current_user.username, "group_updated", "ring_group", db_group.name,
                {"extension": db_group.extension}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    job_id = _regenerate_all(db, f"group {db_group.name} updated", current_user.username)
 
-    return _to_response(db_group)
+    response = _to_response(db_group)
+    response["config_job_id"] = job_id
+    return response
 
 
 @router.delete("/{group_id}")
@@ -278,11 +268,12 @@ def delete_group(group_id: int, request: Request, current_user: User = Depends(g
             db.delete(route)
             db.commit()
     db.query(RingGroupMember).filter(RingGroupMember.group_id == group_id).delete()
+    extension_registry.release(db, db_group.extension)
     db.delete(db_group)
     db.commit()
 
     log_action(db, current_user.username, "group_deleted", "ring_group", name, {}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    job_id = _regenerate_all(db, f"group {name} deleted", current_user.username)
 
-    return {"status": "ok"}
+    return {"status": "ok", "config_job_id": job_id}
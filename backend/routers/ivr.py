@@ -12,11 +12,11 @@ import logging
 import re
 import os
 
-from database import get_db, IVRMenu, IVROption, SIPPeer, RingGroup, User, InboundRoute, CallForward, VoicemailMailbox, SIPTrunk
+from database import get_db, IVRMenu, IVROption, User, InboundRoute, SIPTrunk
 from auth import get_current_user
-from dialplan import write_extensions_config, reload_dialplan
-from queue_config import write_queues_config, reload_queues
 from audit import log_action
+import config_jobs
+import extension_registry
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +59,7 @@ class IVRMenuResponse(IVRMenuBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    config_job_id: str | None = None
 
     class Config:
         from_attributes = True
@@ -74,14 +75,15 @@ def _validate_digits(options: List[IVROptionIn]):
         seen.add(opt.digit)
 
 
-def _validate_destination(db: Session, dest: str | None):
-    if not dest:
-        return
-    peer = db.query(SIPPeer).filter(SIPPeer.extension == dest).first()
-    group = db.query(RingGroup).filter(RingGroup.extension == dest).first()
-    ivr = db.query(IVRMenu).filter(IVRMenu.extension == dest).first()
-    if not peer and not group and not ivr:
-        raise HTTPException(status_code=400, detail=f"Ziel {dest} nicht gefunden")
+def _validate_destinations(db: Session, menu: IVRMenuBase):
+    """All option and timeout destinations must be a peer, group or IVR (one registry lookup)"""
+    dests = [opt.destination for opt in menu.options if opt.destination]
+    if menu.timeout_destination:
+        dests.append(menu.timeout_destination)
+    found = extension_registry.lookup(db, dests)
+    missing = [d for d in dict.fromkeys(dests) if d not in found]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Ziel {', '.join(missing)} nicht gefunden")
 
 
 def _validate_inbound_did(db: Session, trunk_id: int | None, did: str | None, current_extension: str | None = None):
@@ -129,19 +131,9 @@ def _sync_inbound_route(db: Session, menu: IVRMenu, trunk_id: int | None, did: s
     db.commit()
 
 
-def _regenerate_all(db: Session):
-    all_routes = db.query(InboundRoute).all()
-    all_forwards = db.query(CallForward).all()
-    all_mailboxes = db.query(VoicemailMailbox).all()
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    all_groups = db.query(RingGroup).all()
-    all_ivr = db.query(IVRMenu).all()
-
-    write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-    reload_dialplan()
-    write_queues_config(all_groups)
-    reload_queues()
+def _regenerate_all(db: Session, reason: str = "IVR menus changed", username: str = "system") -> str:
+    """Queue a config apply (dialplan + queues), returns the job id"""
+    return config_jobs.enqueue(reason, created_by=username)["id"]
 
 
 def _to_response(menu: IVRMenu) -> dict:
@@ -173,12 +165,7 @@ def list_menus(current_user: User = Depends(get_current_user), db: Session = Dep
 def create_menu(menu: IVRMenuCreate, request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     if db.query(IVRMenu).filter(IVRMenu.name == menu.name).first():
         raise HTTPException(status_code=400, detail="IVR-Name existiert bereits")
-    if db.query(IVRMenu).filter(IVRMenu.extension == menu.extension).first():
-        raise HTTPException(status_code=400, detail="IVR-Nummer existiert bereits")
-    if db.query(SIPPeer).filter(SIPPeer.extension == menu.extension).first():
-        raise HTTPException(status_code=400, detail="IVR-Nummer ist bereits als Nebenstelle vergeben")
-    if db.query(RingGroup).filter(RingGroup.extension == menu.extension).first():
-        raise HTTPException(status_code=400, detail="IVR-Nummer ist bereits als Gruppe vergeben")
+    extension_registry.ensure_free(db, menu.extension, "IVR-Nummer", "ivr")
 
     if menu.timeout_seconds < 2 or menu.timeout_seconds > 30:
         raise HTTPException(status_code=400, detail="Timeout muss zwischen 2 und 30 Sekunden liegen")
@@ -186,9 +173,7 @@ def create_menu(menu: IVRMenuCreate, request: Request, current_user: User = Depe
         raise HTTPException(status_code=400, detail="Wiederholungen müssen zwischen 0 und 5 liegen")
 
     _validate_digits(menu.options)
-    for opt in menu.options:
-        _validate_destination(db, opt.destination)
-    _validate_destination(db, menu.timeout_destination)
+    _validate_destinations(db, menu)
     _validate_inbound_did(db, menu.inbound_trunk_id, menu.inbound_did)
 
     db_menu = IVRMenu(
@@ -203,7 +188,8 @@ def create_menu(menu: IVRMenuCreate, request: Request, current_user: User = Depe
         enabled=menu.enabled,
     )
     db.add(db_menu)
-    db.commit()
+    extension_registry.claim(db, db_menu.extension, "ivr")
+    extension_registry.commit(db)
     db.refresh(db_menu)
 
     for idx, opt in enumerate(menu.options):
@@ -216,9 +202,11 @@ def create_menu(menu: IVRMenuCreate, request: Request, current_user: User = Depe
     log_action(db, current_user.username, "ivr_created", "ivr", db_menu.name,
                {"extension": db_menu.extension}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    job_id = _regenerate_all(db, f"ivr {db_menu.name} created", current_user.username)
 
-    return _to_response(db_menu)
+    response = _to_response(db_menu)
+    response["config_job_id"] = job_id
+    return response
 
 
 @router.put("/{menu_id}", response_model=IVRMenuResponse)
@@ -232,12 +220,7 @@ def update_menu(menu_id: int, menu: IVRMenuUpdate, request: Request, current_use
             raise HTTPException(status_code=400, detail="IVR-Name existiert bereits")
 
     if menu.extension != db_menu.extension:
-        if db.query(IVRMenu).filter(IVRMenu.extension == menu.extension).first():
-            raise HTTPException(status_code=400, detail="IVR-Nummer existiert bereits")
-        if db.query(SIPPeer).filter(SIPPeer.extension == menu.extension).first():
-            raise HTTPException(status_code=400, detail="IVR-Nummer ist bereits als Nebenstelle vergeben")
-        if db.query(RingGroup).filter(RingGroup.extension == menu.extension).first():
-            raise HTTPException(status_code=400, detail="IVR-Nummer ist bereits als Gruppe vergeben")
+        extension_registry.ensure_free(db, menu.extension, "IVR-Nummer", "ivr")
 
     if menu.timeout_seconds < 2 or menu.timeout_seconds > 30:
         raise HTTPException(status_code=400, detail="Timeout muss zwischen 2 und 30 Sekunden liegen")
@@ -245,9 +228,7 @@ def update_menu(menu_id: int, menu: IVRMenuUpdate, request: Request, current_use
         raise HTTPException(status_code=400, detail="Wiederholungen müssen zwischen 0 und 5 liegen")
 
     _validate_digits(menu.options)
-    for opt in menu.options:
-        _validate_destination(db, opt.destination)
-    _validate_destination(db, menu.timeout_destination)
+    _validate_destinations(db, menu)
     _validate_inbound_did(db, menu.inbound_trunk_id, menu.inbound_did, current_extension=db_menu.extension)
 
     old_extension = db_menu.extension
@@ -268,8 +249,9 @@ def update_menu(menu_id: int, menu: IVRMenuUpdate, request: Request, current_use
     db.query(IVROption).filter(IVROption.menu_id == db_menu.id).delete()
     for idx, opt in enumerate(menu.options):
         db.add(IVROption(menu_id=db_menu.id, digit=opt.digit, destination=opt.destination, position=idx))
+    extension_registry.rename(db, old_extension, db_menu.extension, "ivr")
 
-    db.commit()
+    extension_registry.commit(db)
     db.refresh(db_menu)
 
     # Update inbound routes pointing to old extension if needed
@@ -292,9 +274,11 @@ def update_menu(menu_id: int, menu: IVRMenuUpdate, request: Request, current_use
     log_action(db, current_user.username, "ivr_updated", "ivr", db_menu.name,
                {"extension": db_menu.extension}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    job_id = _regenerate_all(db, f"ivr {db_menu.name} updated", current_user.username)
 
-    return _to_response(db_menu)
+    response = _to_response(db_menu)
+    response["config_job_id"] = job_id
+    return response
 
 
 @router.delete("/{menu_id}")
@@ -313,14 +297,15 @@ def delete_menu(menu_id: int, request: Request, current_user: User = Depends(get
             db.delete(route)
             db.commit()
     db.query(IVROption).filter(IVROption.menu_id == menu_id).delete()
+    extension_registry.release(db, db_menu.extension)
     db.delete(db_menu)
     db.commit()
 
     log_action(db, current_user.username, "ivr_deleted", "ivr", name, {}, request.client.host if request.client else None)
 
-    _regenerate_all(db)
+    job_id = _regenerate_all(db, f"ivr {name} deleted", current_user.username)
 
-    return {"status": "ok"}
+    return {"status": "ok", "config_job_id": job_id}
 
 
 @router.get("/prompts")
@@ -341,7 +326,7 @@ def list_prompts(current_user: User = Depends(get_current_user)):
 
 
 @router.post("/upload")
-async def upload_prompt(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+def upload_prompt(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
     """Upload an IVR prompt and copy into Asterisk sounds/custom."""
     try:
         os.makedirs(PROMPT_DIR, exist_ok=True)
@@ -350,7 +335,7 @@ async def upload_prompt(file: UploadFile = File(...), current_user: User = Depen
         if not base or ext.lower() not in ALLOWED_EXT:
             raise HTTPException(status_code=400, detail="Ungültiges Dateiformat")
 
-        content = await file.read()
+        content = file.file.read()
         if len(content) > MAX_SIZE_BYTES:
             raise HTTPException(status_code=400, detail="Datei ist zu groß (max. 10 MB)")
 
@@ -3,22 +3,28 @@ SIP Peers API Router
 CRUD operations for SIP peers management with PJSIP config generation
 """
 import re
+import csv
+import io
 import string
 import secrets
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from datetime import datetime
 import logging
 
-from database import get_db, SIPPeer, SIPTrunk, RingGroup, IVRMenu, User, VoicemailMailbox, SystemSettings, InboundRoute, CallForward
-from pjsip_config import write_pjsip_config, reload_asterisk, DEFAULT_CODECS
-from voicemail_config import write_voicemail_config, reload_voicemail
-from dialplan import write_extensions_config, reload_dialplan
-from auth import get_current_user
+from database import get_db, SIPPeer, User, VoicemailMailbox, InboundRoute, CallForward, SIPTrunk
+from pjsip_config import PJSIP_REALTIME
+from auth import get_current_user, require_admin
+from routers.settings import AVAILABLE_CODECS
 from audit import log_action
+import astdb
+import pjsip_realtime
+import config_jobs
+import extension_registry
 
 logger = logging.getLogger(__name__)
 
@@ -83,16 +89,20 @@ def check_password_strength(password: str, extension: str = "") -> dict:
     return {"score": score, "level": level, "warnings": warnings}
 
 
-@router.get("/generate-password")
-def generate_password(current_user: User = Depends(get_current_user)):
-    """Generate a secure random 16-character password."""
+def random_password() -> str:
+    """Secure random 16-character password containing all character types."""
     alphabet = string.ascii_letters + string.digits + "!@#$%&*+-="
     while True:
         pw = ''.join(secrets.choice(alphabet) for _ in range(16))
-        # Ensure it has all character types
         if (re.search(r'[a-z]', pw) and re.search(r'[A-Z]', pw)
                 and re.search(r'\d', pw) and re.search(r'[!@#$%&*+\-=]', pw)):
-            break
+            return pw
+
+
+@router.get("/generate-password")
+def generate_password(current_user: User = Depends(get_current_user)):
+    """Generate a secure random 16-character password."""
+    pw = random_password()
     strength = check_password_strength(pw)
     return {"password": pw, "strength": strength}
 
@@ -153,36 +163,76 @@ class SIPPeerResponse(SIPPeerBase):
     pai: str | None = None
     created_at: datetime
     updated_at: datetime
+    config_job_id: str | None = None
 
     class Config:
         from_attributes = True
 
 
-def regenerate_voicemail_config(db: Session):
-    """Regenerate voicemail.conf from database and reload Asterisk"""
+class BulkPeer(BaseModel):
+    extension: str
+    secret: str | None = None  # generated if empty
+    caller_id: str | None = None
+    codecs: str | None = None
+    blf_enabled: bool = True
+    pickup_group: str | None = None
+    enabled: bool = True
+    mailbox: bool = True
+    mailbox_pin: str | None = None
+    mailbox_email: str | None = None
+    user: str | None = None  # username or user id to assign
+    dids: List[str] = []
+    trunk_id: int | None = None  # trunk of the DIDs, defaults to BulkPeerRequest.trunk_id
+
+
+class BulkPeerRequest(BaseModel):
+    peers: List[BulkPeer]
+    trunk_id: int | None = None
+
+
+MAX_BULK_PEERS = 2000
+_EXTENSION_RE = re.compile(r"^\d{2,10}$")
+_PICKUP_GROUP_RE = re.compile(r"^\d+(,\d+)*$")
+# Pin, name and email end up in the voicemail.conf line "ext => pin,name,email"
+_MAILBOX_PIN_RE = re.compile(r"\d{3,10}")
+_EMAIL_RE = re.compile(r"[^@\s,;]+@[^@\s,;]+\.[^@\s,;]+")
+
+
+def apply_config(db: Session, reason: str, username: str = "system") -> str:
+    """Queue a config apply (render + reload) in the background worker, returns the job id"""
+    job = config_jobs.enqueue(reason, created_by=username)
+    logger.info(f"✓ Config apply queued as job {job['id']} ({reason})")
+    return job["id"]
+
+
+def sync_peer_endpoint(db: Session, peer: SIPPeer, old_extension: str | None = None):
+    """Upsert the ps_* rows of one peer (realtime mode only, pjsip.conf covers file mode)"""
+    if not PJSIP_REALTIME:
+        return
     try:
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        write_voicemail_config(all_mailboxes)
-        reload_voicemail()
-        logger.info(f"✓ Voicemail config regenerated with {len(all_mailboxes)} mailboxes")
+        if old_extension and old_extension != peer.extension:
+            pjsip_realtime.delete_peer(db, old_extension)
+        global_codecs, acl_on = pjsip_realtime.load_endpoint_defaults(db)
+        pjsip_realtime.upsert_peer(db, peer, global_codecs, acl_on)
+        db.commit()
+        logger.info(f"✓ PJSIP realtime rows updated for {peer.extension}")
     except Exception as e:
-        logger.error(f"✗ Failed to regenerate voicemail config: {e}")
+        db.rollback()
+        logger.error(f"✗ Failed to update PJSIP realtime rows: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 
-def regenerate_pjsip_config(db: Session):
-    """Regenerate pjsip.conf from database and reload Asterisk"""
+def remove_peer_endpoint(db: Session, extension: str):
+    """Delete the ps_* rows of one peer (realtime mode only, pjsip.conf covers file mode)"""
+    if not PJSIP_REALTIME:
+        return
     try:
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        setting = db.query(SystemSettings).filter(SystemSettings.key == "global_codecs").first()
-        global_codecs = setting.value if setting else DEFAULT_CODECS
-        acl_setting = db.query(SystemSettings).filter(SystemSettings.key == "ip_whitelist_enabled").first()
-        acl_on = acl_setting is not None and acl_setting.value == "true"
-        write_pjsip_config(all_peers, all_trunks, global_codecs=global_codecs, acl_enabled=acl_on)
-        reload_asterisk()
-        logger.info(f"✓ PJSIP config regenerated with {len(all_peers)} peers")
+        pjsip_realtime.delete_peer(db, extension)
+        db.commit()
+        logger.info(f"✓ PJSIP realtime rows removed for {extension}")
     except Exception as e:
-        logger.error(f"✗ Failed to regenerate PJSIP config: {e}")
+        db.rollback()
+        logger.error(f"✗ Failed to remove PJSIP realtime rows: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -199,15 +249,22 @@ def get_peer(peer_id: int, current_user: User = Depends(get_current_user), db: S
     return peer
 
 
+def _ensure_extension_free(db: Session, extension: str):
+    kind = extension_registry.kind_of(db, extension)
+    if kind == "peer":
+        raise HTTPException(status_code=400, detail="Extension already exists")
+    if kind:
+        raise HTTPException(status_code=400, detail=f"Extension already used by {'a ring group' if kind == 'group' else 'an IVR'}")
+
+
 @router.post("/", response_model=SIPPeerResponse)
 def create_peer(peer: SIPPeerCreate, request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    existing = db.query(SIPPeer).filter(SIPPeer.extension == peer.extension).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Extension already exists")
+    _ensure_extension_free(db, peer.extension)
 
     db_peer = SIPPeer(**peer.model_dump())
     db.add(db_peer)
-    db.commit()
+    extension_registry.claim(db, peer.extension, "peer")
+    extension_registry.commit(db)
     db.refresh(db_peer)
 
     # Auto-create voicemail mailbox
@@ -216,19 +273,209 @@ def create_peer(peer: SIPPeerCreate, request: Request, current_user: User = Depe
         mb = VoicemailMailbox(extension=peer.extension, name=peer.caller_id or peer.extension)
         db.add(mb)
         db.commit()
+        astdb.run_sync(astdb.sync_ring_timeout, mb.extension, mb.ring_timeout)
 
     logger.info(f"✓ Created SIP peer: {peer.extension}")
     log_action(db, current_user.username, "peer_created", "peer", peer.extension,
                {"caller_id": peer.caller_id}, request.client.host if request.client else None)
-    regenerate_pjsip_config(db)
-    regenerate_voicemail_config(db)
+    sync_peer_endpoint(db, db_peer)
+    job_id = apply_config(db, f"peer {peer.extension} created", current_user.username)
 
     # Add password strength warning
     strength = check_password_strength(peer.secret, peer.extension)
     response = SIPPeerResponse.model_validate(db_peer)
+    response.config_job_id = job_id
     return response
 
 
+def _validate_bulk(db: Session, data: BulkPeerRequest) -> tuple[list, dict]:
+    """Check all rows with one lookup per table. Returns (errors, context for the insert)."""
+    errors = []
+
+    def error(index: int, peer: BulkPeer, message: str):
+        errors.append({"row": index + 1, "extension": peer.extension, "error": message})
+
+    extensions = [p.extension.strip() for p in data.peers]
+    dids = [d.strip() for p in data.peers for d in p.dids if d.strip()]
+    user_refs = {p.user.strip() for p in data.peers if p.user and p.user.strip()}
+    trunk_ids = {p.trunk_id or data.trunk_id for p in data.peers if p.dids} - {None}
+
+    taken = extension_registry.lookup(db, extensions)
+    assigned_dids = {d for (d,) in db.query(InboundRoute.did).filter(InboundRoute.did.in_(dids))} if dids else set()
+    trunks = {t for (t,) in db.query(SIPTrunk.id).filter(SIPTrunk.id.in_(trunk_ids))} if trunk_ids else set()
+    users = {}
+    if user_refs:
+        ids = [int(ref) for ref in user_refs if ref.isdigit()]
+        for user in db.query(User).filter((User.username.in_(user_refs)) | (User.id.in_(ids))):
+            users[user.username] = user.id
+            users[str(user.id)] = user.id
+    existing_mailboxes = {e for (e,) in db.query(VoicemailMailbox.extension)
+                          .filter(VoicemailMailbox.extension.in_(extensions))}
+    valid_codecs = {c["id"] for c in AVAILABLE_CODECS}
+
+    seen_extensions = set()
+    seen_dids = set()
+    for index, peer in enumerate(data.peers):
+        ext = peer.extension.strip()
+        if not _EXTENSION_RE.match(ext):
+            error(index, peer, "Ungültige Extension (2-10 Ziffern)")
+        elif ext in taken:
+            error(index, peer, "Extension existiert bereits")
+        elif ext in seen_extensions:
+            error(index, peer, "Extension mehrfach in der Liste")
+        seen_extensions.add(ext)
+        if peer.codecs:
+            unknown = [c for c in peer.codecs.split(",") if c.strip() and c.strip() not in valid_codecs]
+            if unknown:
+                error(index, peer, f"Unbekannter Codec: {', '.join(unknown)}")
+        if peer.pickup_group and not _PICKUP_GROUP_RE.match(peer.pickup_group.replace(" ", "")):
+            error(index, peer, "Ungültige Pickup-Gruppe")
+        if peer.caller_id and any(c in peer.caller_id for c in ",\r\n"):
+            error(index, peer, "Caller-ID darf kein Komma und keinen Zeilenumbruch enthalten")
+        if peer.mailbox_pin and not _MAILBOX_PIN_RE.fullmatch(peer.mailbox_pin):
+            error(index, peer, "Ungültige Mailbox-PIN (3-10 Ziffern)")
+        if peer.mailbox_email and not _EMAIL_RE.fullmatch(peer.mailbox_email):
+            error(index, peer, "Ungültige Mailbox-E-Mail")
+        if peer.secret and len(peer.secret) < 8:
+            error(index, peer, "Passwort ist zu kurz (mindestens 8 Zeichen)")
+        if peer.user and peer.user.strip() not in users:
+            error(index, peer, f"Benutzer {peer.user} nicht gefunden")
+        if peer.dids:
+            trunk_id = peer.trunk_id or data.trunk_id
+            if trunk_id is None:
+                error(index, peer, "trunk_id für DIDs erforderlich")
+            elif trunk_id not in trunks:
+                error(index, peer, f"Trunk {trunk_id} nicht gefunden")
+        for did in (d.strip() for d in peer.dids if d.strip()):
+            if did in assigned_dids:
+                error(index, peer, f"DID {did} ist bereits vergeben")
+            elif did in seen_dids:
+                error(index, peer, f"DID {did} mehrfach in der Liste")
+            seen_dids.add(did)
+    return errors, {"users": users, "existing_mailboxes": existing_mailboxes}
+
+
+@router.post("/bulk")
+def bulk_create_peers(data: BulkPeerRequest, request: Request, current_user: User = Depends(require_admin),
+                      db: Session = Depends(get_db)):
+    """Create many peers (with mailboxes, user assignment and DIDs) in one transaction and
+    one config apply. Nothing is created if any row is invalid."""
+    if not data.peers:
+        raise HTTPException(status_code=400, detail="Keine Peers angegeben")
+    if len(data.peers) > MAX_BULK_PEERS:
+        raise HTTPException(status_code=400, detail=f"Maximal {MAX_BULK_PEERS} Peers pro Aufruf")
+
+    errors, context = _validate_bulk(db, data)
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": f"{len(errors)} Fehler, nichts angelegt",
+                                                     "errors": errors})
+
+    generated = {}
+    weak = []
+    db_peers = []
+    mailboxes = []
+    routes = 0
+    for peer in data.peers:
+        ext = peer.extension.strip()
+        secret = peer.secret
+        if not secret:
+            secret = generated[ext] = random_password()
+        elif check_password_strength(secret, ext)["level"] == "weak":
+            weak.append(ext)
+        db_peer = SIPPeer(
+            extension=ext,
+            secret=secret,
+            caller_id=peer.caller_id,
+            codecs=",".join(c.strip() for c in peer.codecs.split(",") if c.strip()) if peer.codecs else None,
+            blf_enabled=peer.blf_enabled,
+            pickup_group=peer.pickup_group.replace(" ", "") if peer.pickup_group else None,
+            enabled=peer.enabled,
+            user_id=context["users"][peer.user.strip()] if peer.user else None,
+        )
+        db_peers.append(db_peer)
+        if peer.mailbox and ext not in context["existing_mailboxes"]:
+            mailbox = VoicemailMailbox(extension=ext, name=peer.caller_id or ext, email=peer.mailbox_email)
+            if peer.mailbox_pin:
+                mailbox.pin = peer.mailbox_pin
+            mailboxes.append(mailbox)
+        for did in (d.strip() for d in peer.dids if d.strip()):
+            db.add(InboundRoute(did=did, trunk_id=peer.trunk_id or data.trunk_id, destination_extension=ext,
+                                description=peer.caller_id or ext))
+            routes += 1
+    db.add_all(db_peers)
+    db.add_all(mailboxes)
+    extension_registry.claim_many(db, (p.extension for p in db_peers), "peer")
+    try:
+        db.flush()
+        if PJSIP_REALTIME:
+            global_codecs, acl_on = pjsip_realtime.load_endpoint_defaults(db)
+            for db_peer in db_peers:
+                pjsip_realtime.upsert_peer(db, db_peer, global_codecs, acl_on)
+        # Read before commit expires the objects
+        extensions = [p.extension for p in db_peers]
+        ring_timeouts = [(mb.extension, mb.ring_timeout) for mb in mailboxes]
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        if isinstance(e, IntegrityError) and extension_registry.is_conflict(e):
+            raise extension_registry.conflict_error(db)
+        logger.error(f"✗ Bulk peer creation failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    logger.info(f"✓ Bulk created {len(db_peers)} SIP peers, {len(mailboxes)} mailboxes, {routes} routes")
+    log_action(db, current_user.username, "peers_bulk_created", "peer", f"{len(db_peers)} peers",
+               {"extensions": extensions, "routes": routes}, request.client.host if request.client else None)
+    job_id = apply_config(db, f"{len(db_peers)} peers created (bulk)", current_user.username)
+    if ring_timeouts:
+        astdb.run_sync(astdb.sync_ring_timeouts, ring_timeouts)
+
+    return {
+        "created": len(db_peers),
+        "extensions": extensions,
+        "mailboxes_created": len(mailboxes),
+        "routes_created": routes,
+        "generated_secrets": generated,
+        "weak_passwords": weak,
+        "config_job_id": job_id,
+    }
+
+
+_BULK_BOOL_COLUMNS = ("blf_enabled", "enabled", "mailbox")
+_BULK_BOOL_WORDS = {"ja": True, "j": True, "x": True, "nein": False, "n": False}
+
+
+@router.post("/bulk/csv")
+def bulk_create_peers_csv(request: Request, file: UploadFile = File(...), trunk_id: int | None = None,
+                          current_user: User = Depends(require_admin), db: Session = Depends(get_db)):
+    """CSV variant of /bulk: one peer per row with the BulkPeer fields as header;
+    dids separated by spaces or semicolons, booleans as 1/0, true/false or ja/nein."""
+    raw = file.file.read()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("latin-1")
+    peers = []
+    errors = []
+    for index, row in enumerate(csv.DictReader(io.StringIO(text))):
+        values = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+        values = {k: v for k, v in values.items() if v != ""}
+        for column in _BULK_BOOL_COLUMNS:
+            if column in values:
+                # pydantic takes 1/0, true/false, yes/no; German sheets say ja/nein
+                values[column] = _BULK_BOOL_WORDS.get(values[column].lower(), values[column])
+        if "dids" in values:
+            values["dids"] = [d for d in re.split(r"[;\s]+", values["dids"]) if d]
+        try:
+            peers.append(BulkPeer(**values))
+        except ValidationError as e:
+            errors.append({"row": index + 1, "extension": values.get("extension"),
+                           "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())})
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": f"{len(errors)} Fehler, nichts angelegt",
+                                                     "errors": errors})
+    return bulk_create_peers(BulkPeerRequest(peers=peers, trunk_id=trunk_id), request, current_user, db)
+
+
 @router.put("/{peer_id}", response_model=SIPPeerResponse)
 def update_peer(peer_id: int, peer: SIPPeerUpdate, request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     db_peer = db.query(SIPPeer).filter(SIPPeer.id == peer_id).first()
@@ -236,23 +483,26 @@ def update_peer(peer_id: int, peer: SIPPeerUpdate, request: Request, current_use
         raise HTTPException(status_code=404, detail="Peer not found")
 
     if peer.extension != db_peer.extension:
-        existing = db.query(SIPPeer).filter(SIPPeer.extension == peer.extension).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Extension already exists")
+        _ensure_extension_free(db, peer.extension)
 
+    old_extension = db_peer.extension
     for key, value in peer.model_dump().items():
         setattr(db_peer, key, value)
 
     db_peer.updated_at = datetime.utcnow()
-    db.commit()
+    extension_registry.rename(db, old_extension, db_peer.extension, "peer")
+    extension_registry.commit(db)
     db.refresh(db_peer)
 
     logger.info(f"✓ Updated SIP peer: {peer.extension}")
     log_action(db, current_user.username, "peer_updated", "peer", peer.extension,
                {"caller_id": peer.caller_id}, request.client.host if request.client else None)
-    regenerate_pjsip_config(db)
+    sync_peer_endpoint(db, db_peer, old_extension=old_extension)
+    job_id = apply_config(db, f"peer {peer.extension} updated", current_user.username)
 
-    return db_peer
+    response = SIPPeerResponse.model_validate(db_peer)
+    response.config_job_id = job_id
+    return response
 
 
 @router.delete("/{peer_id}")
@@ -279,26 +529,17 @@ def delete_peer(peer_id: int, request: Request, current_user: User = Depends(get
         db.delete(mb)
 
     db.delete(db_peer)
+    extension_registry.release(db, extension)
     db.commit()
 
     logger.info(f"✓ Deleted SIP peer: {extension} (freed {len(routes)} routes, {len(forwards)} forwards)")
     log_action(db, current_user.username, "peer_deleted", "peer", extension,
                None, request.client.host if request.client else None)
-    regenerate_pjsip_config(db)
-    regenerate_voicemail_config(db)
+    remove_peer_endpoint(db, extension)
+    job_id = apply_config(db, f"peer {extension} deleted", current_user.username)
+    astdb.run_sync(astdb.remove_extension, extension)
 
-    # Regenerate dialplan to remove references to deleted extension
-    all_routes = db.query(InboundRoute).all()
-    all_forwards = db.query(CallForward).all()
-    all_mailboxes = db.query(VoicemailMailbox).all()
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    all_groups = db.query(RingGroup).all()
-    all_ivr = db.query(IVRMenu).all()
-    write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-    reload_dialplan()
-
-    return {"status": "deleted", "extension": extension}
+    return {"status": "deleted", "extension": extension, "config_job_id": job_id}
 
 
 @router.patch("/{peer_id}/codecs")
@@ -312,9 +553,10 @@ def update_peer_codecs(peer_id: int, data: PeerCodecUpdate, current_user: User =
     db.commit()
 
     logger.info(f"Updated codecs for peer {db_peer.extension}: {data.codecs or 'global'}")
-    regenerate_pjsip_config(db)
+    sync_peer_endpoint(db, db_peer)
+    job_id = apply_config(db, f"peer {db_peer.extension} codecs updated", current_user.username)
 
-    return {"status": "ok", "codecs": db_peer.codecs}
+    return {"status": "ok", "codecs": db_peer.codecs, "config_job_id": job_id}
 
 
 @router.patch("/{peer_id}/user")
@@ -375,14 +617,6 @@ def update_peer_outbound(
                {"outbound_cid": data.outbound_cid, "pai": data.pai}, request.client.host if request.client else None)
 
     # Regenerate dialplan with new outbound CID / PAI
-    all_routes = db.query(InboundRoute).filter(InboundRoute.enabled == True).all()
-    all_forwards = db.query(CallForward).filter(CallForward.enabled == True).all()
-    all_mailboxes = db.query(VoicemailMailbox).all()
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    all_groups = db.query(RingGroup).all()
-    all_ivr = db.query(IVRMenu).all()
-    write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-    reload_dialplan()
-
-    return {"status": "ok", "outbound_cid": db_peer.outbound_cid, "pai": db_peer.pai}
+    job_id = apply_config(db, f"peer {db_peer.extension} outbound updated", current_user.username)
+
+    return {"status": "ok", "outbound_cid": db_peer.outbound_cid, "pai": db_peer.pai, "config_job_id": job_id}
@@ -0,0 +1,32 @@
+"""
+Remote Phonebook Router
+Address books for desk phones, authenticated by book token instead of JWT:
+  /api/phonebook/yealink.xml?token=...                  global book
+  /api/phonebook/snom.xml?extension=1001&token=...      book of extension 1001
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response
+
+import phonebook
+
+router = APIRouter()
+
+
+@router.get("/{fmt}")
+async def get_phonebook(
+    fmt: str,
+    token: Optional[str] = Query(None),
+    extension: Optional[str] = Query(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    if fmt not in phonebook.FORMATS:
+        raise HTTPException(status_code=404, detail="Unbekanntes Format")
+    if not phonebook.check_token(extension, token):
+        raise HTTPException(status_code=401, detail="Ungültiger Token")
+    etag, body = await phonebook.get_document(extension, fmt)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if phonebook.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=phonebook.FORMATS[fmt], headers=headers)
@@ -9,10 +9,11 @@ from pydantic import BaseModel
 from datetime import datetime
 import logging
 
-from database import get_db, InboundRoute, SIPTrunk, SIPPeer, RingGroup, IVRMenu, User, CallForward, VoicemailMailbox
-from dialplan import write_extensions_config, reload_dialplan
+from database import get_db, InboundRoute, SIPTrunk, SIPPeer, User
 from auth import get_current_user
 from audit import log_action
+import config_jobs
+import extension_registry
 
 logger = logging.getLogger(__name__)
 
@@ -39,27 +40,23 @@ class InboundRouteResponse(InboundRouteBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    config_job_id: str | None = None
 
     class Config:
         from_attributes = True
 
 
-def regenerate_dialplan(db: Session):
-    """Regenerate extensions.conf and reload Asterisk dialplan"""
-    try:
-        all_routes = db.query(InboundRoute).filter(InboundRoute.enabled == True).all()
-        all_forwards = db.query(CallForward).filter(CallForward.enabled == True).all()
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        all_groups = db.query(RingGroup).all()
-        all_ivr = db.query(IVRMenu).all()
-        write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-        reload_dialplan()
-        logger.info(f"Dialplan regenerated with {len(all_routes)} inbound routes")
-    except Exception as e:
-        logger.error(f"Failed to regenerate dialplan: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+def regenerate_dialplan(db: Session, reason: str = "inbound routes changed", username: str = "system") -> str:
+    """Queue a config apply (dialplan regeneration + reload), returns the job id"""
+    job = config_jobs.enqueue(reason, created_by=username)
+    logger.info(f"Config apply queued as job {job['id']} ({reason})")
+    return job["id"]
+
+
+def _with_job(db_route: InboundRoute, job_id: str) -> InboundRouteResponse:
+    response = InboundRouteResponse.model_validate(db_route)
+    response.config_job_id = job_id
+    return response
 
 
 @router.get("/", response_model=List[InboundRouteResponse])
@@ -86,10 +83,7 @@ def create_route(route: InboundRouteCreate, request: Request, current_user: User
         raise HTTPException(status_code=400, detail="Trunk not found")
 
     # Validate destination exists (peer, ring group, or ivr)
-    peer = db.query(SIPPeer).filter(SIPPeer.extension == route.destination_extension).first()
-    group = db.query(RingGroup).filter(RingGroup.extension == route.destination_extension).first()
-    ivr = db.query(IVRMenu).filter(IVRMenu.extension == route.destination_extension).first()
-    if not peer and not group and not ivr:
+    if not extension_registry.kind_of(db, route.destination_extension):
         raise HTTPException(status_code=400, detail="Destination extension not found")
 
     db_route = InboundRoute(**route.model_dump())
@@ -100,9 +94,9 @@ def create_route(route: InboundRouteCreate, request: Request, current_user: User
     logger.info(f"Created inbound route: {route.did} -> {route.destination_extension}")
     log_action(db, current_user.username, "route_created", "route", route.did,
                {"destination": route.destination_extension}, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    job_id = regenerate_dialplan(db, f"route {route.did} created", current_user.username)
 
-    return db_route
+    return _with_job(db_route, job_id)
 
 
 @router.put("/{route_id}", response_model=InboundRouteResponse)
@@ -117,10 +111,7 @@ def update_route(route_id: int, route: InboundRouteUpdate, request: Request, cur
             raise HTTPException(status_code=400, detail="DID already assigned")
 
     # Validate destination exists (peer, ring group, or ivr)
-    peer = db.query(SIPPeer).filter(SIPPeer.extension == route.destination_extension).first()
-    group = db.query(RingGroup).filter(RingGroup.extension == route.destination_extension).first()
-    ivr = db.query(IVRMenu).filter(IVRMenu.extension == route.destination_extension).first()
-    if not peer and not group and not ivr:
+    if not extension_registry.kind_of(db, route.destination_extension):
         raise HTTPException(status_code=400, detail="Destination extension not found")
 
     for key, value in route.model_dump().items():
@@ -133,9 +124,9 @@ def update_route(route_id: int, route: InboundRouteUpdate, request: Request, cur
     logger.info(f"Updated inbound route: {route.did} -> {route.destination_extension}")
     log_action(db, current_user.username, "route_updated", "route", route.did,
                {"destination": route.destination_extension}, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    job_id = regenerate_dialplan(db, f"route {route.did} updated", current_user.username)
 
-    return db_route
+    return _with_job(db_route, job_id)
 
 
 @router.delete("/{route_id}")
@@ -159,6 +150,6 @@ def delete_route(route_id: int, request: Request, current_user: User = Depends(g
     logger.info(f"Deleted inbound route: {did}")
     log_action(db, current_user.username, "route_deleted", "route", did,
                None, request.client.host if request.client else None)
-    regenerate_dialplan(db)
+    job_id = regenerate_dialplan(db, f"route {did} deleted", current_user.username)
 
-    return {"status": "deleted", "did": did}
+    return {"status": "deleted", "did": did, "config_job_id": job_id}
@@ -20,14 +20,15 @@ from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
 
-from database import get_db, SystemSettings, VoicemailMailbox, SIPPeer, SIPTrunk
+from database import get_db, SystemSettings, VoicemailMailbox, SIPPeer, SIPTrunk, InboundRoute, CallForward, RingGroup, IVRMenu
 from auth import require_admin, User
 from email_config import write_msmtp_config, send_test_email
-from voicemail_config import write_voicemail_config, reload_voicemail
-from pjsip_config import write_pjsip_config, reload_asterisk, DEFAULT_CODECS
-from acl_config import write_acl_config, remove_acl_config, reload_acl
+from pjsip_config import DEFAULT_CODECS, PJSIP_REALTIME
+from dialplan import generate_extensions_config, analyze_dialplan
 from version import VERSION
 from audit import log_action
+import pjsip_realtime
+import config_jobs
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +46,11 @@ AVAILABLE_CODECS = [
 ]
 
 
+def _apply_config(db: Session, username: str, reason: str) -> str:
+    """Queue a config apply in the background worker and return the job id."""
+    return config_jobs.enqueue(reason, created_by=username)["id"]
+
+
 class SettingsUpdate(BaseModel):
     smtp_host: Optional[str] = ""
     smtp_port: Optional[str] = "587"
@@ -119,13 +125,11 @@ def update_settings(
         write_msmtp_config(full_settings)
 
     # Regenerate voicemail.conf with SMTP settings
-    mailboxes = db.query(VoicemailMailbox).all()
-    write_voicemail_config(mailboxes, full_settings)
-    reload_voicemail()
+    job_id = _apply_config(db, current_user.username, "smtp settings updated")
 
     log_action(db, current_user.username, "settings_updated", "settings", "smtp",
                None, request.client.host if request.client else None)
-    return {"status": "ok"}
+    return {"status": "ok", "config_job_id": job_id}
 
 
 @router.post("/test-email")
@@ -335,13 +339,30 @@ def update_codec_settings(
     db.commit()
 
     # Regenerate pjsip.conf
+    if PJSIP_REALTIME:
+        pjsip_realtime.sync_all(db, db.query(SIPPeer).all(), db.query(SIPTrunk).all(), ",".join(codecs), _is_acl_enabled(db))
+    job_id = _apply_config(db, current_user.username, "global codecs updated")
+
+    return {"status": "ok", "global_codecs": ",".join(codecs), "config_job_id": job_id}
+
+
+# --- Dialplan Report ---
+
+@router.get("/dialplan-report")
+def get_dialplan_report(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin),
+):
+    """Render extensions.conf from the database and report its size and priority counts."""
+    all_routes = db.query(InboundRoute).filter(InboundRoute.enabled == True).all()
+    all_forwards = db.query(CallForward).filter(CallForward.enabled == True).all()
+    all_mailboxes = db.query(VoicemailMailbox).all()
     all_peers = db.query(SIPPeer).all()
     all_trunks = db.query(SIPTrunk).all()
-    acl_on = _is_acl_enabled(db)
-    write_pjsip_config(all_peers, all_trunks, global_codecs=",".join(codecs), acl_enabled=acl_on)
-    reload_asterisk()
-
-    return {"status": "ok", "global_codecs": ",".join(codecs)}
+    all_groups = db.query(RingGroup).all()
+    all_ivr = db.query(IVRMenu).all()
+    config = generate_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
+    return analyze_dialplan(config)
 
 
 # --- IP Whitelist ---
@@ -416,25 +437,18 @@ def update_ip_whitelist(
             db.add(setting)
     db.commit()
 
-    # Generate/remove ACL config
-    if data.enabled and clean_ips:
-        write_acl_config(clean_ips)
-    else:
-        remove_acl_config()
-    reload_acl()
-
-    # Regenerate pjsip.conf with or without acl line
-    codec_setting = db.query(SystemSettings).filter(SystemSettings.key == "global_codecs").first()
-    global_codecs = codec_setting.value if codec_setting else DEFAULT_CODECS
-    all_peers = db.query(SIPPeer).all()
-    all_trunks = db.query(SIPTrunk).all()
-    write_pjsip_config(all_peers, all_trunks, global_codecs=global_codecs, acl_enabled=data.enabled and len(clean_ips) > 0)
-    reload_asterisk()
+    # Regenerate acl.conf and pjsip.conf with or without acl line
+    if PJSIP_REALTIME:
+        codec_setting = db.query(SystemSettings).filter(SystemSettings.key == "global_codecs").first()
+        global_codecs = codec_setting.value if codec_setting else DEFAULT_CODECS
+        pjsip_realtime.sync_all(db, db.query(SIPPeer).all(), db.query(SIPTrunk).all(), global_codecs,
+                                data.enabled and len(clean_ips) > 0)
+    job_id = _apply_config(db, current_user.username, "ip whitelist updated")
 
     log_action(db, current_user.username, "whitelist_updated", "settings", "ip_whitelist",
                {"enabled": data.enabled, "count": len(clean_ips)},
                request.client.host if request.client else None)
-    return {"status": "ok", "enabled": data.enabled, "ips": clean_ips}
+    return {"status": "ok", "enabled": data.enabled, "ips": clean_ips, "config_job_id": job_id}
 
 
 # --- Fail2Ban Status ---
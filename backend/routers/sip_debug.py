@@ -1,13 +1,17 @@
 """
 SIP Debug API Router
-Enable/disable PJSIP history capture, view captured SIP messages by Call-ID.
+Enable/disable SIP capture (HEP or PJSIP history), search calls and view captured SIP messages by Call-ID.
 """
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, Optional
+from datetime import datetime
+import asyncio
 import logging
+import sip_trace
 from auth import get_current_user
 from database import User
-from sip_debug import sip_debug_buffer
+from sip_debug import sip_debug_buffer, utc_timestamp
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -17,20 +21,27 @@ def set_ami_client(client):
     sip_debug_buffer.set_ami_client(client)
 
 
+def set_trace_store(store):
+    sip_debug_buffer.set_trace_store(store)
+
+
 @router.get("/status")
 async def get_status(current_user: User = Depends(get_current_user)) -> Dict[str, Any]:
     """Get SIP debug capture status."""
     sip_debug_buffer.cleanup_old()
     return {
         "enabled": sip_debug_buffer.enabled,
-        "message_count": len(sip_debug_buffer._messages),
-        "call_count": len(sip_debug_buffer._by_call_id),
+        "mode": sip_debug_buffer.mode,
+        "message_count": sip_debug_buffer.message_count,
+        "call_count": sip_debug_buffer.call_count,
+        "buffer_bytes": sip_debug_buffer.total_bytes,
+        "buffer_max_bytes": sip_debug_buffer.max_bytes,
     }
 
 
 @router.post("/enable")
 async def enable_capture(current_user: User = Depends(get_current_user)):
-    """Enable PJSIP history and start polling for SIP messages."""
+    """Enable SIP capture (HEP push or PJSIP history polling)."""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
 
@@ -45,7 +56,7 @@ async def enable_capture(current_user: User = Depends(get_current_user)):
 
 @router.post("/disable")
 async def disable_capture(current_user: User = Depends(get_current_user)):
-    """Disable PJSIP history and stop polling."""
+    """Disable SIP capture."""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
 
@@ -61,12 +72,75 @@ async def get_calls(current_user: User = Depends(get_current_user)):
     return sip_debug_buffer.get_calls()
 
 
+@router.get("/search")
+async def search_calls(
+    number: Optional[str] = Query(None, description="From/To user part, e.g. 1001 or +4930123"),
+    method: Optional[str] = Query(None, description="SIP method seen in the call, e.g. INVITE"),
+    code: Optional[int] = Query(None, description="Response code seen in the call, e.g. 486"),
+    addr: Optional[str] = Query(None, description="Remote IP (or IP:port)"),
+    since: Optional[datetime] = Query(None, description="UTC"),
+    until: Optional[datetime] = Query(None, description="UTC"),
+    disposition: Optional[str] = Query(None, description="answered, busy, cancelled, no_answer, failed, ok, in_progress"),
+    min_pdd_ms: Optional[float] = Query(None, description="Minimum post-dial delay in ms"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user),
+):
+    """Search captured calls; all given filters must match."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    return sip_debug_buffer.search(
+        number=number, method=method, code=code, addr=addr, since=since, until=until,
+        disposition=disposition, min_post_dial_delay_ms=min_pdd_ms, limit=limit,
+    )
+
+
+@router.get("/traces")
+async def get_trace_store(current_user: User = Depends(get_current_user)):
+    """On-disk trace segments and disk usage."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    if not sip_debug_buffer.trace_store:
+        raise HTTPException(status_code=404, detail="SIP-Trace-Speicher ist deaktiviert")
+    return sip_debug_buffer.trace_store.stats()
+
+
+@router.get("/export.pcap")
+async def export_pcap(
+    call_id: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="UTC"),
+    until: Optional[datetime] = Query(None, description="UTC"),
+    current_user: User = Depends(get_current_user),
+):
+    """Stream stored SIP messages of a call and/or time window as pcap."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    store = sip_debug_buffer.trace_store
+    if not store:
+        raise HTTPException(status_code=404, detail="SIP-Trace-Speicher ist deaktiviert")
+    if not call_id and not (since and until):
+        raise HTTPException(status_code=400, detail="call_id oder since und until angeben")
+
+    since_ts = utc_timestamp(since) if since else None
+    until_ts = utc_timestamp(until) if until else None
+    # Sync generator: Starlette iterates it in a worker thread
+    chunks = sip_trace.iter_pcap(store.iter_records(call_id=call_id, since=since_ts, until=until_ts))
+    name = "call" if call_id else (since.strftime("%Y%m%d-%H%M%S"))
+    return StreamingResponse(
+        chunks,
+        media_type="application/vnd.tcpdump.pcap",
+        headers={"Content-Disposition": f'attachment; filename="sip-{name}.pcap"'},
+    )
+
+
 @router.get("/calls/{call_id:path}")
 async def get_call_messages(call_id: str, current_user: User = Depends(get_current_user)):
     """Get SIP messages for a specific Call-ID."""
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     messages = sip_debug_buffer.get_call_messages(call_id)
+    if not messages:
+        # Older calls are only in the on-disk trace store
+        messages = await asyncio.to_thread(sip_debug_buffer.get_stored_call_messages, call_id)
     if not messages:
         raise HTTPException(status_code=404, detail="Call-ID nicht gefunden")
     return messages
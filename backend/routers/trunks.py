@@ -4,16 +4,19 @@ CRUD operations for SIP trunk management with PJSIP config generation
 """
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from typing import List, Dict, Any
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import logging
 
-from database import get_db, SIPTrunk, SIPPeer, User, SystemSettings, InboundRoute, CDR
-from pjsip_config import write_pjsip_config, reload_asterisk, DEFAULT_CODECS
+from database import get_db, get_async_db, SIPTrunk, User, InboundRoute, CDR
+from pjsip_config import DEFAULT_CODECS, PJSIP_REALTIME
 from auth import get_current_user
 from audit import log_action
+import pjsip_realtime
+import config_jobs
 
 logger = logging.getLogger(__name__)
 
@@ -69,26 +72,31 @@ class SIPTrunkResponse(SIPTrunkBase):
     sip_server: str
     created_at: datetime
     updated_at: datetime
+    config_job_id: str | None = None
 
     class Config:
         from_attributes = True
 
 
-def regenerate_config(db: Session):
-    """Regenerate pjsip.conf from database and reload Asterisk"""
-    try:
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        setting = db.query(SystemSettings).filter(SystemSettings.key == "global_codecs").first()
-        global_codecs = setting.value if setting else DEFAULT_CODECS
-        acl_setting = db.query(SystemSettings).filter(SystemSettings.key == "ip_whitelist_enabled").first()
-        acl_on = acl_setting is not None and acl_setting.value == "true"
-        write_pjsip_config(all_peers, all_trunks, global_codecs=global_codecs, acl_enabled=acl_on)
-        reload_asterisk()
-        logger.info(f"PJSIP config regenerated with {len(all_peers)} peers, {len(all_trunks)} trunks")
-    except Exception as e:
-        logger.error(f"Failed to regenerate PJSIP config: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+def regenerate_config(db: Session, reason: str = "trunks changed", username: str = "system") -> str:
+    """Sync realtime trunk rows and queue a config apply, returns the job id"""
+    if PJSIP_REALTIME:
+        try:
+            pjsip_realtime.sync_trunks(db, db.query(SIPTrunk).all())
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to sync PJSIP realtime trunk rows: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    job = config_jobs.enqueue(reason, created_by=username)
+    logger.info(f"Config apply queued as job {job['id']} ({reason})")
+    return job["id"]
+
+
+def _with_job(db_trunk: SIPTrunk, job_id: str) -> SIPTrunkResponse:
+    response = SIPTrunkResponse.model_validate(db_trunk)
+    response.config_job_id = job_id
+    return response
 
 
 @router.get("/", response_model=List[SIPTrunkResponse])
@@ -133,9 +141,9 @@ def create_trunk(trunk: SIPTrunkCreate, request: Request, current_user: User = D
     logger.info(f"Created SIP trunk: {trunk.name}")
     log_action(db, current_user.username, "trunk_created", "trunk", trunk.name,
                {"provider": trunk.provider}, request.client.host if request.client else None)
-    regenerate_config(db)
+    job_id = regenerate_config(db, f"trunk {trunk.name} created", current_user.username)
 
-    return db_trunk
+    return _with_job(db_trunk, job_id)
 
 
 @router.put("/{trunk_id}", response_model=SIPTrunkResponse)
@@ -180,9 +188,9 @@ def update_trunk(trunk_id: int, trunk: SIPTrunkUpdate, request: Request, current
     logger.info(f"Updated SIP trunk: {trunk.name}")
     log_action(db, current_user.username, "trunk_updated", "trunk", trunk.name,
                {"provider": trunk.provider}, request.client.host if request.client else None)
-    regenerate_config(db)
+    job_id = regenerate_config(db, f"trunk {trunk.name} updated", current_user.username)
 
-    return db_trunk
+    return _with_job(db_trunk, job_id)
 
 
 @router.delete("/{trunk_id}")
@@ -204,9 +212,9 @@ def delete_trunk(trunk_id: int, request: Request, current_user: User = Depends(g
     logger.info(f"Deleted SIP trunk: {name} (and {len(routes)} inbound routes)")
     log_action(db, current_user.username, "trunk_deleted", "trunk", name,
                None, request.client.host if request.client else None)
-    regenerate_config(db)
+    job_id = regenerate_config(db, f"trunk {name} deleted", current_user.username)
 
-    return {"status": "deleted", "name": name}
+    return {"status": "deleted", "name": name, "config_job_id": job_id}
 
 
 def expand_number_block(number_block: str) -> list[str]:
@@ -256,9 +264,9 @@ def get_available_dids(current_user: User = Depends(get_current_user), db: Sessi
 
 
 @router.get("/{trunk_id}/status")
-async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> Dict[str, Any]:
+async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)) -> Dict[str, Any]:
     """Get detailed status for a specific trunk including registration, endpoint, routes, and stats"""
-    db_trunk = db.query(SIPTrunk).filter(SIPTrunk.id == trunk_id).first()
+    db_trunk = await db.get(SIPTrunk, trunk_id)
     if not db_trunk:
         raise HTTPException(status_code=404, detail="Trunk not found")
 
@@ -284,9 +292,7 @@ async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_curre
     if ami_client and ami_client.connected:
         # Get outbound registration status
         try:
-            reg_response = await ami_client.manager.send_action({
-                'Action': 'PJSIPShowRegistrationsOutbound'
-            })
+            reg_response = await ami_client.send_action('PJSIPShowRegistrationsOutbound')
             if reg_response:
                 for item in reg_response:
                     if item.get('Event') == 'OutboundRegistrationDetail':
@@ -302,10 +308,7 @@ async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_curre
 
         # Get endpoint details
         try:
-            ep_response = await ami_client.manager.send_action({
-                'Action': 'PJSIPShowEndpoint',
-                'Endpoint': ep_name
-            })
+            ep_response = await ami_client.send_action('PJSIPShowEndpoint', Endpoint=ep_name)
             if ep_response:
                 for item in ep_response:
                     if item.get('Event') == 'EndpointDetail':
@@ -316,10 +319,7 @@ async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_curre
 
         # Get contacts (RTT/latency)
         try:
-            contact_response = await ami_client.manager.send_action({
-                'Action': 'PJSIPShowContacts',
-                'Endpoint': ep_name
-            })
+            contact_response = await ami_client.send_action('PJSIPShowContacts', Endpoint=ep_name)
             if contact_response:
                 for item in contact_response:
                     try:
@@ -337,7 +337,8 @@ async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_curre
             logger.error(f"Error fetching contacts for trunk {trunk_id}: {e}")
 
     # Inbound routes for this trunk
-    trunk_routes = db.query(InboundRoute).filter(InboundRoute.trunk_id == trunk_id).all()
+    result = await db.execute(select(InboundRoute).where(InboundRoute.trunk_id == trunk_id))
+    trunk_routes = result.scalars().all()
     routes_data = [
         {
             "id": r.id,
@@ -355,25 +356,22 @@ async def get_trunk_status(trunk_id: int, current_user: User = Depends(get_curre
     week_start = today_start - timedelta(days=today_start.weekday())
     trunk_channel_pattern = f"%{ep_name}%"
 
-    calls_today = db.query(func.count(CDR.id)).filter(
-        CDR.call_date >= today_start,
-        (CDR.channel.like(trunk_channel_pattern) | CDR.dstchannel.like(trunk_channel_pattern))
-    ).scalar() or 0
-
-    calls_week = db.query(func.count(CDR.id)).filter(
-        CDR.call_date >= week_start,
-        (CDR.channel.like(trunk_channel_pattern) | CDR.dstchannel.like(trunk_channel_pattern))
-    ).scalar() or 0
-
-    inbound_today = db.query(func.count(CDR.id)).filter(
-        CDR.call_date >= today_start,
-        CDR.channel.like(trunk_channel_pattern)
-    ).scalar() or 0
-
-    outbound_today = db.query(func.count(CDR.id)).filter(
-        CDR.call_date >= today_start,
-        CDR.dstchannel.like(trunk_channel_pattern)
-    ).scalar() or 0
+    is_inbound = CDR.channel.like(trunk_channel_pattern)
+    is_outbound = CDR.dstchannel.like(trunk_channel_pattern)
+    calls = func.count(CDR.id)
+    result = await db.execute(
+        select(
+            calls.label("calls_week"),
+            calls.filter(CDR.call_date >= today_start).label("calls_today"),
+            calls.filter(CDR.call_date >= today_start, is_inbound).label("inbound_today"),
+            calls.filter(CDR.call_date >= today_start, is_outbound).label("outbound_today"),
+        ).where(CDR.call_date >= week_start, is_inbound | is_outbound)
+    )
+    stats = result.one()
+    calls_today = stats.calls_today or 0
+    calls_week = stats.calls_week or 0
+    inbound_today = stats.inbound_today or 0
+    outbound_today = stats.outbound_today or 0
 
     return {
         "trunk": trunk_data,
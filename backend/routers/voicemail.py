@@ -1,19 +1,19 @@
 """
 Voicemail API Router with database integration
 """
-from fastapi import APIRouter, HTTPException, Depends, Query
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, func
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index, and_, delete, func, or_, select, update
 from pydantic import BaseModel
-from database import Base, get_db, User, VoicemailMailbox, SIPPeer, SIPTrunk, RingGroup, IVRMenu
+from database import Base, get_async_db, User, VoicemailMailbox
 from auth import get_current_user, JWT_SECRET, JWT_ALGORITHM
-from voicemail_config import write_voicemail_config, reload_voicemail
-from dialplan import write_extensions_config, reload_dialplan
-from database import InboundRoute, CallForward
+import astdb
+import config_jobs
+import voicemail_audio
 from typing import Dict, Any, List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 from jose import JWTError, jwt as jose_jwt
+import asyncio
 import os
 import logging
 
@@ -30,22 +30,18 @@ class MailboxUpdate(BaseModel):
     ring_timeout: int = 20
 
 
-def regenerate_voicemail_config(db: Session):
-    """Regenerate voicemail.conf from database and reload Asterisk"""
-    try:
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        write_voicemail_config(all_mailboxes)
-        reload_voicemail()
-        logger.info(f"Voicemail config regenerated with {len(all_mailboxes)} mailboxes")
-    except Exception as e:
-        logger.error(f"Failed to regenerate voicemail config: {e}")
+def regenerate_voicemail_config(reason: str = "voicemail mailboxes changed", username: str = "system") -> str:
+    """Queue a config apply (voicemail.conf + reload), returns the job id"""
+    job = config_jobs.enqueue(reason, created_by=username)
+    logger.info(f"Config apply queued as job {job['id']} ({reason})")
+    return job["id"]
 
 
 # ==================== Mailbox Config Endpoints ====================
 
 @router.get("/mailbox/{extension}")
-async def get_mailbox(extension: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    mb = db.query(VoicemailMailbox).filter(VoicemailMailbox.extension == extension).first()
+async def get_mailbox(extension: str, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    mb = await db.scalar(select(VoicemailMailbox).where(VoicemailMailbox.extension == extension))
     if not mb:
         raise HTTPException(status_code=404, detail="Mailbox not found")
     return {
@@ -56,8 +52,8 @@ async def get_mailbox(extension: str, current_user: User = Depends(get_current_u
 
 
 @router.put("/mailbox/{extension}")
-async def update_mailbox(extension: str, data: MailboxUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    mb = db.query(VoicemailMailbox).filter(VoicemailMailbox.extension == extension).first()
+async def update_mailbox(extension: str, data: MailboxUpdate, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    mb = await db.scalar(select(VoicemailMailbox).where(VoicemailMailbox.extension == extension))
     if not mb:
         mb = VoicemailMailbox(extension=extension)
         db.add(mb)
@@ -67,38 +63,28 @@ async def update_mailbox(extension: str, data: MailboxUpdate, current_user: User
     mb.email = data.email
     mb.ring_timeout = data.ring_timeout
     mb.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(mb)
-    regenerate_voicemail_config(db)
-    # Regenerate dialplan so ring_timeout takes effect
-    try:
-        all_routes = db.query(InboundRoute).filter(InboundRoute.enabled == True).all()
-        all_forwards = db.query(CallForward).filter(CallForward.enabled == True).all()
-        all_mailboxes = db.query(VoicemailMailbox).all()
-        all_peers = db.query(SIPPeer).all()
-        all_trunks = db.query(SIPTrunk).all()
-        all_groups = db.query(RingGroup).all()
-        all_ivr = db.query(IVRMenu).all()
-        write_extensions_config(all_routes, all_forwards, all_mailboxes, all_peers, all_trunks, all_groups, all_ivr)
-        reload_dialplan()
-    except Exception as e:
-        logger.error(f"Failed to regenerate dialplan after mailbox update: {e}")
+    await db.commit()
+    job_id = regenerate_voicemail_config(f"mailbox {extension} updated", current_user.username)
+    # Ring timeout is read from AstDB at runtime, no dialplan reload needed
+    if not await astdb.sync_ring_timeout(mb.extension, mb.ring_timeout):
+        logger.warning(f"AstDB ring timeout for {mb.extension} not synced, will retry on next AMI connect")
     return {
         "extension": mb.extension, "enabled": mb.enabled,
         "pin": mb.pin, "name": mb.name, "email": mb.email,
         "ring_timeout": mb.ring_timeout or 20,
+        "config_job_id": job_id,
     }
 
 
 @router.delete("/mailbox/{extension}")
-async def delete_mailbox(extension: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    mb = db.query(VoicemailMailbox).filter(VoicemailMailbox.extension == extension).first()
+async def delete_mailbox(extension: str, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    mb = await db.scalar(select(VoicemailMailbox).where(VoicemailMailbox.extension == extension))
     if not mb:
         raise HTTPException(status_code=404, detail="Mailbox not found")
-    db.delete(mb)
-    db.commit()
-    regenerate_voicemail_config(db)
-    return {"success": True, "message": f"Mailbox {extension} deleted"}
+    await db.delete(mb)
+    await db.commit()
+    job_id = regenerate_voicemail_config(f"mailbox {extension} deleted", current_user.username)
+    return {"success": True, "message": f"Mailbox {extension} deleted", "config_job_id": job_id}
 
 
 # ==================== Voicemail Message Endpoints ====================
@@ -116,6 +102,46 @@ class VoicemailRecord(Base):
     msg_id = Column(String(50))
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Keyset pagination walks (date, id) newest first, globally or per mailbox
+    __table_args__ = (
+        Index("ix_voicemail_records_date_id", "date", "id"),
+        Index("ix_voicemail_records_mailbox_date_id", "mailbox", "date", "id"),
+    )
+
+
+class VoicemailCounter(Base):
+    """Message totals per mailbox, updated together with voicemail_records."""
+    __tablename__ = "voicemail_counters"
+    mailbox = Column(String(20), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    unread = Column(Integer, nullable=False, default=0)
+
+
+async def adjust_counters(db: AsyncSession, deltas: Dict[str, List[int]]):
+    """Apply {mailbox: [total_delta, unread_delta]} in the caller's transaction."""
+    for mailbox, (total, unread) in deltas.items():
+        if not total and not unread:
+            continue
+        result = await db.execute(
+            update(VoicemailCounter).where(VoicemailCounter.mailbox == mailbox)
+            .values(total=VoicemailCounter.total + total, unread=VoicemailCounter.unread + unread)
+        )
+        if result.rowcount == 0:
+            db.add(VoicemailCounter(mailbox=mailbox, total=max(total, 0), unread=max(unread, 0)))
+
+
+async def rebuild_counters(db: AsyncSession):
+    """Recount all mailboxes from voicemail_records (startup, self-healing)."""
+    result = await db.execute(
+        select(VoicemailRecord.mailbox, func.count(VoicemailRecord.id),
+               func.count(VoicemailRecord.id).filter(VoicemailRecord.is_read == False))
+        .group_by(VoicemailRecord.mailbox)
+    )
+    await db.execute(delete(VoicemailCounter))
+    for mailbox, total, unread in result.all():
+        db.add(VoicemailCounter(mailbox=mailbox, total=total, unread=unread))
+    await db.commit()
+
 def parse_voicemail_info(info_file: str) -> Dict[str, Any]:
     info = {}
     try:
@@ -128,74 +154,89 @@ def parse_voicemail_info(info_file: str) -> Dict[str, Any]:
         logger.error(f"Error parsing voicemail info: {e}")
     return info
 
-def sync_voicemail_from_disk(db: Session):
-    if not os.path.exists(VOICEMAIL_PATH):
-        return
-    for mailbox in os.listdir(VOICEMAIL_PATH):
-        mailbox_path = os.path.join(VOICEMAIL_PATH, mailbox)
-        if not os.path.isdir(mailbox_path):
-            continue
-        for folder in ["INBOX", "Old"]:
-            folder_path = os.path.join(mailbox_path, folder)
-            if not os.path.exists(folder_path):
-                continue
-            for filename in os.listdir(folder_path):
-                if filename.startswith("msg") and filename.endswith(".txt"):
-                    msg_id = filename.replace(".txt", "")
-                    existing = db.query(VoicemailRecord).filter(
-                        VoicemailRecord.mailbox == mailbox,
-                        VoicemailRecord.msg_id == msg_id,
-                        VoicemailRecord.folder == folder
-                    ).first()
-                    if existing:
-                        continue
-                    info_path = os.path.join(folder_path, filename)
-                    info = parse_voicemail_info(info_path)
-                    audio_file = None
-                    for ext in ['.wav', '.WAV', '.wav49']:
-                        audio_path = os.path.join(folder_path, f"{msg_id}{ext}")
-                        if os.path.exists(audio_path):
-                            audio_file = audio_path
-                            break
-                    if not audio_file:
-                        continue
-                    vm_record = VoicemailRecord(
-                        mailbox=mailbox,
-                        caller_id=info.get("callerid", "Unknown"),
-                        duration=int(info.get("duration", 0)),
-                        date=datetime.fromtimestamp(int(info.get("origtime", 0))) if info.get("origtime") else datetime.utcnow(),
-                        is_read=(folder == "Old"),
-                        file_path=audio_file,
-                        folder=folder,
-                        msg_id=msg_id
-                    )
-                    db.add(vm_record)
-    db.commit()
+def voicemail_to_dict(vm: VoicemailRecord) -> Dict[str, Any]:
+    return {"id": vm.id, "mailbox": vm.mailbox, "caller_id": vm.caller_id, "duration": vm.duration, "date": vm.date.isoformat(), "is_read": vm.is_read, "file_path": vm.file_path}
+
+def _encode_cursor(vm: VoicemailRecord) -> str:
+    return f"{vm.date.isoformat()}_{vm.id}"
+
+
+def _decode_cursor(cursor: str):
+    try:
+        date, vm_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(date), int(vm_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ungültiger Cursor")
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """voicemail_records.date is naive; an offset-qualified filter is converted to UTC first."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
 
 @router.get("/")
-async def list_voicemails(mailbox: Optional[str] = None, unread_only: Optional[bool] = False, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    sync_voicemail_from_disk(db)
-    query = db.query(VoicemailRecord)
+async def list_voicemails(
+    response: Response,
+    mailbox: Optional[str] = None,
+    unread_only: Optional[bool] = False,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Newest first. With limit or cursor the list is paged (default 100 per page) and, if there
+    are more, X-Next-Cursor holds the cursor for the next page; without either, all messages."""
+    # voicemail_records is kept in sync with the spool by voicemail_indexer
+    stmt = select(VoicemailRecord)
     if mailbox:
-        query = query.filter(VoicemailRecord.mailbox == mailbox)
+        stmt = stmt.where(VoicemailRecord.mailbox == mailbox)
     if unread_only:
-        query = query.filter(VoicemailRecord.is_read == False)
-    voicemails = query.order_by(VoicemailRecord.date.desc()).all()
-    return [{"id": vm.id, "mailbox": vm.mailbox, "caller_id": vm.caller_id, "duration": vm.duration, "date": vm.date.isoformat(), "is_read": vm.is_read, "file_path": vm.file_path} for vm in voicemails]
+        stmt = stmt.where(VoicemailRecord.is_read == False)
+    if date_from:
+        stmt = stmt.where(VoicemailRecord.date >= _naive_utc(date_from))
+    if date_to:
+        stmt = stmt.where(VoicemailRecord.date <= _naive_utc(date_to))
+    if cursor:
+        date, vm_id = _decode_cursor(cursor)
+        stmt = stmt.where(or_(VoicemailRecord.date < date,
+                              and_(VoicemailRecord.date == date, VoicemailRecord.id < vm_id)))
+    stmt = stmt.order_by(VoicemailRecord.date.desc(), VoicemailRecord.id.desc())
+    paged = limit is not None or cursor is not None
+    if paged:
+        limit = limit or 100
+        stmt = stmt.limit(limit + 1)
+    result = await db.execute(stmt)
+    voicemails = result.scalars().all()
+    if paged and len(voicemails) > limit:
+        voicemails = voicemails[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(voicemails[-1])
+    return [voicemail_to_dict(vm) for vm in voicemails]
 
 @router.get("/stats")
-async def get_voicemail_stats(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    sync_voicemail_from_disk(db)
-    total = db.query(VoicemailRecord).count()
-    unread = db.query(VoicemailRecord).filter(VoicemailRecord.is_read == False).count()
+async def get_voicemail_stats(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(VoicemailCounter).where(VoicemailCounter.total > 0))
+    total = 0
+    unread = 0
     by_mailbox = {}
-    mailbox_counts = db.query(VoicemailRecord.mailbox, func.count(VoicemailRecord.id)).group_by(VoicemailRecord.mailbox).all()
-    for mailbox, count in mailbox_counts:
-        by_mailbox[mailbox] = count
-    return {"total": total, "unread": unread, "by_mailbox": by_mailbox}
+    unread_by_mailbox = {}
+    for counter in result.scalars():
+        by_mailbox[counter.mailbox] = counter.total
+        unread_by_mailbox[counter.mailbox] = counter.unread
+        total += counter.total
+        unread += counter.unread
+    return {"total": total, "unread": unread, "by_mailbox": by_mailbox, "unread_by_mailbox": unread_by_mailbox}
+
+@router.get("/stats/{mailbox}")
+async def get_mailbox_stats(mailbox: str, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    counter = await db.get(VoicemailCounter, mailbox)
+    return {"mailbox": mailbox, "total": counter.total if counter else 0, "unread": counter.unread if counter else 0}
 
 @router.get("/{voicemail_id}/audio")
-async def get_voicemail_audio(voicemail_id: int, token: Optional[str] = Query(None), db: Session = Depends(get_db)):
+async def get_voicemail_audio(voicemail_id: int, request: Request, token: Optional[str] = Query(None), db: AsyncSession = Depends(get_async_db)):
     # Accept token via query param (for <audio> element) or header
     if not token:
         raise HTTPException(status_code=401, detail="Token required")
@@ -203,36 +244,45 @@ async def get_voicemail_audio(voicemail_id: int, token: Optional[str] = Query(No
         jose_jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
-    vm = db.query(VoicemailRecord).filter(VoicemailRecord.id == voicemail_id).first()
+    vm = await db.get(VoicemailRecord, voicemail_id)
     if not vm:
         raise HTTPException(status_code=404, detail="Voicemail not found")
-    if not os.path.exists(vm.file_path):
-        raise HTTPException(status_code=404, detail="Audio file not found")
-    return FileResponse(vm.file_path, media_type="audio/wav", filename=f"voicemail_{voicemail_id}.wav")
+    return await voicemail_audio.audio_response(request, vm.file_path, f"voicemail_{voicemail_id}")
+
+def _delete_voicemail_files(file_path: str):
+    if os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+            txt_path = file_path.replace('.wav', '.txt').replace('.WAV', '.txt')
+            if os.path.exists(txt_path):
+                os.remove(txt_path)
+        except Exception as e:
+            logger.error(f"Error deleting files: {e}")
 
 @router.patch("/{voicemail_id}/mark-read")
-async def mark_as_read(voicemail_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    vm = db.query(VoicemailRecord).filter(VoicemailRecord.id == voicemail_id).first()
+async def mark_as_read(voicemail_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    vm = await db.get(VoicemailRecord, voicemail_id)
     if not vm:
         raise HTTPException(status_code=404, detail="Voicemail not found")
-    vm.is_read = True
-    db.commit()
-    db.refresh(vm)
-    return {"id": vm.id, "mailbox": vm.mailbox, "caller_id": vm.caller_id, "duration": vm.duration, "date": vm.date.isoformat(), "is_read": vm.is_read, "file_path": vm.file_path}
+    # Conditional update, so concurrent requests decrement the counter only once
+    result = await db.execute(
+        update(VoicemailRecord).where(VoicemailRecord.id == voicemail_id, VoicemailRecord.is_read == False)
+        .values(is_read=True)
+    )
+    if result.rowcount:
+        await adjust_counters(db, {vm.mailbox: [0, -1]})
+    await db.commit()
+    await db.refresh(vm)
+    return voicemail_to_dict(vm)
 
 @router.delete("/{voicemail_id}")
-async def delete_voicemail(voicemail_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    vm = db.query(VoicemailRecord).filter(VoicemailRecord.id == voicemail_id).first()
+async def delete_voicemail(voicemail_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    vm = await db.get(VoicemailRecord, voicemail_id)
     if not vm:
         raise HTTPException(status_code=404, detail="Voicemail not found")
-    if os.path.exists(vm.file_path):
-        try:
-            os.remove(vm.file_path)
-            txt_path = vm.file_path.replace('.wav', '.txt').replace('.WAV', '.txt')
-            if os.path.exists(txt_path):
-                os.remove(txt_path)
-        except Exception as e:
-            logger.error(f"Error deleting files: {e}")
-    db.delete(vm)
-    db.commit()
+    await asyncio.to_thread(_delete_voicemail_files, vm.file_path)
+    result = await db.execute(delete(VoicemailRecord).where(VoicemailRecord.id == voicemail_id))
+    if result.rowcount:
+        await adjust_counters(db, {vm.mailbox: [-1, 0 if vm.is_read else -1]})
+    await db.commit()
     return {"success": True, "message": "Voicemail deleted"}
@@ -1,25 +1,64 @@
 """
-SIP Debug - Captures SIP messages via Asterisk's res_pjsip_history module.
-Polls `pjsip show history` via AMI Command, fetches full SIP text for new entries,
-and indexes by Call-ID for quick lookup.
+SIP Debug - Captures SIP messages and indexes them by Call-ID for quick lookup.
+Two capture modes (SIP_CAPTURE):
+  hep      Asterisk pushes every SIP packet to our HEP listener (res_hep_pjsip), default
+  history  polls `pjsip show history` via AMI Command and fetches new entries one by one
 """
+import os
 import re
+import sys
+import zlib
 import asyncio
 import logging
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from collections import deque
 
+import hep
+import metrics
+import sip_trace
+
 logger = logging.getLogger(__name__)
 
-MAX_MESSAGES = 10_000
+# Memory budget for stored messages (compressed SIP text + per-message overhead)
+MAX_BUFFER_BYTES = int(float(os.getenv("SIP_DEBUG_BUFFER_MB", "32")) * 1024 * 1024)
 MAX_AGE = timedelta(hours=2)
+# Rough size of a SIPMessage object with its own (non-interned) strings
+MESSAGE_OVERHEAD = 200
+
+# Preset dictionary for per-message compression: single SIP messages are too
+# short for zlib to find much repetition on its own
+_ZDICT = (
+    b"Content-Length: 0\r\nContent-Type: application/sdp\r\nUser-Agent: Asterisk PBX\r\n"
+    b"Allow: OPTIONS, REGISTER, SUBSCRIBE, NOTIFY, PUBLISH, INVITE, ACK, BYE, CANCEL, UPDATE, PRACK, MESSAGE, REFER\r\n"
+    b"Supported: 100rel, timer, replaces, norefersub\r\nSession-Expires: 1800\r\nMin-SE: 90\r\n"
+    b"Max-Forwards: 70\r\nContact: <sip:\r\nRecord-Route: <sip:;lr>\r\nRoute: <sip:\r\n"
+    b"Via: SIP/2.0/UDP ;rport;branch=z9hG4bK;received=\r\nFrom: <sip:>;tag=\r\nTo: <sip:>\r\n"
+    b"Call-ID: \r\nCSeq: 102 INVITE\r\nCSeq: 1 BYE\r\nCSeq: 1 ACK\r\nCSeq: 1 OPTIONS\r\n"
+    b"Authorization: Digest username=\"\", realm=\"asterisk\", nonce=\"\", uri=\"sip:\", response=\"\", algorithm=MD5\r\n"
+    b"WWW-Authenticate: Digest realm=\"asterisk\",nonce=\"\",opaque=\"\",algorithm=md5,qop=\"auth\"\r\n"
+    b"v=0\r\no=- IN IP4 \r\ns=Asterisk\r\nc=IN IP4 \r\nt=0 0\r\nm=audio RTP/AVP 0 8 101\r\n"
+    b"a=rtpmap:0 PCMU/8000\r\na=rtpmap:8 PCMA/8000\r\na=rtpmap:101 telephone-event/8000\r\n"
+    b"a=fmtp:101 0-16\r\na=ptime:20\r\na=maxptime:150\r\na=sendrecv\r\n"
+    b"SIP/2.0 100 Trying\r\nSIP/2.0 180 Ringing\r\nSIP/2.0 183 Session Progress\r\nSIP/2.0 200 OK\r\n"
+    b"SIP/2.0 401 Unauthorized\r\nSIP/2.0 486 Busy Here\r\nINVITE sip:\r\nACK sip:\r\nBYE sip:\r\n"
+)
+SIP_CAPTURE = os.getenv("SIP_CAPTURE", "hep")
 
 # Header patterns for parsing full SIP message text
 _CALL_ID_RE = re.compile(r"^Call-ID:\s*(.+)", re.IGNORECASE | re.MULTILINE)
 _FROM_RE = re.compile(r"^From:\s*(.+)", re.IGNORECASE | re.MULTILINE)
 _TO_RE = re.compile(r"^To:\s*(.+)", re.IGNORECASE | re.MULTILINE)
 _CSEQ_RE = re.compile(r"^CSeq:\s*(.+)", re.IGNORECASE | re.MULTILINE)
+# User part of a SIP URI in From/To: "Name" <sip:1001@host>;tag=...
+_URI_USER_RE = re.compile(r"sips?:([^@;>\s]+)@", re.IGNORECASE)
+
+# Final INVITE responses -> disposition shown in the call list
+_DISPOSITIONS = {
+    200: "answered",
+    486: "busy", 600: "busy",
+    487: "cancelled",
+    408: "no_answer", 480: "no_answer",
+}
 
 # History list line pattern:
 # "00123 1770969579 * <== 192.168.1.1:5060     INVITE sip:1001@... SIP/2.0"
@@ -36,34 +75,209 @@ _ENTRY_HEADER_RE = re.compile(
 )
 
 
-@dataclass
+def _compress(text: str) -> bytes:
+    c = zlib.compressobj(1, zdict=_ZDICT)
+    return c.compress(text.encode()) + c.flush()
+
+
+def _decompress(data: bytes) -> str:
+    d = zlib.decompressobj(zdict=_ZDICT)
+    return (d.decompress(data) + d.flush()).decode(errors="replace")
+
+
+def utc_timestamp(value: datetime) -> float:
+    """Epoch seconds of a query datetime: naive values are UTC, aware ones are converted."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc).timestamp()
+    return value.astimezone(timezone.utc).timestamp()
+
+
+def parse_sip(raw_text: str) -> tuple[str, int, str, str, str, str]:
+    """(method, status_code, call_id, from, to, cseq) of a SIP message."""
+    # Parse first line of SIP message for method/status
+    sip_first = raw_text.split("\n")[0].strip()
+    method = ""
+    status_code = 0
+    if sip_first.startswith("SIP/"):
+        parts = sip_first.split(None, 2)
+        if len(parts) >= 2:
+            try:
+                status_code = int(parts[1])
+            except ValueError:
+                pass
+    else:
+        parts = sip_first.split(None, 1)
+        if parts:
+            method = parts[0]
+
+    # Extract headers
+    call_id_m = _CALL_ID_RE.search(raw_text)
+    from_m = _FROM_RE.search(raw_text)
+    to_m = _TO_RE.search(raw_text)
+    cseq_m = _CSEQ_RE.search(raw_text)
+
+    call_id = call_id_m.group(1).strip() if call_id_m else ""
+    from_header = from_m.group(1).strip() if from_m else ""
+    to_header = to_m.group(1).strip() if to_m else ""
+    cseq = cseq_m.group(1).strip() if cseq_m else ""
+
+    return method, status_code, call_id, from_header, to_header, cseq
+
+
 class SIPMessage:
-    timestamp: datetime
-    direction: str          # "sent" or "received"
-    method: str             # INVITE, BYE, REGISTER, etc. or "" for responses
-    status_code: int        # 0 for requests, 200/180/etc. for responses
-    call_id: str
-    from_header: str
-    to_header: str
-    cseq: str
-    raw_text: str
-    addr: str               # remote address
+    __slots__ = ("ts", "direction", "method", "status_code", "call_id",
+                 "from_header", "to_header", "cseq", "addr", "data", "size")
+
+    def __init__(self, ts: float, direction: str, method: str, status_code: int, call_id: str,
+                 from_header: str, to_header: str, cseq: str, addr: str, raw_text: str):
+        self.ts = ts                    # epoch seconds (UTC)
+        self.direction = direction      # "sent" or "received"
+        self.method = method            # INVITE, BYE, REGISTER, etc. or "" for responses
+        self.status_code = status_code  # 0 for requests, 200/180/etc. for responses
+        self.call_id = call_id
+        self.from_header = from_header
+        self.to_header = to_header
+        self.cseq = cseq
+        self.addr = addr                # remote address
+        self.data = _compress(raw_text)
+        self.size = len(self.data) + len(cseq) + MESSAGE_OVERHEAD
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.utcfromtimestamp(self.ts)
+
+    @property
+    def raw_text(self) -> str:
+        return _decompress(self.data)
+
+
+class CallSummary:
+    """Per-Call-ID message queue plus the summary shown in the call list.
+    Summary, signalling metrics and the index keys are updated per message, not recomputed."""
+    __slots__ = ("call_id", "messages", "from_header", "to_header", "method", "first_ts", "last_ts",
+                 "invite_ts", "ring_ts", "answer_ts", "final_code", "cancelled", "retransmissions",
+                 "_seen", "numbers", "methods", "codes", "hosts")
+
+    def __init__(self, call_id: str, from_header: str, to_header: str):
+        self.call_id = call_id
+        self.messages: deque[SIPMessage] = deque()
+        self.from_header = from_header
+        self.to_header = to_header
+        self.method = ""
+        self.first_ts = 0.0
+        self.last_ts = 0.0
+        self.invite_ts = 0.0    # first INVITE
+        self.ring_ts = 0.0      # first 180/183 to the INVITE
+        self.answer_ts = 0.0    # first 200 to the INVITE
+        self.final_code = 0     # final (>= 200) response to the initial request
+        self.cancelled = False
+        self.retransmissions = 0
+        self._seen: set = set()
+        # Index keys this call is filed under in SIPDebugBuffer's inverted indexes
+        self.numbers: set = set()
+        self.methods: set = set()
+        self.codes: set = set()
+        self.hosts: set = set()
+
+    def track(self, msg: SIPMessage) -> None:
+        """Update timings, retransmission count and disposition from one message."""
+        if not self.first_ts:
+            self.first_ts = msg.ts
+        self.last_ts = max(self.last_ts, msg.ts)
+        # Same direction, first line and CSeq again = retransmission
+        key = (msg.direction, msg.method, msg.status_code, msg.cseq)
+        if key in self._seen:
+            self.retransmissions += 1
+            return
+        self._seen.add(key)
+
+        cseq_method = msg.cseq.rsplit(None, 1)[-1].upper() if msg.cseq else ""
+        if msg.method:
+            if msg.method == "INVITE" and not self.invite_ts:
+                self.invite_ts = msg.ts
+            elif msg.method == "CANCEL":
+                self.cancelled = True
+            return
+        code = msg.status_code
+        if cseq_method != (self.method or cseq_method):
+            return
+        if cseq_method == "INVITE":
+            if code in (180, 183) and not self.ring_ts:
+                self.ring_ts = msg.ts
+            elif code == 200 and not self.answer_ts:
+                self.answer_ts = msg.ts
+        # 401/407 are followed by an authenticated retry, not final for the call
+        if code >= 200 and code not in (401, 407) and not self.final_code:
+            self.final_code = code
+
+    @property
+    def post_dial_delay_ms(self) -> float | None:
+        if self.invite_ts and self.ring_ts:
+            return round((self.ring_ts - self.invite_ts) * 1000, 1)
+        return None
+
+    @property
+    def time_to_answer_ms(self) -> float | None:
+        if self.invite_ts and self.answer_ts:
+            return round((self.answer_ts - self.invite_ts) * 1000, 1)
+        return None
+
+    @property
+    def disposition(self) -> str:
+        if not self.final_code:
+            return "cancelled" if self.cancelled else "in_progress"
+        if self.method != "INVITE":
+            return "ok" if self.final_code < 300 else "failed"
+        return _DISPOSITIONS.get(self.final_code, "failed")
+
+    def as_dict(self) -> dict:
+        return {
+            "call_id": self.call_id,
+            "first_seen": self.messages[0].timestamp.isoformat(),
+            "from": self.from_header,
+            "to": self.to_header,
+            "method": self.method,
+            "message_count": len(self.messages),
+            "post_dial_delay_ms": self.post_dial_delay_ms,
+            "time_to_answer_ms": self.time_to_answer_ms,
+            "retransmissions": self.retransmissions,
+            "final_code": self.final_code or None,
+            "disposition": self.disposition,
+        }
 
 
 class SIPDebugBuffer:
     def __init__(self):
         self.enabled: bool = False
         self._messages: deque[SIPMessage] = deque()
-        self._by_call_id: dict[str, list[SIPMessage]] = {}
+        # Insertion order = order of first appearance, newest last
+        self._calls: dict[str, CallSummary] = {}
+        # Inverted indexes: key -> Call-IDs (numbers are From/To URI users, hosts are remote IPs)
+        self._by_number: dict[str, set[str]] = {}
+        self._by_method: dict[str, set[str]] = {}
+        self._by_code: dict[int, set[str]] = {}
+        self._by_host: dict[str, set[str]] = {}
+        self.total_bytes: int = 0
+        self.max_bytes: int = MAX_BUFFER_BYTES
         self._last_entry_num: int = -1  # last polled history entry number
         self._poll_task: asyncio.Task | None = None
+        self._hep_transport = None
         self._ami_client = None
+        self.trace_store: sip_trace.SIPTraceStore | None = None
+        self.mode: str = SIP_CAPTURE
 
     def set_ami_client(self, client):
         self._ami_client = client
 
+    def set_trace_store(self, store):
+        """Also persist every captured message on disk (see sip_trace)"""
+        self.trace_store = store
+
     async def enable(self):
-        """Enable history capture in Asterisk and start polling."""
+        """Enable capture in Asterisk and start receiving/polling."""
+        if self.mode == "hep":
+            await self._enable_hep()
+            return
         if not self._ami_client or not self._ami_client.connected:
             raise RuntimeError("AMI not connected")
         # Enable pjsip history in Asterisk
@@ -77,9 +291,77 @@ class SIPDebugBuffer:
             self._poll_task = asyncio.create_task(self._poll_loop())
         logger.info("SIP debug capture enabled (pjsip history)")
 
+    async def _enable_hep(self):
+        opened = self._hep_transport is None
+        if opened:
+            try:
+                self._hep_transport, _ = await hep.start_listener(self._on_hep_packet)
+            except OSError as e:
+                raise RuntimeError(f"HEP listener on port {hep.HEP_PORT} failed: {e}")
+        try:
+            address = await self._configure_hep()
+        except RuntimeError:
+            if opened:
+                self._hep_transport.close()
+                self._hep_transport = None
+            raise
+        self.enabled = True
+        logger.info(f"SIP debug capture enabled (HEP -> {address})")
+
+    async def _configure_hep(self) -> str:
+        """Point Asterisk's HEP capture at this listener; returns the capture address."""
+        host = self._ami_client.host if self._ami_client else "asterisk"
+        try:
+            address = await asyncio.to_thread(hep.capture_address, host)
+        except OSError as e:
+            raise RuntimeError(f"Cannot determine HEP capture address towards {host}: {e}")
+        if not address:
+            raise RuntimeError(f"Cannot determine HEP capture address towards {host}")
+        if not hep.write_hep_config(True, address):
+            raise RuntimeError("Writing hep.conf failed")
+        if not await asyncio.to_thread(hep.reload_hep):
+            raise RuntimeError("Loading HEP capture in Asterisk failed")
+        return address
+
+    async def _disable_hep(self):
+        if hep.write_hep_config(False):
+            await asyncio.to_thread(hep.reload_hep)
+        if self._hep_transport is not None:
+            self._hep_transport.close()
+            self._hep_transport = None
+
+    def _on_hep_packet(self, packet: hep.HEPPacket, sender_ip: str):
+        if not self.enabled:
+            return
+        # Asterisk sends HEP from the address it uses for SIP, so packets it sent
+        # carry its own address as source
+        sent = packet.src_ip == sender_ip
+        if sent:
+            addr = f"{packet.dst_ip}:{packet.dst_port}"
+        else:
+            addr = f"{packet.src_ip}:{packet.src_port}"
+        raw_text = packet.payload.decode("utf-8", errors="replace").replace("\r\n", "\n").strip()
+        timestamp = datetime.utcfromtimestamp(packet.timestamp) if packet.timestamp else datetime.utcnow()
+        call_id = self.add_message(raw_text, "sent" if sent else "received", addr, timestamp)
+        if call_id and self.trace_store:
+            self._persist(timestamp, sent, (packet.src_ip, packet.src_port), (packet.dst_ip, packet.dst_port),
+                          packet.payload, call_id)
+
+    def _persist(self, timestamp: datetime, sent: bool, src: tuple, dst: tuple, payload: bytes, call_id: str):
+        try:
+            self.trace_store.append(timestamp.replace(tzinfo=timezone.utc).timestamp(), sent, src, dst,
+                                    payload, call_id)
+        except (OSError, ValueError) as e:
+            logger.error(f"SIP trace persistence failed, disabling it: {e}")
+            self.trace_store = None
+
     async def disable(self):
-        """Disable history capture."""
+        """Disable capture."""
         self.enabled = False
+        if self.mode == "hep":
+            await self._disable_hep()
+            logger.info("SIP debug capture disabled")
+            return
         if self._ami_client and self._ami_client.connected:
             try:
                 await self._ami_client.send_action("Command", Command="pjsip set history off")
@@ -182,67 +464,166 @@ class SIPDebugBuffer:
 
         if not raw_text:
             return
+        call_id = self.add_message(raw_text, direction, addr, timestamp)
+        if call_id and self.trace_store:
+            # pjsip history does not tell our own address
+            local, remote = ("0.0.0.0", 5060), sip_trace.split_addr(addr)
+            sent = direction == "sent"
+            self._persist(timestamp, sent, local if sent else remote, remote if sent else local,
+                          raw_text.replace("\n", "\r\n").encode() + b"\r\n\r\n", call_id)
+
+    def add_message(self, raw_text: str, direction: str, addr: str, timestamp: datetime) -> str:
+        """Parse one SIP message and store it under its Call-ID. Returns the Call-ID ("" if dropped)."""
+        method, status_code, call_id, from_header, to_header, cseq = parse_sip(raw_text)
+        if not call_id:
+            return ""
 
-        # Parse first line of SIP message for method/status
-        sip_first = raw_text.split("\n")[0].strip()
-        method = ""
-        status_code = 0
-        if sip_first.startswith("SIP/"):
-            parts = sip_first.split(None, 2)
-            if len(parts) >= 2:
-                try:
-                    status_code = int(parts[1])
-                except ValueError:
-                    pass
+        call = self._calls.get(call_id)
+        if call is None:
+            call_id = sys.intern(call_id)
+            call = CallSummary(call_id, from_header, to_header)
+            self._calls[call_id] = call
+            self._index_call(call)
         else:
-            parts = sip_first.split(None, 1)
-            if parts:
-                method = parts[0]
-
-        # Extract headers
-        call_id_m = _CALL_ID_RE.search(raw_text)
-        from_m = _FROM_RE.search(raw_text)
-        to_m = _TO_RE.search(raw_text)
-        cseq_m = _CSEQ_RE.search(raw_text)
-
-        call_id = call_id_m.group(1).strip() if call_id_m else ""
-        from_header = from_m.group(1).strip() if from_m else ""
-        to_header = to_m.group(1).strip() if to_m else ""
-        cseq = cseq_m.group(1).strip() if cseq_m else ""
-
-        if not call_id:
-            return
+            call_id = call.call_id
+            # Headers repeat within a dialog (apart from the To tag), share the strings
+            if from_header == call.from_header:
+                from_header = call.from_header
+            if to_header == call.to_header:
+                to_header = call.to_header
+        if method and not call.method:
+            call.method = method
 
         msg = SIPMessage(
-            timestamp=timestamp,
-            direction=direction,
-            method=method,
+            ts=timestamp.replace(tzinfo=timezone.utc).timestamp(),
+            direction=sys.intern(direction),
+            method=sys.intern(method),
             status_code=status_code,
             call_id=call_id,
             from_header=from_header,
             to_header=to_header,
             cseq=cseq,
+            addr=sys.intern(addr),
             raw_text=raw_text,
-            addr=addr,
         )
-
-        # Store
         self._messages.append(msg)
-        if call_id not in self._by_call_id:
-            self._by_call_id[call_id] = []
-        self._by_call_id[call_id].append(msg)
-
-        # Hard cap
-        while len(self._messages) > MAX_MESSAGES:
-            old = self._messages.popleft()
-            cid_list = self._by_call_id.get(old.call_id)
-            if cid_list:
-                try:
-                    cid_list.remove(old)
-                except ValueError:
-                    pass
-                if not cid_list:
-                    del self._by_call_id[old.call_id]
+        call.messages.append(msg)
+        self.total_bytes += msg.size
+        call.track(msg)
+        self._index_message(call, msg)
+
+        while self.total_bytes > self.max_bytes and self._messages:
+            self._evict_oldest()
+        return call_id
+
+    def _evict_oldest(self):
+        """Drop the oldest message. Messages of a call are appended in global order,
+        so it is always the head of its call's queue."""
+        old = self._messages.popleft()
+        self.total_bytes -= old.size
+        call = self._calls.get(old.call_id)
+        if call is None:
+            return
+        if call.messages and call.messages[0] is old:
+            call.messages.popleft()
+        else:
+            # Only possible for out-of-order timestamps from history polling
+            try:
+                call.messages.remove(old)
+            except ValueError:
+                pass
+        if not call.messages:
+            del self._calls[old.call_id]
+            self._unindex(call)
+
+    # ==================== Indexes ====================
+
+    @staticmethod
+    def _add_key(index: dict, key, call_id: str, keys: set):
+        if key in keys:
+            return
+        keys.add(key)
+        ids = index.get(key)
+        if ids is None:
+            index[key] = {call_id}
+        else:
+            ids.add(call_id)
+
+    def _index_call(self, call: CallSummary):
+        for header in (call.from_header, call.to_header):
+            m = _URI_USER_RE.search(header)
+            if m:
+                self._add_key(self._by_number, m.group(1), call.call_id, call.numbers)
+
+    def _index_message(self, call: CallSummary, msg: SIPMessage):
+        if msg.method:
+            self._add_key(self._by_method, msg.method, call.call_id, call.methods)
+        else:
+            self._add_key(self._by_code, msg.status_code, call.call_id, call.codes)
+        if msg.addr:
+            self._add_key(self._by_host, msg.addr.rsplit(":", 1)[0], call.call_id, call.hosts)
+
+    def _unindex(self, call: CallSummary):
+        for index, keys in ((self._by_number, call.numbers), (self._by_method, call.methods),
+                            (self._by_code, call.codes), (self._by_host, call.hosts)):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(call.call_id)
+                    if not ids:
+                        del index[key]
+
+    @staticmethod
+    def _lookup(index: dict, value: str) -> set:
+        """Exact key match, falling back to a substring match over the index keys."""
+        if value in index:
+            return set(index[value])
+        result = set()
+        for key, ids in index.items():
+            if value in key:
+                result |= ids
+        return result
+
+    def search(self, number: str | None = None, method: str | None = None, code: int | None = None,
+               addr: str | None = None, since: datetime | None = None, until: datetime | None = None,
+               disposition: str | None = None, min_post_dial_delay_ms: float | None = None,
+               limit: int = 100) -> list[dict]:
+        """Calls matching all given filters, newest first."""
+        self.cleanup_old()
+        candidates: set | None = None
+        for ids in (
+            self._lookup(self._by_number, number) if number else None,
+            set(self._by_method.get(method.upper(), ())) if method else None,
+            set(self._by_code.get(code, ())) if code else None,
+            self._lookup(self._by_host, addr.rsplit(":", 1)[0] if addr.count(":") == 1 else addr) if addr else None,
+        ):
+            if ids is not None:
+                candidates = ids if candidates is None else candidates & ids
+        if candidates is not None and not candidates:
+            return []
+
+        since_ts = utc_timestamp(since) if since else None
+        until_ts = utc_timestamp(until) if until else None
+        if candidates is None:
+            calls = reversed(self._calls.values())
+        else:
+            # Only the indexed matches are walked, not every call in the buffer
+            calls = sorted((self._calls[call_id] for call_id in candidates if call_id in self._calls),
+                           key=lambda call: call.first_ts, reverse=True)
+        results = []
+        for call in calls:
+            if since_ts is not None and call.last_ts < since_ts:
+                continue
+            if until_ts is not None and call.first_ts > until_ts:
+                continue
+            if disposition and call.disposition != disposition:
+                continue
+            if min_post_dial_delay_ms is not None and (call.post_dial_delay_ms or 0) < min_post_dial_delay_ms:
+                continue
+            results.append(call.as_dict())
+            if len(results) >= limit:
+                break
+        return results
 
     def _extract_command_output(self, response) -> str:
         """Extract text output from an AMI Command response."""
@@ -274,46 +655,29 @@ class SIPDebugBuffer:
 
     def cleanup_old(self):
         """Remove messages older than MAX_AGE."""
-        cutoff = datetime.utcnow() - MAX_AGE
-        while self._messages and self._messages[0].timestamp < cutoff:
-            old = self._messages.popleft()
-            cid_list = self._by_call_id.get(old.call_id)
-            if cid_list:
-                try:
-                    cid_list.remove(old)
-                except ValueError:
-                    pass
-                if not cid_list:
-                    del self._by_call_id[old.call_id]
+        cutoff = (datetime.utcnow() - MAX_AGE).replace(tzinfo=timezone.utc).timestamp()
+        while self._messages and self._messages[0].ts < cutoff:
+            self._evict_oldest()
+
+    @property
+    def message_count(self) -> int:
+        return len(self._messages)
+
+    @property
+    def call_count(self) -> int:
+        return len(self._calls)
 
     def get_calls(self) -> list[dict]:
-        """Return list of calls with summary info."""
+        """Return list of calls with summary info, newest first."""
         self.cleanup_old()
-        calls = []
-        for call_id, msgs in self._by_call_id.items():
-            if not msgs:
-                continue
-            first = msgs[0]
-            primary_method = ""
-            for m in msgs:
-                if m.method:
-                    primary_method = m.method
-                    break
-            calls.append({
-                "call_id": call_id,
-                "first_seen": first.timestamp.isoformat(),
-                "from": first.from_header,
-                "to": first.to_header,
-                "method": primary_method,
-                "message_count": len(msgs),
-            })
-        calls.sort(key=lambda c: c["first_seen"], reverse=True)
-        return calls
+        return [call.as_dict() for call in reversed(self._calls.values())]
 
     def get_call_messages(self, call_id: str) -> list[dict]:
         """Return all messages for a given Call-ID."""
         self.cleanup_old()
-        msgs = self._by_call_id.get(call_id, [])
+        call = self._calls.get(call_id)
+        if call is None:
+            return []
         return [
             {
                 "timestamp": m.timestamp.isoformat(),
@@ -326,15 +690,44 @@ class SIPDebugBuffer:
                 "raw_text": m.raw_text,
                 "addr": m.addr,
             }
-            for m in msgs
+            for m in call.messages
         ]
 
+    def get_stored_call_messages(self, call_id: str) -> list[dict]:
+        """Messages of a Call-ID from the on-disk trace store (blocking, run in a thread)."""
+        if not self.trace_store:
+            return []
+        result = []
+        for record in self.trace_store.iter_records(call_id=call_id):
+            raw_text = record.payload.decode("utf-8", errors="replace").replace("\r\n", "\n").strip()
+            method, status_code, _, from_header, to_header, cseq = parse_sip(raw_text)
+            result.append({
+                "timestamp": datetime.utcfromtimestamp(record.ts).isoformat(),
+                "direction": "sent" if record.sent else "received",
+                "method": method,
+                "status_code": status_code,
+                "from": from_header,
+                "to": to_header,
+                "cseq": cseq,
+                "raw_text": raw_text,
+                "addr": record.remote_addr,
+            })
+        return result
+
     def clear(self):
         """Clear all stored messages."""
         self._messages.clear()
-        self._by_call_id.clear()
+        self._calls.clear()
+        self._by_number.clear()
+        self._by_method.clear()
+        self._by_code.clear()
+        self._by_host.clear()
+        self.total_bytes = 0
         self._last_entry_num = -1
 
 
 # Singleton instance
 sip_debug_buffer = SIPDebugBuffer()
+
+metrics.SIP_DEBUG_MESSAGES.set_function(lambda: sip_debug_buffer.message_count)
+metrics.SIP_DEBUG_BYTES.set_function(lambda: sip_debug_buffer.total_bytes)
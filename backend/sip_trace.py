@@ -0,0 +1,386 @@
+"""
+SIP Trace Store - Persists captured SIP messages on disk for later export.
+Messages are appended to preallocated, memory-mapped segment files
+(SIP_TRACE_SEGMENT_MB each). A sealed segment gets a small sidecar index
+(<segment>.idx: time range, sparse time->offset samples, Call-ID->offsets) that
+is only loaded when an export needs it. Oldest segments are deleted once the
+total exceeds SIP_TRACE_DISK_MB. Exports stream pcap (LINKTYPE_RAW, synthesized
+IPv4/IPv6 + UDP headers) record by record, without reading whole segments.
+
+Segment layout: 8 byte magic, then records of
+  payload_len u32 | ts f64 | flags u8 (1 = sent, 2 = IPv6) | src ip 16s | src port u16 |
+  dst ip 16s | dst port u16 | payload
+A zero payload_len marks the unused (preallocated) tail.
+"""
+import bisect
+import ipaddress
+import json
+import logging
+import mmap
+import os
+import re
+import socket
+import struct
+import time
+from typing import Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SIP_TRACE_DIR = os.getenv("SIP_TRACE_DIR", "/app/uploads/sip-traces")
+SIP_TRACE_DISK_BYTES = int(float(os.getenv("SIP_TRACE_DISK_MB", "512")) * 1024 * 1024)
+SIP_TRACE_SEGMENT_BYTES = int(float(os.getenv("SIP_TRACE_SEGMENT_MB", "16")) * 1024 * 1024)
+
+MAGIC = b"GSIPSEG1"
+_REC = struct.Struct("!IdB16sH16sH")
+FLAG_SENT = 1
+FLAG_IPV6 = 2
+TIME_SAMPLE_EVERY = 128
+
+_CALL_ID_RE = re.compile(rb"^(?:Call-ID|i):\s*(\S+)", re.IGNORECASE | re.MULTILINE)
+
+# pcap: microsecond timestamps, LINKTYPE_RAW (packet starts with the IP header)
+_PCAP_HEADER = struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 101)
+_PCAP_RECORD = struct.Struct("<IIII")
+
+
+_V4_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+def _pack_ip(addr: str) -> Tuple[bytes, bool]:
+    """16 byte address (IPv4 mapped into IPv6) and whether it is a real IPv6 address."""
+    try:
+        return _V4_PREFIX + socket.inet_pton(socket.AF_INET, addr), False
+    except OSError:
+        pass
+    try:
+        return socket.inet_pton(socket.AF_INET6, addr), True
+    except OSError:
+        return _V4_PREFIX + b"\x00" * 4, False
+
+
+def split_addr(addr: str, default_port: int = 5060) -> Tuple[str, int]:
+    """'1.2.3.4:5060' / '[2001:db8::1]:5060' -> (host, port)."""
+    if addr.startswith("["):
+        host, _, port = addr[1:].partition("]:")
+    elif addr.count(":") == 1:
+        host, _, port = addr.partition(":")
+    else:
+        host, port = addr, ""
+    try:
+        return host, int(port) if port else default_port
+    except ValueError:
+        return host, default_port
+
+
+class TraceRecord:
+    __slots__ = ("ts", "sent", "ipv6", "src_ip", "src_port", "dst_ip", "dst_port", "payload")
+
+    def __init__(self, ts, flags, src_ip, src_port, dst_ip, dst_port, payload):
+        self.ts = ts
+        self.sent = bool(flags & FLAG_SENT)
+        self.ipv6 = bool(flags & FLAG_IPV6)
+        self.src_ip = src_ip
+        self.src_port = src_port
+        self.dst_ip = dst_ip
+        self.dst_port = dst_port
+        self.payload = payload
+
+    @property
+    def remote_addr(self) -> str:
+        """ip:port of the other side (destination of sent, source of received messages)."""
+        ip, port = (self.dst_ip, self.dst_port) if self.sent else (self.src_ip, self.src_port)
+        address = ipaddress.IPv6Address(ip)
+        if address.ipv4_mapped:
+            return f"{address.ipv4_mapped}:{port}"
+        return f"[{address}]:{port}"
+
+
+def _read_records(mm, start: int, end: int) -> Iterator[Tuple[int, TraceRecord]]:
+    offset = start
+    while offset + _REC.size <= end:
+        length, ts, flags, src, sport, dst, dport = _REC.unpack_from(mm, offset)
+        if length == 0 or offset + _REC.size + length > end:
+            return
+        payload = mm[offset + _REC.size:offset + _REC.size + length]
+        yield offset, TraceRecord(ts, flags, src, sport, dst, dport, payload)
+        offset += _REC.size + length
+
+
+class Segment:
+    def __init__(self, path: str):
+        self.path = path
+        self.size = len(MAGIC)      # used bytes
+        self.first_ts = 0.0
+        self.last_ts = 0.0
+        self.count = 0
+        # Only populated for the active segment; sealed ones keep them in the .idx file
+        self.calls: Optional[dict] = None
+        self.times: Optional[list] = None
+
+    @property
+    def index_path(self) -> str:
+        return self.path + ".idx"
+
+    def note(self, offset: int, ts: float, call_id: str):
+        if not self.first_ts:
+            self.first_ts = ts
+        self.last_ts = max(self.last_ts, ts)
+        if self.count % TIME_SAMPLE_EVERY == 0:
+            self.times.append((ts, offset))
+        self.count += 1
+        if call_id:
+            self.calls.setdefault(call_id, []).append(offset)
+
+    def write_index(self):
+        data = {"size": self.size, "first_ts": self.first_ts, "last_ts": self.last_ts, "count": self.count,
+                "times": self.times, "calls": self.calls}
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, self.index_path)
+
+    def load_index(self) -> Tuple[list, dict]:
+        """(times, calls) of this segment."""
+        if self.calls is not None:
+            return self.times, self.calls
+        with open(self.index_path) as f:
+            data = json.load(f)
+        return data["times"], data["calls"]
+
+    def rebuild(self):
+        """Scan the segment (e.g. after a crash) and write its index; trims the unused tail."""
+        self.calls, self.times = {}, []
+        self.count, self.first_ts, self.last_ts = 0, 0.0, 0.0
+        end = len(MAGIC)
+        with open(self.path, "r+b") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if file_size > len(MAGIC):
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for offset, record in _read_records(mm, len(MAGIC), file_size):
+                        m = _CALL_ID_RE.search(record.payload)
+                        self.note(offset, record.ts, m.group(1).decode(errors="replace") if m else "")
+                        end = offset + _REC.size + len(record.payload)
+            f.truncate(end)
+        self.size = end
+        self.write_index()
+        self.calls = self.times = None
+
+    def load_summary(self) -> bool:
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.size, self.first_ts, self.last_ts, self.count = data["size"], data["first_ts"], data["last_ts"], data["count"]
+        return True
+
+
+class SIPTraceStore:
+    def __init__(self, directory: str = SIP_TRACE_DIR, disk_budget: int = SIP_TRACE_DISK_BYTES,
+                 segment_bytes: int = SIP_TRACE_SEGMENT_BYTES):
+        self.directory = directory
+        self.disk_budget = disk_budget
+        # At least four segments fit the budget, so deleting one never drops most of the history
+        self.segment_bytes = max(64 * 1024, min(segment_bytes, disk_budget // 4))
+        self.sealed: List[Segment] = []
+        self.active: Optional[Segment] = None
+        self._file = None
+        self._mm: Optional[mmap.mmap] = None
+        self._seq = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+
+    # ==================== Segments ====================
+
+    def _load_existing(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(".seg"))
+        for name in names:
+            segment = Segment(os.path.join(self.directory, name))
+            if not segment.load_summary():
+                try:
+                    segment.rebuild()
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Dropping unreadable SIP trace segment {name}: {e}")
+                    self._remove(segment)
+                    continue
+            if segment.count:
+                self.sealed.append(segment)
+            else:
+                self._remove(segment)
+            self._seq = max(self._seq, int(name.split("-")[-1].split(".")[0]) + 1)
+        if self.sealed:
+            logger.info(f"SIP trace store: {len(self.sealed)} segments, {self.disk_usage() // 1024} KB on disk")
+
+    def _open_segment(self):
+        name = f"sip-{time.strftime('%Y%m%d%H%M%S', time.gmtime())}-{self._seq:06d}.seg"
+        self._seq += 1
+        segment = Segment(os.path.join(self.directory, name))
+        segment.calls, segment.times = {}, []
+        self._file = open(segment.path, "w+b")
+        self._file.truncate(self.segment_bytes)
+        self._mm = mmap.mmap(self._file.fileno(), self.segment_bytes)
+        self._mm[:len(MAGIC)] = MAGIC
+        self.active = segment
+
+    def _seal(self):
+        segment = self.active
+        self._mm.flush()
+        self._mm.close()
+        self._file.truncate(segment.size)
+        self._file.close()
+        self._mm = self._file = None
+        self.active = None
+        segment.write_index()
+        segment.calls = segment.times = None
+        self.sealed.append(segment)
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        # Leave room for the next active segment, which is preallocated in full
+        while self.sealed and sum(s.size for s in self.sealed) + self.segment_bytes > self.disk_budget:
+            self._remove(self.sealed.pop(0))
+
+    @staticmethod
+    def _remove(segment: Segment):
+        for path in (segment.path, segment.index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def disk_usage(self) -> int:
+        used = sum(s.size for s in self.sealed)
+        return used + (self.segment_bytes if self.active else 0)
+
+    # ==================== Write ====================
+
+    def append(self, ts: float, sent: bool, src: Tuple[str, int], dst: Tuple[str, int], payload: bytes,
+               call_id: str = ""):
+        """Append one SIP message. src/dst are (ip, port)."""
+        needed = _REC.size + len(payload)
+        if needed > self.segment_bytes - len(MAGIC):
+            return
+        if self.active and self.active.size + needed > self.segment_bytes:
+            self._seal()
+        if self.active is None:
+            self._open_segment()
+        src_ip, v6_src = _pack_ip(src[0])
+        dst_ip, v6_dst = _pack_ip(dst[0])
+        flags = (FLAG_SENT if sent else 0) | (FLAG_IPV6 if v6_src or v6_dst else 0)
+        offset = self.active.size
+        _REC.pack_into(self._mm, offset, len(payload), ts, flags, src_ip, src[1] & 0xffff, dst_ip, dst[1] & 0xffff)
+        self._mm[offset + _REC.size:offset + needed] = payload
+        self.active.size += needed
+        self.active.note(offset, ts, call_id)
+
+    def close(self):
+        if self.active:
+            self._seal()
+
+    # ==================== Read ====================
+
+    def segments(self, since: Optional[float] = None, until: Optional[float] = None) -> List[Segment]:
+        result = []
+        for segment in self.sealed + ([self.active] if self.active else []):
+            if since is not None and segment.last_ts < since:
+                continue
+            if until is not None and segment.first_ts > until:
+                continue
+            result.append(segment)
+        return result
+
+    def iter_records(self, call_id: Optional[str] = None, since: Optional[float] = None,
+                     until: Optional[float] = None) -> Iterator[TraceRecord]:
+        """Records matching a Call-ID and/or time window, oldest first. Safe to run in a
+        worker thread while the event loop keeps appending."""
+        for segment in self.segments(since, until):
+            end = segment.size
+            try:
+                times, calls = segment.load_index()
+                f = open(segment.path, "rb")
+            except (OSError, ValueError):
+                continue   # deleted by retention in the meantime
+            with f:
+                length = min(end, os.fstat(f.fileno()).st_size)
+                if length <= len(MAGIC):
+                    continue
+                with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) as mm:
+                    if call_id:
+                        for offset in list(calls.get(call_id, ())):
+                            record = next(_read_records(mm, offset, length), (None, None))[1]
+                            if record is None:
+                                continue
+                            if (since is None or record.ts >= since) and (until is None or record.ts <= until):
+                                yield record
+                        continue
+                    start = len(MAGIC)
+                    if since is not None and times:
+                        i = bisect.bisect_right([t for t, _ in times], since) - 1
+                        if i > 0:
+                            start = times[i][1]
+                    for _, record in _read_records(mm, start, length):
+                        if since is not None and record.ts < since:
+                            continue
+                        if until is not None and record.ts > until:
+                            break
+                        yield record
+
+    def stats(self) -> dict:
+        return {
+            "directory": self.directory,
+            "disk_bytes": self.disk_usage(),
+            "disk_budget_bytes": self.disk_budget,
+            "segments": [
+                {"name": os.path.basename(s.path), "bytes": s.size, "messages": s.count,
+                 "first_ts": s.first_ts or None, "last_ts": s.last_ts or None, "active": s is self.active}
+                for s in self.segments()
+            ],
+        }
+
+
+# ==================== pcap ====================
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def _frame(record: TraceRecord) -> bytes:
+    udp_len = 8 + len(record.payload)
+    if record.ipv6:
+        pseudo = record.src_ip + record.dst_ip + struct.pack("!IxxxB", udp_len, 17)
+        udp = struct.pack("!HHHH", record.src_port, record.dst_port, udp_len, 0)
+        checksum = _checksum(pseudo + udp + record.payload) or 0xffff
+        udp = struct.pack("!HHHH", record.src_port, record.dst_port, udp_len, checksum)
+        ip = struct.pack("!IHBB16s16s", 6 << 28, udp_len, 17, 64, record.src_ip, record.dst_ip)
+    else:
+        # UDP checksum 0 = not computed, valid for IPv4
+        udp = struct.pack("!HHHH", record.src_port, record.dst_port, udp_len, 0)
+        header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + udp_len, 0, 0x4000, 64, 17, 0,
+                             record.src_ip[12:], record.dst_ip[12:])
+        ip = header[:10] + struct.pack("!H", _checksum(header)) + header[12:]
+    return ip + udp + record.payload
+
+
+def iter_pcap(records: Iterator[TraceRecord]) -> Iterator[bytes]:
+    """pcap file as a stream of chunks: global header, then one chunk per packet."""
+    yield _PCAP_HEADER
+    for record in records:
+        frame = _frame(record)
+        sec = int(record.ts)
+        yield _PCAP_RECORD.pack(sec, int((record.ts - sec) * 1_000_000), len(frame), len(frame)) + frame
+
+
+def create_from_env() -> Optional[SIPTraceStore]:
+    """Store for SIP_TRACE_DIR, or None when persistence is off (empty SIP_TRACE_DIR)."""
+    if not SIP_TRACE_DIR:
+        return None
+    try:
+        return SIPTraceStore(SIP_TRACE_DIR)
+    except OSError as e:
+        logger.error(f"SIP trace persistence disabled, cannot use {SIP_TRACE_DIR}: {e}")
+        return None
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Backend modules are imported flat (as main.py does)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Throwaway SQLite database unless a test database is configured
+_tmp = tempfile.mkdtemp(prefix="pbx-tests-")
+_db_path = os.path.join(_tmp, "test.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_db_path}")
+os.environ.setdefault("ASYNC_DATABASE_URL", f"sqlite+aiosqlite:///{_db_path}")
+os.environ.setdefault("VOICEMAIL_CACHE_DIR", os.path.join(_tmp, "voicemail-cache"))
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from ami_pool import AMIActionPool, CircuitOpenError
+
+
+class FakeManager:
+    authenticated = True
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    async def send_action(self, action):
+        await asyncio.sleep(self.delay)
+        return {"Response": "Success"}
+
+
+def _half_open_pool(manager) -> AMIActionPool:
+    pool = AMIActionPool(lambda: manager, size=1)
+    pool._managers = [manager]
+    pool._inflight[id(manager)] = 0
+    pool.breaker.state = "open"
+    pool.breaker.opened_at = 0.0  # reset timeout long over
+    return pool
+
+
+def test_cancelled_trial_releases_half_open_breaker():
+    async def scenario():
+        manager = FakeManager(delay=10)
+        pool = _half_open_pool(manager)
+        trial = asyncio.create_task(pool.send_action({"Action": "Ping"}))
+        await asyncio.sleep(0.01)
+        assert pool.breaker.state == "half_open"
+        with pytest.raises(CircuitOpenError):
+            await pool.send_action({"Action": "Ping"})
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        manager.delay = 0
+        assert await pool.send_action({"Action": "Ping"}) == {"Response": "Success"}
+        assert pool.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_unexpected_error_in_trial_releases_half_open_breaker():
+    class BrokenManager(FakeManager):
+        async def send_action(self, action):
+            raise ValueError("garbled response")
+
+    async def scenario():
+        pool = _half_open_pool(BrokenManager())
+        with pytest.raises(ValueError):
+            await pool.send_action({"Action": "Ping"})
+        pool._managers = [FakeManager()]
+        assert await pool.send_action({"Action": "Ping"}) == {"Response": "Success"}
+        assert pool.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_timed_out_trial_reopens_breaker():
+    async def scenario():
+        pool = _half_open_pool(FakeManager(delay=1))
+        with pytest.raises(TimeoutError):
+            await pool.send_action({"Action": "Ping"}, timeout=0.01)
+        assert pool.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await pool.send_action({"Action": "Ping"})
+
+    asyncio.run(scenario())
@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+
+from auth import get_current_user
+from database import Base, engine, User
+import callerid_index
+from callerid_index import CallerIDIndex
+import main
+
+
+def test_removing_one_of_two_contacts_with_the_same_number_keeps_the_other():
+    index = CallerIDIndex()
+    index.load([(1, None, "Alice", None, "+49 221 123456", None)])
+    index.upsert(2, None, "Bob", None, "0221 123456", None)
+    assert index.lookup("+49221123456")["name"] == "Bob"
+    index.remove(2)
+    assert index.lookup("+49221123456")["name"] == "Alice"
+    index.remove(1)
+    assert index.lookup("+49221123456") is None
+
+
+def test_switchboard_prefix_survives_removal_of_a_duplicate():
+    index = CallerIDIndex()
+    index.upsert(1, None, "Zentrale", "ACME", "+49 221 66980-0", None)
+    index.upsert(2, None, "Empfang", "ACME", "0221 66980-0", None)
+    index.remove(2)
+    match = index.lookup("+4922166980123")
+    assert match["contact_id"] == 1 and match["display_name"] == "ACME"
+
+
+def test_extension_book_wins_over_global():
+    index = CallerIDIndex()
+    index.upsert(1, None, "Global", None, "030 5550", None)
+    index.upsert(2, "1001", "Privat", None, "030 5550", None)
+    assert index.lookup("030 5550", "1001")["name"] == "Privat"
+    assert index.lookup("030 5550", "1002")["name"] == "Global"
+    index.remove(2)
+    assert index.lookup("030 5550", "1001")["name"] == "Global"
+
+
+def test_lookup_in_another_extensions_book_is_forbidden():
+    Base.metadata.create_all(bind=engine)
+    callerid_index.index.upsert(9001, "1001", "Privat", None, "030 5551", None)
+    main.app.dependency_overrides[get_current_user] = lambda: User(id=42, username="other", role="user")
+    try:
+        client = TestClient(main.app)
+        assert client.get("/api/contacts/lookup", params={"number": "030 5551", "extension": "1001"}).status_code == 403
+    finally:
+        main.app.dependency_overrides.clear()
+        callerid_index.index.remove(9001)
@@ -0,0 +1,24 @@
+import config_jobs
+
+
+def _run_queued(monkeypatch, jobs):
+    processed = []
+    monkeypatch.setattr(config_jobs, "_process", lambda batch: processed.append([job["id"] for job in batch]))
+    for job in jobs:
+        config_jobs._queue.put(job)
+    config_jobs._run()
+    return processed
+
+
+def _job(job_id, action="apply"):
+    return {"id": job_id, "action": action}
+
+
+def test_rollback_runs_before_applies_queued_after_it(monkeypatch):
+    processed = _run_queued(monkeypatch, [_job("A1"), _job("R", "rollback"), _job("A2"), _job("A3"), None])
+    assert processed == [["A1"], ["R"], ["A2", "A3"]]
+
+
+def test_rollback_queued_before_stop_is_processed(monkeypatch):
+    processed = _run_queued(monkeypatch, [_job("A1"), _job("R", "rollback"), None])
+    assert processed == [["A1"], ["R"]]
@@ -0,0 +1,32 @@
+import io
+
+import pytest
+from fastapi import HTTPException
+
+import contact_import
+
+
+def _names(data: bytes, monkeypatch, chunk: int = 64 * 1024):
+    monkeypatch.setattr(contact_import, "READ_CHUNK_BYTES", chunk)
+    return [row["name"] for row in contact_import._rows(contact_import._lines(io.BytesIO(data)))]
+
+
+def test_latin1_after_first_chunk_is_not_replaced(monkeypatch):
+    lines = ["name,external_number"] + [f"Kontakt {i},0221 {i:07d}" for i in range(3000)] + ["Müller,0221 5550"]
+    data = "\n".join(lines).encode("latin-1")
+    assert len(data) > 64 * 1024
+    names = _names(data, monkeypatch)
+    assert len(names) == 3001
+    assert names[-1] == "Müller"
+
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 7, 4096])
+def test_utf8_and_line_endings_across_chunk_boundaries(monkeypatch, chunk):
+    data = "﻿name,company\r\nJürgen,\"Firma\r\nmit Umbruch\"\r\nÖzil,X\rZoë,Y\n".encode("utf-8")
+    assert _names(data, monkeypatch, chunk) == ["Jürgen", "Özil", "Zoë"]
+
+
+def test_mixed_encodings_are_rejected(monkeypatch):
+    data = "name\nJürgen\n".encode("utf-8") + "Müller\n".encode("latin-1")
+    with pytest.raises(HTTPException):
+        _names(data, monkeypatch, chunk=4)
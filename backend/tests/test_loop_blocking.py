@@ -0,0 +1,115 @@
+"""
+The async handlers must never block the event loop: they use the async database
+layer (get_async_db) and hand blocking work to threads. A lag probe on the loop
+measures how late a 1 ms sleep wakes up while every handler is called once per
+round; a sync query or file access in a handler shows up as lag in every round.
+The median of the per-round maxima is checked against a limit well above
+scheduler noise on a loaded machine but below a blocked loop, and a known
+blocking call is run through the same probe as a positive control.
+"""
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from auth import get_current_user
+from database import Base, engine, async_engine, SessionLocal, CDR, SIPTrunk, VoicemailMailbox, User
+import main
+from routers.voicemail import VoicemailRecord
+
+MAX_LAG_MS = 50.0
+BLOCKING_CALL_MS = 200
+ROUNDS = 7
+
+ASYNC_ENDPOINTS = [
+    ("GET", "/api/cdr/", None),
+    ("GET", "/api/cdr/count", None),
+    ("GET", "/api/cdr/stats", None),
+    ("GET", "/api/cdr/recent", None),
+    ("GET", "/api/voicemail/?limit=100", None),
+    ("GET", "/api/voicemail/stats", None),
+    ("GET", "/api/voicemail/stats/1001", None),
+    ("GET", "/api/voicemail/mailbox/1001", None),
+    ("PUT", "/api/voicemail/mailbox/1001", {"enabled": True, "pin": "4711", "name": "Test", "ring_timeout": 25}),
+    ("GET", "/api/dashboard/status", None),
+    ("GET", "/api/trunks/1/status", None),
+]
+
+
+def _seed():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        db.add_all(CDR(call_date=now - timedelta(minutes=i), src=f"10{i % 10:02d}", dst="+4922112345",
+                       disposition="ANSWERED" if i % 3 else "NO ANSWER", duration=60, billsec=50)
+                   for i in range(2000))
+        db.add_all(VoicemailRecord(mailbox="1001", caller_id=f"Caller {i}", duration=10, is_read=bool(i % 2),
+                                   date=now - timedelta(hours=i), file_path=f"/nonexistent/msg{i:04d}.wav",
+                                   folder="INBOX", msg_id=f"msg{i:04d}")
+                   for i in range(500))
+        db.add(VoicemailMailbox(extension="1001", name="Test"))
+        db.add(SIPTrunk(name="Test", provider="plusnet_basic", sip_server="sip.example.org"))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _probe(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append((time.perf_counter() - start - 0.001) * 1000)
+
+
+async def _drive(client: httpx.AsyncClient) -> list:
+    """Worst lag per round, in ms"""
+    lags, stop = [], asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+    round_max = []
+    try:
+        for _ in range(ROUNDS):
+            del lags[:]
+            for method, url, body in ASYNC_ENDPOINTS:
+                response = await client.request(method, url, json=body)
+                assert response.status_code < 500, f"{method} {url}: {response.status_code} {response.text}"
+            round_max.append(max(lags, default=0.0))
+    finally:
+        stop.set()
+        await probe
+    return round_max
+
+
+async def _blocking_call_lag() -> float:
+    """Lag the probe sees while the loop is blocked on purpose, in ms"""
+    lags, stop = [], asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+    await asyncio.sleep(0.01)
+    time.sleep(BLOCKING_CALL_MS / 1000)
+    await asyncio.sleep(0.01)
+    stop.set()
+    await probe
+    return max(lags)
+
+
+def test_async_handlers_do_not_block_the_event_loop():
+    _seed()
+    main.app.dependency_overrides[get_current_user] = lambda: User(id=1, username="admin", role="admin")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await _drive(client)  # warm-up: imports, statement compilation, pool connections
+            lags = await _drive(client)
+        await async_engine.dispose()
+        return lags, await _blocking_call_lag()
+
+    try:
+        lags, control = asyncio.run(scenario())
+    finally:
+        main.app.dependency_overrides.clear()
+    assert control >= MAX_LAG_MS, f"probe missed a {BLOCKING_CALL_MS} ms blocking call: {control:.1f} ms"
+    lag = statistics.median(lags)
+    assert lag < MAX_LAG_MS, f"event loop blocked for {lag:.1f} ms per round (limit {MAX_LAG_MS} ms): {lags}"
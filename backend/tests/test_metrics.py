@@ -0,0 +1,27 @@
+import pytest
+
+import metrics
+
+
+def test_without_token_only_loopback_clients_are_served(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "")
+    assert metrics.check_token(None, None, "127.0.0.1")
+    assert metrics.check_token(None, None, "::1")
+    assert not metrics.check_token(None, None, "192.0.2.7")
+    assert not metrics.check_token(None, None, None)
+
+
+def test_with_token_every_client_needs_it(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "s3cret")
+    assert metrics.check_token("Bearer s3cret", None, "192.0.2.7")
+    assert metrics.check_token(None, "s3cret", "192.0.2.7")
+    assert not metrics.check_token(None, None, "127.0.0.1")
+    assert not metrics.check_token("Bearer wrong", "wrong", "127.0.0.1")
+
+
+def test_metric_without_samples_cannot_be_instantiated():
+    class Incomplete(metrics._Metric):
+        type = "gauge"
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "no _samples")
@@ -0,0 +1,25 @@
+from database import Base, engine, SessionLocal
+from routers.peers import BulkPeer, BulkPeerRequest, _validate_bulk
+
+
+def _errors(**fields) -> list:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        errors, _ = _validate_bulk(db, BulkPeerRequest(peers=[BulkPeer(extension="4711", **fields)]))
+    finally:
+        db.close()
+    return [e["error"] for e in errors]
+
+
+def test_valid_mailbox_fields_pass():
+    assert _errors(caller_id="Anna Schmidt", mailbox_pin="0815", mailbox_email="anna@example.org") == []
+
+
+def test_mailbox_fields_that_would_break_voicemail_conf_are_rejected():
+    assert _errors(mailbox_pin="12,3") == ["Ungültige Mailbox-PIN (3-10 Ziffern)"]
+    assert _errors(mailbox_pin="1234\n") == ["Ungültige Mailbox-PIN (3-10 Ziffern)"]
+    assert _errors(mailbox_email="anna@example.org\n4712 => 0000,x") == ["Ungültige Mailbox-E-Mail"]
+    assert _errors(mailbox_email="anna@example.org,bob@example.org") == ["Ungültige Mailbox-E-Mail"]
+    assert _errors(caller_id="Schmidt, Anna") == ["Caller-ID darf kein Komma und keinen Zeilenumbruch enthalten"]
+    assert _errors(caller_id="Anna\nSchmidt") == ["Caller-ID darf kein Komma und keinen Zeilenumbruch enthalten"]
@@ -0,0 +1,69 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import hep
+from sip_debug import SIPDebugBuffer
+
+
+def _invite(call_id: str, number: str) -> str:
+    return (f"INVITE sip:{number}@pbx.example.org SIP/2.0\r\n"
+            f"From: <sip:1001@pbx.example.org>;tag=a\r\n"
+            f"To: <sip:{number}@pbx.example.org>\r\n"
+            f"Call-ID: {call_id}\r\n"
+            f"CSeq: 1 INVITE\r\n\r\n")
+
+
+def _buffer(now: datetime) -> SIPDebugBuffer:
+    buffer = SIPDebugBuffer()
+    buffer.add_message(_invite("old", "0221555"), "sent", "192.0.2.1:5060", now - timedelta(minutes=60))
+    buffer.add_message(_invite("new", "0221555"), "sent", "192.0.2.1:5060", now - timedelta(minutes=10))
+    buffer.add_message(_invite("other", "0301234"), "sent", "192.0.2.1:5060", now - timedelta(minutes=5))
+    return buffer
+
+
+def test_since_with_an_offset_is_converted_to_utc():
+    now = datetime.utcnow().replace(microsecond=0)
+    buffer = _buffer(now)
+    since_utc = now - timedelta(minutes=30)
+    since_local = since_utc.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=2)))
+    assert [c["call_id"] for c in buffer.search(since=since_utc)] == ["other", "new"]
+    assert [c["call_id"] for c in buffer.search(since=since_local)] == ["other", "new"]
+
+
+def test_indexed_search_returns_candidates_newest_first():
+    buffer = _buffer(datetime.utcnow())
+    assert [c["call_id"] for c in buffer.search(number="0221555")] == ["new", "old"]
+    assert [c["call_id"] for c in buffer.search(number="0221555", limit=1)] == ["new"]
+
+
+class _Listener:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.mark.parametrize("address, written, reloaded", [
+    ("", True, True),
+    ("192.0.2.10:9060", False, True),
+    ("192.0.2.10:9060", True, False),
+])
+def test_hep_enable_fails_and_closes_the_listener_if_asterisk_is_not_configured(monkeypatch, address, written,
+                                                                                 reloaded):
+    listener = _Listener()
+
+    async def start_listener(on_packet):
+        return listener, None
+
+    monkeypatch.setattr(hep, "start_listener", start_listener)
+    monkeypatch.setattr(hep, "capture_address", lambda host: address)
+    monkeypatch.setattr(hep, "write_hep_config", lambda enabled, address="": written)
+    monkeypatch.setattr(hep, "reload_hep", lambda: reloaded)
+    buffer = SIPDebugBuffer()
+    buffer.mode = "hep"
+    with pytest.raises(RuntimeError):
+        asyncio.run(buffer.enable())
+    assert not buffer.enabled
+    assert buffer._hep_transport is None and listener.closed
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+
+from auth import get_current_user
+from database import Base, engine, async_engine, SessionLocal, User
+import main
+from routers.voicemail import VoicemailRecord
+
+START = datetime(2026, 10, 19, 8, 0)
+
+
+def _seed(mailbox: str, count: int):
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.add_all(VoicemailRecord(mailbox=mailbox, caller_id=f"Caller {i}", duration=10, is_read=False,
+                                   date=START + timedelta(hours=i), file_path=f"/nonexistent/{mailbox}/msg{i:04d}.wav",
+                                   folder="INBOX", msg_id=f"msg{i:04d}")
+                   for i in range(count))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _get(mailbox: str, *requests):
+    """Responses to GET /api/voicemail/ with each params dict, in order"""
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = [await client.get("/api/voicemail/", params={"mailbox": mailbox, **params})
+                         for params in requests]
+        await async_engine.dispose()
+        return responses
+
+    main.app.dependency_overrides[get_current_user] = lambda: User(id=1, username="admin", role="admin")
+    try:
+        return asyncio.run(scenario())
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+def test_listing_without_limit_or_cursor_returns_everything_and_pages_otherwise():
+    _seed("2001", 150)
+    everything, first = _get("2001", {}, {"limit": 100})
+    assert len(everything.json()) == 150 and "x-next-cursor" not in everything.headers
+    assert len(first.json()) == 100
+    (rest,) = _get("2001", {"cursor": first.headers["x-next-cursor"]})
+    assert len(rest.json()) == 50 and "x-next-cursor" not in rest.headers
+    assert [vm["id"] for vm in first.json() + rest.json()] == [vm["id"] for vm in everything.json()]
+
+
+def test_date_filters_with_an_offset_are_compared_in_utc():
+    _seed("2002", 3)
+    # 10:00+02:00 is 08:00 UTC, the oldest message
+    (response,) = _get("2002", {"date_to": "2026-10-19T10:00:00+02:00"})
+    assert response.status_code == 200
+    assert [vm["date"] for vm in response.json()] == [START.isoformat()]
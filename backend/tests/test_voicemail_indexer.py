@@ -0,0 +1,59 @@
+import asyncio
+import os
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from database import Base, engine, async_engine, AsyncSessionLocal
+from routers.voicemail import VoicemailCounter, VoicemailRecord, adjust_counters
+import voicemail_indexer
+
+MAILBOX = "3001"
+
+
+def _write_message(folder: str, msg_id: str, origtime: int):
+    with open(os.path.join(folder, msg_id + ".txt"), "w") as f:
+        f.write(f"[message]\ncallerid=\"Caller\" <0221555{origtime % 1000}>\norigtime={origtime}\nduration=5\n")
+    open(os.path.join(folder, msg_id + ".wav"), "wb").close()
+
+
+def _touch(folder: str):
+    """Move the folder mtime on, so the indexer sees the change however coarse the clock is"""
+    mtime = os.stat(folder).st_mtime_ns + 1_000_000_000
+    os.utime(folder, ns=(mtime, mtime))
+
+
+def test_renumbered_message_keeps_its_read_flag(tmp_path, monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    inbox = tmp_path / MAILBOX / "INBOX"
+    inbox.mkdir(parents=True)
+    _write_message(str(inbox), "msg0000", 1760860800)
+    _write_message(str(inbox), "msg0001", 1760864400)
+    changed_folders = voicemail_indexer._changed_folders
+    monkeypatch.setattr(voicemail_indexer, "_changed_folders", lambda: changed_folders(str(tmp_path)))
+
+    async def scenario():
+        await voicemail_indexer.sync_once()
+        # PATCH /mark-read on the newer message: only the row changes, not the spool
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(VoicemailRecord)
+                             .where(VoicemailRecord.mailbox == MAILBOX, VoicemailRecord.msg_id == "msg0001")
+                             .values(is_read=True))
+            await adjust_counters(db, {MAILBOX: [0, -1]})
+            await db.commit()
+        # The older message is deleted; Asterisk renumbers msg0001 to msg0000
+        for ext in (".txt", ".wav"):
+            os.replace(inbox / f"msg0001{ext}", inbox / f"msg0000{ext}")
+        _touch(str(inbox))
+        await voicemail_indexer.sync_once()
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(VoicemailRecord.msg_id, VoicemailRecord.date, VoicemailRecord.is_read)
+                                     .where(VoicemailRecord.mailbox == MAILBOX))).all()
+            counter = await db.get(VoicemailCounter, MAILBOX)
+            counts = (counter.total, counter.unread)
+        await async_engine.dispose()
+        return rows, counts
+
+    rows, counts = asyncio.run(scenario())
+    assert rows == [("msg0000", datetime.fromtimestamp(1760864400), True)]
+    assert counts == (1, 0)
@@ -0,0 +1,197 @@
+"""
+Voicemail Audio Delivery
+Voicemails are transcoded once with ffmpeg to mono MP3 (browsers cannot play
+the GSM-in-WAV that Asterisk writes as .WAV/.wav49, and PCM .wav is 3x larger).
+Results live in a size-bounded LRU disk cache (VOICEMAIL_CACHE_DIR, at most
+VOICEMAIL_CACHE_MB), keyed by source path, mtime and size. New messages are
+transcoded ahead of time (prefetch), and responses support HTTP Range requests
+so players can seek and start without downloading the whole file.
+Without ffmpeg the original file is served.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+VOICEMAIL_CACHE_DIR = os.getenv("VOICEMAIL_CACHE_DIR", "/app/uploads/voicemail-cache")
+VOICEMAIL_CACHE_BYTES = int(float(os.getenv("VOICEMAIL_CACHE_MB", "200")) * 1024 * 1024)
+TRANSCODE_CONCURRENCY = 2
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class AudioCache:
+    def __init__(self, directory: str = VOICEMAIL_CACHE_DIR, max_bytes: int = VOICEMAIL_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ffmpeg = shutil.which("ffmpeg")
+        # name -> size, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._semaphore = asyncio.Semaphore(TRANSCODE_CONCURRENCY)
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            files = [(e.stat().st_mtime, e.name, e.stat().st_size)
+                     for e in os.scandir(self.directory) if e.name.endswith(".mp3")]
+        except OSError as e:
+            logger.error(f"Voicemail audio cache disabled, cannot use {self.directory}: {e}")
+            self.ffmpeg = None
+            return
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total += size
+        self._evict()
+
+    @staticmethod
+    def key(source: str) -> str:
+        st = os.stat(source)
+        return hashlib.sha1(f"{source}:{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest() + ".mp3"
+
+    def lookup(self, source: str) -> Optional[str]:
+        """Cached MP3 for source, or None."""
+        name = self.key(source)
+        if name not in self._entries:
+            return None
+        path = os.path.join(self.directory, name)
+        self._entries.move_to_end(name)
+        try:
+            # mtime carries the LRU order across restarts
+            os.utime(path)
+        except FileNotFoundError:
+            self._total -= self._entries.pop(name)
+            return None
+        return path
+
+    async def get(self, source: str) -> Optional[str]:
+        """Cached MP3 for source, transcoding it first if needed. None if that is not possible."""
+        cached = self.lookup(source)
+        if cached:
+            self.hits += 1
+            return cached
+        if not self.ffmpeg:
+            return None
+        name = self.key(source)
+        pending = self._pending.get(name)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.ensure_future(self._transcode(source, name))
+            self._pending[name] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(name, None))
+        return await asyncio.shield(pending)
+
+    def prefetch(self, source: str):
+        """Transcode in the background (e.g. for a message that just arrived)."""
+        if not self.ffmpeg:
+            return
+        try:
+            if self.lookup(source):
+                return
+        except OSError:
+            return
+        asyncio.get_running_loop().create_task(self.get(source))
+
+    async def _transcode(self, source: str, name: str) -> Optional[str]:
+        target = os.path.join(self.directory, name)
+        tmp = target + ".tmp"
+        async with self._semaphore:
+            proc = await asyncio.create_subprocess_exec(
+                self.ffmpeg, "-nostdin", "-v", "error", "-y", "-i", source,
+                "-ac", "1", "-ar", "22050", "-c:a", "libmp3lame", "-b:a", "40k", "-f", "mp3", tmp,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await proc.communicate()
+        if proc.returncode != 0 or not os.path.exists(tmp):
+            logger.error(f"Voicemail transcoding failed for {source}: {stderr.decode(errors='replace').strip()}")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return None
+        os.replace(tmp, target)
+        size = os.path.getsize(target)
+        self._entries[name] = size
+        self._total += size
+        self._evict()
+        return target
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "ffmpeg": bool(self.ffmpeg)}
+
+
+audio_cache = AudioCache()
+
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(request: Request, path: str, media_type: str, filename: str) -> Response:
+    """FileResponse with support for a single `Range: bytes=...` request."""
+    size = os.path.getsize(path)
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "private, max-age=86400"}
+    range_header = request.headers.get("range")
+    if not range_header:
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+
+    match = _RANGE_RE.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        # Multiple or malformed ranges: send the whole file
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(0, size - int(last))
+        end = size - 1
+    if start >= size or start > end:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    length = end - start + 1
+    headers.update({
+        "Content-Range": f"bytes {start}-{end}/{size}",
+        "Content-Length": str(length),
+        "Content-Disposition": f'inline; filename="{filename}"',
+    })
+    return StreamingResponse(_iter_file(path, start, length), status_code=206, media_type=media_type, headers=headers)
+
+
+async def audio_response(request: Request, source: str, name: str) -> Response:
+    """Voicemail audio as cached MP3 (transcoding it now if it is not cached yet)."""
+    if not os.path.exists(source):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    cached = await audio_cache.get(source)
+    if cached:
+        return ranged_file_response(request, cached, "audio/mpeg", f"{name}.mp3")
+    return ranged_file_response(request, source, "audio/wav", f"{name}.wav")
@@ -68,7 +68,7 @@ VOICEMAIL_SPOOL = "/var/spool/asterisk/voicemail/default"
 DE_SOUNDS = "/usr/share/asterisk/sounds/de"
 
 
-def _ensure_mailbox_greetings(mailboxes: List[VoicemailMailbox]) -> None:
+def ensure_mailbox_greetings(mailboxes: List[VoicemailMailbox]) -> None:
     """Create generic German greetings for mailboxes that don't have custom ones.
     This prevents Asterisk from announcing the extension number."""
     try:
@@ -100,7 +100,7 @@ def write_voicemail_config(mailboxes: List[VoicemailMailbox], smtp_settings: Opt
         with open(VOICEMAIL_CONFIG_PATH, 'w') as f:
             f.write(config_content)
 
-        _ensure_mailbox_greetings(mailboxes)
+        ensure_mailbox_greetings(mailboxes)
 
         logger.info(f"Voicemail config written with {len(mailboxes)} mailboxes")
         return True
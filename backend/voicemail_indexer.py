@@ -0,0 +1,218 @@
+"""
+Voicemail Indexer
+Keeps voicemail_records in sync with the Asterisk spool in the background, so
+request handlers only read the table. Every VOICEMAIL_INDEX_INTERVAL seconds the
+mtime of each mailbox folder (INBOX, Old) is compared with the last synced one;
+only changed folders are listed and reconciled with one query per folder
+(new files are inserted, rows whose files are gone are deleted). The
+per-mailbox counters in voicemail_counters are adjusted in the same
+transaction and recounted once at startup.
+New messages are pushed to WebSocket clients as "voicemail" messages.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, select
+
+from database import AsyncSessionLocal
+from routers.voicemail import (VOICEMAIL_PATH, VoicemailRecord, adjust_counters, parse_voicemail_info,
+                               rebuild_counters, voicemail_to_dict)
+
+logger = logging.getLogger(__name__)
+
+VOICEMAIL_INDEX_INTERVAL = float(os.getenv("VOICEMAIL_INDEX_INTERVAL", "2"))
+FOLDERS = ("INBOX", "Old")
+AUDIO_EXTENSIONS = (".wav", ".WAV", ".wav49")
+
+_mtimes: Dict[str, int] = {}
+_task: Optional[asyncio.Task] = None
+_broadcast_callback = None
+_new_message_callbacks: list = []
+_stats = {"scans": 0, "folders_synced": 0, "last_sync": None, "last_error": None}
+
+
+def start(broadcast_callback=None):
+    """Start the background indexer. broadcast_callback is an async function taking a message dict."""
+    global _task, _broadcast_callback
+    _broadcast_callback = broadcast_callback
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_run())
+        logger.info(f"Voicemail indexer started (every {VOICEMAIL_INDEX_INTERVAL:g}s)")
+
+
+async def stop():
+    global _task
+    if _task:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+def on_new_message(callback):
+    """Register a function called with each newly indexed VoicemailRecord."""
+    _new_message_callbacks.append(callback)
+
+
+def status() -> dict:
+    return {**_stats, "folders_tracked": len(_mtimes)}
+
+
+async def _run():
+    try:
+        async with AsyncSessionLocal() as db:
+            await rebuild_counters(db)
+    except Exception as e:
+        logger.error(f"Voicemail counter rebuild failed: {e}", exc_info=True)
+    while True:
+        try:
+            await sync_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _stats["last_error"] = str(e)
+            logger.error(f"Voicemail index sync failed: {e}", exc_info=True)
+        await asyncio.sleep(VOICEMAIL_INDEX_INTERVAL)
+
+
+def _changed_folders(root: str = VOICEMAIL_PATH) -> List[dict]:
+    """List the folders whose mtime changed since their last sync (blocking)."""
+    changed = []
+    try:
+        mailboxes = os.listdir(root)
+    except FileNotFoundError:
+        return changed
+    for mailbox in mailboxes:
+        for folder in FOLDERS:
+            path = os.path.join(root, mailbox, folder)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if _mtimes.get(path) == mtime:
+                continue
+            messages, complete = _read_folder(path)
+            changed.append({"mailbox": mailbox, "folder": folder, "path": path, "mtime": mtime,
+                            "messages": messages, "complete": complete})
+    return changed
+
+
+def _read_folder(path: str) -> tuple[Dict[str, dict], bool]:
+    """{msg_id: message} of one folder, and False if a message was still being written."""
+    names = set(os.listdir(path))
+    messages = {}
+    complete = True
+    for name in names:
+        if not (name.startswith("msg") and name.endswith(".txt")):
+            continue
+        msg_id = name[:-4]
+        audio = next((msg_id + ext for ext in AUDIO_EXTENSIONS if msg_id + ext in names), None)
+        info = parse_voicemail_info(os.path.join(path, name)) if audio else {}
+        if not audio or "origtime" not in info:
+            complete = False
+            continue
+        file_path = os.path.join(path, audio)
+        try:
+            date = datetime.fromtimestamp(int(info["origtime"]))
+        except ValueError:
+            date = datetime.utcnow()
+        messages[msg_id] = {"file_path": file_path, "info": info, "key": (file_path, date)}
+    return messages, complete
+
+
+async def sync_once() -> int:
+    """Reconcile all changed folders with the database. Returns the number of new messages."""
+    changed = await asyncio.to_thread(_changed_folders)
+    _stats["scans"] += 1
+    if not changed:
+        return 0
+
+    new_records = []
+    removed = set()   # (mailbox, date) of deleted rows: renumbered/moved, not new
+    deltas: Dict[str, List[int]] = {}   # mailbox -> [total, unread]
+    async with AsyncSessionLocal() as db:
+        for entry in changed:
+            result = await db.execute(
+                select(VoicemailRecord.id, VoicemailRecord.msg_id, VoicemailRecord.file_path, VoicemailRecord.date)
+                .where(VoicemailRecord.mailbox == entry["mailbox"], VoicemailRecord.folder == entry["folder"])
+            )
+            on_disk = entry["messages"]
+
+            # Asterisk renumbers messages when one is deleted or moved, so a row only
+            # matches if msg_id, file and recording time all match
+            matched = set()
+            stale = []
+            for vm_id, msg_id, file_path, date in result.all():
+                if msg_id in on_disk and msg_id not in matched and on_disk[msg_id]["key"] == (file_path, date):
+                    matched.add(msg_id)
+                else:
+                    stale.append(vm_id)
+                    removed.add((entry["mailbox"], date))
+            delta = deltas.setdefault(entry["mailbox"], [0, 0])
+            was_read = {}   # date -> is_read of the deleted rows, for renumbered messages
+            if stale and entry["complete"]:
+                # Count what the DELETE removed, not the snapshot above: the API may
+                # have deleted or marked some of these rows read in the meantime
+                deleted = await db.execute(
+                    delete(VoicemailRecord).where(VoicemailRecord.id.in_(stale))
+                    .returning(VoicemailRecord.date, VoicemailRecord.is_read)
+                )
+                for date, is_read in deleted.all():
+                    was_read[date] = was_read.get(date, False) or is_read
+                    delta[0] -= 1
+                    delta[1] -= not is_read
+            for msg_id, message in on_disk.items():
+                if msg_id in matched:
+                    continue
+                info = message["info"]
+                date = message["key"][1]
+                record = VoicemailRecord(
+                    mailbox=entry["mailbox"],
+                    caller_id=info.get("callerid", "Unknown"),
+                    duration=int(info.get("duration", 0) or 0),
+                    date=date,
+                    # A message renumbered within the folder keeps its read flag
+                    # (mark-read does not move the file to Old)
+                    is_read=(entry["folder"] == "Old" or was_read.get(date, False)),
+                    file_path=message["file_path"],
+                    folder=entry["folder"],
+                    msg_id=msg_id,
+                )
+                db.add(record)
+                new_records.append(record)
+                delta[0] += 1
+                delta[1] += not record.is_read
+        await adjust_counters(db, deltas)
+        await db.commit()
+
+    for entry in changed:
+        # Folders with half-written messages are listed again on the next pass
+        if entry["complete"]:
+            _mtimes[entry["path"]] = entry["mtime"]
+    _stats["folders_synced"] += len(changed)
+    _stats["last_sync"] = datetime.utcnow().isoformat()
+    _stats["last_error"] = None
+
+    # Only INBOX arrivals are announced, not moves/renumbering. The first pass
+    # after startup indexes what is already there.
+    first_pass = _stats["scans"] == 1
+    for record in new_records:
+        if first_pass:
+            break
+        if record.folder != "INBOX" or (record.mailbox, record.date) in removed:
+            continue
+        for callback in _new_message_callbacks:
+            try:
+                callback(record)
+            except Exception as e:
+                logger.warning(f"Voicemail new-message callback failed: {e}")
+        if _broadcast_callback:
+            await _broadcast_callback({"type": "voicemail", "event": "new", "voicemail": voicemail_to_dict(record)})
+    if new_records:
+        logger.info(f"Voicemail index: {len(new_records)} new message(s) in {len(changed)} folder(s)")
+    return len(new_records)